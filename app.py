@@ -1,28 +1,359 @@
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, abort, g, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import yaml
 import subprocess
 import json
+import math
+import threading
+import time
+
+from backend.actions import ACTIONS, HEAVY_ACTIONS
+from backend.assets import StaticAssets
+from backend.batch import BatchError, dependency_graph, execution_order, run_batch
+from backend.compose import ComposeError
+from backend.containers import DETAIL_FIELDS, StatusError, query_containers
+from backend.docker_api import DockerAPIError, DockerClient
+from backend.events import format_event
+from backend.history import HistoryStore
+from backend.hosts import HostFederation, parse_hosts
+from backend.commands import SLOTS
+from backend.jobs import JobManager, JobQueueFull
+from backend.logs import LogError, parse_duration, parse_since
+from backend.metrics import CONTENT_TYPE, HTTP_IN_FLIGHT, HTTP_REQUESTS, JOBS, REGISTRY
+from backend.plan import PlanError, apply_plan, compose_plan, plan_changes
+from backend.projects import Project, ProjectError, ProjectRegistry
+from backend.registry import RegistryClient, UpdateChecker
+from backend.scheduler import Scheduler, load_schedules
+from backend.stats import StatsError
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__, static_folder='frontend/build', static_url_path='')
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
-# Serve React app
-@app.route('/')
-def serve_react():
-    return send_from_directory(app.static_folder, 'index.html')
+# The React build is read into memory once, with gzip/brotli variants, and served by serve_static
+assets = StaticAssets(os.path.join(app.root_path, 'frontend', 'build'))
+
+# Container status straight from the Docker socket; 'cli' forces docker-compose ps
+docker_client = DockerClient()
+
+# DOCKER_HOSTS federates status and services over several Docker endpoints
+docker_hosts = parse_hosts(
+    os.getenv('DOCKER_HOSTS'),
+    timeout=float(os.getenv('DOCKER_HOST_TIMEOUT', '5')),
+    failure_threshold=int(os.getenv('DOCKER_HOST_FAILURES', '3')),
+    reset_timeout=float(os.getenv('DOCKER_HOST_RESET', '30'))
+)
+federation = HostFederation(docker_hosts) if docker_hosts else None
+
+# Registry digests are looked up with HEAD requests, cached and shared by every project
+update_checker = UpdateChecker(
+    RegistryClient(timeout=float(os.getenv('REGISTRY_TIMEOUT', '10'))),
+    docker_client,
+    ttl=float(os.getenv('UPDATE_CHECK_TTL', '3600')),
+    concurrency=int(os.getenv('REGISTRY_CONCURRENCY', '4'))
+)
+
+# State transitions and the action audit log go to SQLite; an empty HISTORY_DB disables them
+HISTORY_DB = os.getenv('HISTORY_DB', 'history.db')
+history = HistoryStore(
+    HISTORY_DB,
+    flush_interval=float(os.getenv('HISTORY_FLUSH_INTERVAL', '1')),
+    retention=float(os.getenv('HISTORY_RETENTION_DAYS', '90')) * 86400
+) if HISTORY_DB else None
+
+# Lines returned when a log request has no ?tail
+LOG_DEFAULT_TAIL = 100
+
+def create_project(name, compose_path):
+    """Build the per-project caches, status snapshot, event hub, actions, logs and stats"""
+    return Project(
+        name,
+        compose_path,
+        docker_client,
+        status_mode=os.getenv('STATUS_BACKEND', 'auto'),
+        # One shared snapshot serves every dashboard; concurrent refreshes are coalesced
+        snapshot_options={
+            'ttl': float(os.getenv('STATUS_CACHE_TTL', '2')),
+            'refresh_interval': float(os.getenv('STATUS_REFRESH_INTERVAL', '1')),
+        },
+        # Log sessions keep a bounded ring buffer per container for repeat viewers
+        log_options={
+            'buffer_lines': int(os.getenv('LOG_BUFFER_LINES', '1000')),
+            'max_line': int(os.getenv('LOG_MAX_LINE_BYTES', '16384')),
+            'client_backlog': int(os.getenv('LOG_CLIENT_BACKLOG', '1000')),
+            'linger': float(os.getenv('LOG_SESSION_LINGER', '60')),
+        },
+        # One Engine API stats stream per running container, kept in downsampled ring buffers
+        stats_options={
+            'discovery_interval': float(os.getenv('STATS_DISCOVERY_INTERVAL', '10')),
+        },
+        # Pulls recreate a running service only on change, then wait this long for it to be healthy
+        action_options={
+            'health_timeout': float(os.getenv('UPDATE_HEALTH_TIMEOUT', '120')),
+        },
+        federation=federation,
+        update_checker=update_checker,
+        update_options={
+            'interval': float(os.getenv('UPDATE_SCAN_INTERVAL', '3600')),
+            'refresh_timeout': float(os.getenv('UPDATE_REFRESH_TIMEOUT', '30')),
+        },
+        # ?fields= status details are inspected once per container state change, concurrently
+        details_options={
+            'ttl': float(os.getenv('STATUS_DETAILS_TTL', '60')),
+            'concurrency': int(os.getenv('STATUS_INSPECT_CONCURRENCY', '8')),
+        },
+        # Recorded from a dedicated events subscription; without one the project is listed this often
+        history=history,
+        history_options={
+            'poll_interval': float(os.getenv('HISTORY_POLL_INTERVAL', '30')),
+        },
+        # The live stream diffs status listings this often when there is no events subscription
+        event_options={
+            'poll_interval': float(os.getenv('EVENTS_POLL_INTERVAL', '5')),
+        },
+    )
+
+# DOCKER_COMPOSE_PATH stays the default project behind the unscoped /api/... URLs;
+# COMPOSE_PROJECTS and COMPOSE_PROJECTS_DIR register more under /api/projects/<name>/...
+projects = ProjectRegistry(
+    create_project,
+    docker_client,
+    default_name=os.getenv('COMPOSE_PROJECT_NAME', 'home-server'),
+    default_path=os.getenv('DOCKER_COMPOSE_PATH'),
+    config=os.getenv('COMPOSE_PROJECTS'),
+    scan_dir=os.getenv('COMPOSE_PROJECTS_DIR'),
+    rescan_interval=float(os.getenv('COMPOSE_PROJECTS_RESCAN', '30')),
+    # History watches every project from startup, not only those somebody has opened
+    preload=history is not None
+)
+
+# Container actions run as background jobs on a bounded worker pool, taking clients in turn;
+# jobs on the same service never overlap and a full queue answers 429
+job_manager = JobManager(
+    workers=int(os.getenv('JOB_WORKERS', '4')),
+    retention=float(os.getenv('JOB_RETENTION', '3600')),
+    max_finished=int(os.getenv('JOB_HISTORY', '200')),
+    max_queued=int(os.getenv('JOB_QUEUE_LIMIT', '100')),
+    heavy_workers=int(os.getenv('JOB_HEAVY_WORKERS', '2'))
+)
+# Every docker / docker-compose process (and Engine API pull), from jobs, batches and status alike
+SLOTS.configure(
+    int(os.getenv('DOCKER_MAX_OPERATIONS', '8')),
+    int(os.getenv('DOCKER_MAX_HEAVY_OPERATIONS', '2'))
+)
+# Seconds ?wait blocks for when no explicit value is given
+JOB_WAIT_TIMEOUT = float(os.getenv('JOB_WAIT_TIMEOUT', '600'))
+# Services a batch job acts on at the same time
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+
+def invalidate_job_status(job):
+    """A finished action only invalidates the status of the service(s) it touched"""
+    try:
+        projects.get(job.project).status_snapshot.invalidate(job.service)
+    except ProjectError:
+        pass
+
+job_manager.on_finish(invalidate_job_status)
+
+def record_job_history(job):
+    """Every finished action goes to the audit log with its outcome, duration and client"""
+    if history is None:
+        return
+    duration = round(job.finished_at - job.started_at, 3) if job.started_at is not None else None
+    message = job.error or (job.result or {}).get('message')
+    history.record_action(job.project, job.service, job.action, job.status, duration, job.client, job.id,
+                          message, at=job.finished_at)
+
+job_manager.on_finish(record_job_history)
+
+def job_counts():
+    counts = {}
+    for job in job_manager.list():
+        counts[(job.status,)] = counts.get((job.status,), 0) + 1
+    return counts
+
+JOBS.set_function(job_counts)
+
+def scheduled_services(schedule):
+    """Services a schedule fires for, read from the compose file at firing time"""
+    compose = projects.get(schedule.project).compose_cache.get()
+    if schedule.profile:
+        return compose.profile_services(schedule.profile)
+    if schedule.services == 'all':
+        return compose.service_names
+    return schedule.services
+
+def start_scheduled_job(schedule, service):
+    """The same job a click on the action queues; joins it when one is already in flight"""
+    project = projects.get(schedule.project)
+    return job_manager.submit(
+        schedule.action,
+        service,
+        lambda job: project.actions.run(schedule.action, service, job.cancel_event, job.report),
+        project=project.name,
+        client=f'scheduler:{schedule.name}',
+        key=(project.name, schedule.action, service),
+        heavy=schedule.action in HEAVY_ACTIONS
+    )
+
+# Recurring pulls and restarts from SCHEDULES_FILE, spread out by jitter and capped at
+# SCHEDULER_CONCURRENCY jobs; next and last runs survive restarts in SCHEDULES_STATE
+schedules = load_schedules(os.getenv('SCHEDULES_FILE'), ACTIONS) if os.getenv('SCHEDULES_FILE') else []
+for schedule in schedules:
+    schedule.project = schedule.project or projects.default_name
+scheduler = Scheduler(
+    schedules,
+    scheduled_services,
+    start_scheduled_job,
+    state_path=os.getenv('SCHEDULES_STATE', 'schedules.json'),
+    concurrency=int(os.getenv('SCHEDULER_CONCURRENCY', '2'))
+)
+# Every worker starts it but only the one holding SCHEDULES_STATE.lock fires; without a
+# state file nothing elects a worker, so several workers would each fire every schedule
+if scheduler.state_path or int(os.getenv('SERVER_WORKERS', '1')) <= 1:
+    scheduler.start()
+
+def wake_scheduler(job):
+    """A finished scheduled job frees a slot for the next pending service right away"""
+    if (job.client or '').startswith('scheduler:'):
+        scheduler.wake()
+
+job_manager.on_finish(wake_scheduler)
+
+# Set once the server is stopping: readiness fails, new actions are refused and streams end
+draining = threading.Event()
+
+def drain(timeout=None):
+    """Stop accepting actions and wait for queued and running jobs; False if some are still running"""
+    draining.set()
+    # Services not started yet stay pending in the schedule state for the next start
+    scheduler.stop()
+    drained = job_manager.drain(timeout)
+    if history is not None:
+        # The last jobs' audit records are still queued
+        history.flush(5)
+    return drained
+
+def until_drained(stream):
+    """Pass a streaming response through, ending it at the next chunk once the server is draining"""
+    try:
+        for chunk in stream:
+            yield chunk
+            if draining.is_set():
+                return
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc()
+
+@app.before_request
+def refuse_actions_while_draining():
+    # Running jobs get to finish during shutdown, but no new ones are started
+    if draining.is_set() and request.method == 'POST':
+        return jsonify({
+            'status': 'error',
+            'message': 'Server is shutting down'
+        }), 503, {'Retry-After': '30'}
+
+@app.after_request
+def record_request_latency(response):
+    # Labelled by URL rule, not path, so service names and job IDs don't multiply series
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.observe(time.perf_counter() - g.request_started, method=request.method, route=route,
+                          status=response.status_code)
+    return response
+
+@app.teardown_request
+def end_request(error=None):
+    HTTP_IN_FLIGHT.dec()
+
+@app.errorhandler(ProjectError)
+def project_error_response(error):
+    """Unknown project in a /api/projects/<name>/... URL"""
+    return jsonify({
+        'status': 'error',
+        'message': str(error)
+    }), error.status_code
+
+@app.errorhandler(JobQueueFull)
+def queue_full_response(error):
+    """Too many queued jobs; Retry-After estimates when there will be room"""
+    return jsonify({
+        'status': 'error',
+        'message': str(error)
+    }), error.status_code, {'Retry-After': str(error.retry_after)}
+
+def client_id():
+    """Who is calling, for the audit log: an explicit X-Client-Id, else the remote address"""
+    return request.headers.get('X-Client-Id') or request.remote_addr
+
+def job_response(job, action, service_name=None):
+    """202 response for a queued job, or its result when the client asked to ?wait"""
+    wait = request.args.get('wait')
+    if wait is not None:
+        try:
+            timeout = float(wait)
+        except ValueError:
+            timeout = JOB_WAIT_TIMEOUT
+        if job_manager.wait(job, timeout):
+            if job.result is not None:
+                return jsonify(job.result), 200 if job.status == 'succeeded' else 500
+            # Raised or was cancelled before returning a result
+            return jsonify({
+                'status': 'error',
+                'action': action,
+                'job_id': job.id,
+                'message': job.error
+            }), 409 if job.status == 'cancelled' else 500
+
+    payload = {
+        'status': 'accepted',
+        'action': action,
+        'job_id': job.id,
+        'job_url': f'/api/jobs/{job.id}',
+        'project': job.project,
+    }
+    if service_name:
+        payload['service'] = service_name
+        payload['message'] = f'{action.capitalize()} job queued for service {service_name}'
+    else:
+        payload['message'] = f'{action.capitalize()} batch job queued'
+    return jsonify(payload), 202, {'Location': f'/api/jobs/{job.id}'}
+
+def compose_error_response(error):
+    """Build the JSON error response for a ComposeError"""
+    return jsonify({
+        'status': 'error',
+        'message': str(error)
+    }), error.status_code
 
+# Serve React app
+@app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_static(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
+    """Build files from memory; unknown paths get index.html for client-side routing"""
+    asset = assets.find(path)
+    if asset is None:
+        abort(404)
+    
+    encoding, body, etag = asset.select(lambda name: request.accept_encodings[name] > 0)
+    headers = {'Cache-Control': asset.cache_control, 'Vary': 'Accept-Encoding'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
     else:
-        return send_from_directory(app.static_folder, 'index.html')
+        response = Response(body, content_type=asset.content_type, headers=headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return response
 
 @app.route('/api/hello', methods=['GET'])
 def hello():
@@ -32,106 +363,156 @@ def hello():
         'status': 'success'
     })
 
-@app.route('/api/services', methods=['GET'])
-def get_services():
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 while draining or when the default compose file can't be resolved"""
+    checks = {'draining': draining.is_set()}
+    try:
+        projects.get().compose_cache.get()
+        checks['compose'] = 'ok'
+    except (ComposeError, ProjectError) as e:
+        checks['compose'] = str(e)
+    
+    ok = not checks['draining'] and checks['compose'] == 'ok'
+    return jsonify({
+        'status': 'ready' if ok else 'unavailable',
+        'checks': checks
+    }), 200 if ok else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: route latency, docker / Docker API calls, timeouts, caches, in-flight work"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/api/projects', methods=['GET'])
+def list_projects():
+    """List managed projects with container counts from one Docker query for all of them"""
+    try:
+        overview = projects.overview()
+    except DockerAPIError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to list containers: {str(e)}'
+        }), 500
+    
+    return jsonify({
+        'status': 'success',
+        'projects': overview,
+        'total': len(overview)
+    })
+
+@app.route('/api/services', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/services', methods=['GET'])
+def get_services(project_name):
     """Get all services from the docker-compose file"""
+    project = projects.get(project_name)
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
-        
-        if not compose_path:
-            return jsonify({
-                'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
-        
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
-            return jsonify({
-                'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
+        # Resolve the compose file through the shared, change-invalidated cache
+        try:
+            compose = project.compose_cache.get()
+        except ComposeError as e:
+            return compose_error_response(e)
         
-        # Read and parse the docker-compose file
-        with open(compose_path, 'r') as file:
-            compose_data = yaml.safe_load(file)
-        
-        # Extract service names
-        services = list(compose_data.get('services', {}).keys())
-        
-        return jsonify({
+        # Services compose would actually run (includes, extends and profiles resolved)
+        services = compose.service_names
+        payload = {
             'status': 'success',
             'services': services,
             'total': len(services),
-            'compose_file': compose_path
-        })
+            'compose_file': project.compose_path,
+            'project': project.name
+        }
+        
+        # Every Docker host is asked concurrently; services only found running elsewhere are added
+        if federation is not None:
+            host_services, payload['hosts'] = federation.services(project.name)
+            extra = sorted({s for found in host_services.values() for s in found} - set(services))
+            payload['services'] = services + extra
+            payload['total'] = len(payload['services'])
+        
+        return jsonify(payload)
         
-    except yaml.YAMLError as e:
-        return jsonify({
-            'status': 'error',
-            'message': f'Error parsing docker-compose file: {str(e)}'
-        }), 500
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
-@app.route('/api/containers/status', methods=['GET'])
-def get_containers():
-    """Get all running containers from docker-compose ps"""
+@app.route('/api/containers/status', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/containers/status', methods=['GET'])
+def get_containers(project_name):
+    """Container status from the shared snapshot, with optional details, filters, sorting and paging
+
+    ?fields=Name,Health,RestartCount (or all) adds inspect details; ?state= and
+    ?health= filter (comma-separated), ?sort=-StartedAt orders, ?offset= and
+    ?limit= page. Without them the response is the plain docker-compose ps shape.
+    """
+    project = projects.get(project_name)
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
+        # Resolve the compose file through the shared, change-invalidated cache
+        try:
+            project.compose_cache.get()
+        except ComposeError as e:
+            return compose_error_response(e)
         
-        if not compose_path:
+        # Served from the shared snapshot; refreshed via the Engine API or docker-compose ps
+        try:
+            containers, snapshot_age = project.status_snapshot.get()
+        except StatusError as e:
             return jsonify({
                 'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
+                'message': str(e),
+                'error': e.error
+            }), 500
         
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
+        fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()]
+        if fields == ['all']:
+            fields = ['Name', 'Service', 'State', 'Status', 'Ports', *DETAIL_FIELDS]
+        states = {state.strip().lower() for state in request.args.get('state', '').split(',') if state.strip()}
+        healths = {health.strip().lower() for health in request.args.get('health', '').split(',') if health.strip()}
+        sort = request.args.get('sort', 'Name')
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = int(request.args['limit']) if request.args.get('limit') else None
+            if limit is not None and limit < 0:
+                raise ValueError(limit)
+        except ValueError:
             return jsonify({
                 'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
+                'message': 'offset and limit must be numbers and limit not negative'
+            }), 400
         
-        # Run docker-compose ps -a --format json with explicit project name
-        result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'ps', '-a', '--format', 'json'],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
+        # Inspect details are only gathered when something asks for them
+        if healths or sort.lstrip('-') in DETAIL_FIELDS or any(field in DETAIL_FIELDS for field in fields):
+            try:
+                details = project.container_details()
+            except DockerAPIError as e:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'Container details need the Docker Engine API: {str(e)}'
+                }), 502
+            empty = dict.fromkeys(DETAIL_FIELDS)
+            containers = [{**c, **details.get((c.get('Host'), c['Name']), empty)} for c in containers]
         
-        if result.returncode == 0:
-            containers = []
-            if result.stdout.strip():
-                # Parse JSON output (one JSON object per line)
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        container_data = json.loads(line)
-                        containers.append({
-                            'Name': container_data.get('Name', ''),
-                            'Service': container_data.get('Service', ''),
-                            'State': container_data.get('State', ''),
-                            'Status': container_data.get('Status', ''),
-                            'Ports': container_data.get('Publishers', [])
-                        })
-            
-            return jsonify({
-                'status': 'success',
-                'containers': containers,
-                'total': len(containers),
-                'compose_file': compose_path
-            })
-        else:
+        try:
+            containers, total = query_containers(containers, fields, states, healths, sort, offset, limit)
+        except ValueError as e:
             return jsonify({
                 'status': 'error',
-                'message': 'Failed to get container status',
-                'error': result.stderr
-            }), 500
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'status': 'success',
+            'containers': containers,
+            'total': total,
+            **({'offset': offset, 'limit': limit} if offset or limit is not None else {}),
+            'compose_file': project.compose_path,
+            'project': project.name,
+            'snapshot_age': round(snapshot_age, 3),
+            # Per-host outcome of the last refresh when DOCKER_HOSTS is set
+            **({'hosts': project.host_reports} if federation is not None else {})
+        })
             
     except subprocess.TimeoutExpired:
         return jsonify({
@@ -149,274 +530,269 @@ def get_containers():
             'message': str(e)
         }), 500
 
-@app.route('/api/containers/start/<service_name>', methods=['POST'])
-def start_container(service_name):
-    """Start a specific service using docker-compose"""
+@app.route('/api/dashboard', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/dashboard', methods=['GET'])
+def get_dashboard(project_name):
+    """Services joined with their containers in one response, with ETag and ?since=<version> deltas"""
+    project = projects.get(project_name)
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
+        try:
+            compose = project.compose_cache.get()
+        except ComposeError as e:
+            return compose_error_response(e)
         
-        if not compose_path:
+        try:
+            containers, _ = project.status_snapshot.get()
+        except StatusError as e:
             return jsonify({
                 'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
-        
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
-            return jsonify({
-                'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
+                'message': str(e),
+                'error': e.error
+            }), 500
         
-        # Run docker-compose start for specific service (only works on stopped containers)
-        result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'start', service_name],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+        view = project.dashboard.update(compose.service_names, containers, request.args.get('since'))
         
-        if result.returncode == 0:
-            return jsonify({
+        # The version token is the strong validator: unchanged polls get an empty 304
+        if request.if_none_match.contains(view['version']):
+            response = Response(status=304)
+        else:
+            response = jsonify({
                 'status': 'success',
-                'service': service_name,
-                'message': f'Service {service_name} started successfully'
+                'project': project.name,
+                'compose_file': project.compose_path,
+                **view,
+                'total': len(view['order'])
             })
-        else:
-            return jsonify({
-                'status': 'error',
-                'service': service_name,
-                'message': 'Failed to start service',
-                'error': result.stderr
-            }), 500
-            
-    except subprocess.TimeoutExpired:
-        return jsonify({
-            'status': 'error',
-            'service': service_name,
-            'message': 'Start command timed out'
-        }), 500
+        response.set_etag(view['version'])
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+        
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'service': service_name,
             'message': str(e)
         }), 500
 
-@app.route('/api/containers/stop/<service_name>', methods=['POST'])
-def stop_container(service_name):
-    """Stop a specific service using docker-compose"""
+@app.route('/api/containers/stream', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/containers/stream', methods=['GET'])
+def stream_containers(project_name):
+    """Stream container status changes as Server-Sent Events"""
+    project = projects.get(project_name)
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
-        
-        if not compose_path:
-            return jsonify({
-                'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
-        
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
-            return jsonify({
-                'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
-        
-        # Run docker-compose stop for specific service
-        result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'stop', service_name],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        if result.returncode == 0:
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'message': f'Service {service_name} stopped successfully'
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'service': service_name,
-                'message': 'Failed to stop service',
-                'error': result.stderr
-            }), 500
-            
-    except subprocess.TimeoutExpired:
+        project.compose_cache.get()
+    except ComposeError as e:
+        return compose_error_response(e)
+    
+    # EventSource sends Last-Event-ID on reconnect so only missed deltas are replayed
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(
+        until_drained(project.event_hub.stream(last_event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def flag(name):
+    """Boolean query parameter (1/true/yes)"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+@app.route('/api/containers/logs/<service_name>', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/containers/logs/<service_name>', methods=['GET'])
+def container_logs(service_name, project_name):
+    """Stream a service's container logs (?tail=N|all, ?since=, ?timestamps=1, ?follow=1)"""
+    project = projects.get(project_name)
+    try:
+        tail = request.args.get('tail', str(LOG_DEFAULT_TAIL))
+        tail = None if tail == 'all' else max(0, int(tail))
+        since = parse_since(request.args.get('since'))
+    except ValueError:
         return jsonify({
             'status': 'error',
-            'service': service_name,
-            'message': 'Stop command timed out'
-        }), 500
-    except Exception as e:
+            'message': 'tail must be a number or "all"'
+        }), 400
+    except LogError as e:
         return jsonify({
             'status': 'error',
-            'service': service_name,
             'message': str(e)
-        }), 500
-
-@app.route('/api/containers/restart/<service_name>', methods=['POST'])
-def restart_container(service_name):
-    """Restart a specific service using docker-compose"""
+        }), e.status_code
+    
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
-        
-        if not compose_path:
-            return jsonify({
-                'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
-        
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
-            return jsonify({
-                'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
-        
-        # Run docker-compose restart for specific service
-        result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'restart', service_name],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        if result.returncode == 0:
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'message': f'Service {service_name} restarted successfully'
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'service': service_name,
-                'message': 'Failed to restart service',
-                'error': result.stderr
-            }), 500
-            
-    except subprocess.TimeoutExpired:
+        chunks = project.logs.stream(service_name, tail, since, flag('timestamps'), flag('follow'))
+    except LogError as e:
         return jsonify({
             'status': 'error',
             'service': service_name,
-            'message': 'Restart command timed out'
-        }), 500
-    except Exception as e:
+            'message': str(e)
+        }), e.status_code
+    except DockerAPIError as e:
         return jsonify({
             'status': 'error',
             'service': service_name,
-            'message': str(e)
+            'message': f'Failed to read logs: {str(e)}'
         }), 500
+    
+    # Chunked plain text, written as the lines arrive
+    return Response(
+        until_drained(chunks),
+        mimetype='text/plain',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-@app.route('/api/containers/up/<service_name>', methods=['POST'])
-def up_container(service_name):
-    """Create and start a specific service using docker-compose up -d"""
+def seconds_arg(name, default=None):
+    """Query parameter in seconds, given as a number or a duration like 5m; ValueError unless positive and finite"""
+    value = request.args.get(name)
+    if not value:
+        return default
+    seconds = parse_duration(value)
+    seconds = float(value) if seconds is None else seconds
+    # float() accepts nan and inf, which would end up as invalid JSON in the response
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(value)
+    return seconds
+
+@app.route('/api/containers/stats', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/containers/stats', methods=['GET'])
+def container_stats(project_name):
+    """CPU, memory, network and block I/O history per service (?window=, ?resolution=, ?service=)"""
+    project = projects.get(project_name)
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
-        
-        if not compose_path:
-            return jsonify({
-                'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
-        
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
-            return jsonify({
-                'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
-        
-        # Run docker-compose up -d for specific service
-        result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'up', '-d', service_name],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        if result.returncode == 0:
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'message': f'Service {service_name} is up and running'
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'service': service_name,
-                'message': 'Failed to bring service up',
-                'error': result.stderr
-            }), 500
-            
-    except subprocess.TimeoutExpired:
+        window = seconds_arg('window', 300)
+        resolution = seconds_arg('resolution')
+    except ValueError:
         return jsonify({
             'status': 'error',
-            'service': service_name,
-            'message': 'Up command timed out'
-        }), 500
-    except Exception as e:
+            'message': 'window and resolution must be seconds or durations like 5m'
+        }), 400
+    
+    try:
+        stats = project.stats.query(window, int(resolution) if resolution else None, request.args.get('service'))
+    except StatsError as e:
         return jsonify({
             'status': 'error',
-            'service': service_name,
             'message': str(e)
-        }), 500
+        }), 400
+    
+    return jsonify({'status': 'success', 'project': project.name, **stats})
 
-@app.route('/api/containers/down/<service_name>', methods=['POST'])
-def down_container(service_name):
-    """Stop and remove a specific service using docker-compose down"""
+@app.route('/api/updates', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/updates', methods=['GET'])
+def image_updates(project_name):
+    """Services whose image has a newer digest in its registry, found without pulling"""
+    project = projects.get(project_name)
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
-        
-        if not compose_path:
-            return jsonify({
-                'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
-        
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
-            return jsonify({
-                'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
+        results, scanned_at, scanning = project.updates.report(refresh=flag('refresh'))
+    except ComposeError as e:
+        return compose_error_response(e)
+    
+    if results is None:
+        # The first scan is still running in the background
+        return jsonify({
+            'status': 'scanning',
+            'project': project.name,
+            'scanned_at': None,
+            'updates': [],
+            'total': 0
+        }), 202
+    
+    outdated = [result for result in results if result['status'] == 'outdated']
+    return jsonify({
+        'status': 'success',
+        'project': project.name,
+        'scanned_at': scanned_at,
+        'scanning': scanning,
+        'updates': outdated,
+        'total': len(outdated),
+        # ?all=true also lists up-to-date, unpulled, pinned and failed checks
+        **({'services': results} if flag('all') else {})
+    })
+
+def history_disabled_response():
+    return jsonify({
+        'status': 'error',
+        'message': 'History is disabled (HISTORY_DB is empty)'
+    }), 503
+
+@app.route('/api/history/uptime', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/history/uptime', methods=['GET'])
+def service_uptime(project_name):
+    """Uptime percentage and restart count per service over ?window= (default 7d), from recorded transitions"""
+    project = projects.get(project_name)
+    if history is None:
+        return history_disabled_response()
+    try:
+        window = seconds_arg('window', 7 * 86400)
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'window must be seconds or a duration like 24h'
+        }), 400
+
+    now = time.time()
+    services = history.uptime(project.name, now - window, request.args.get('service'), now)
+    return jsonify({
+        'status': 'success',
+        'project': project.name,
+        'window': window,
+        'services': services
+    })
+
+@app.route('/api/history/actions', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/history/actions', methods=['GET'])
+def action_log(project_name):
+    """Recent actions, newest first (?service=, ?since= as a duration, ?limit= up to 1000)"""
+    project = projects.get(project_name)
+    if history is None:
+        return history_disabled_response()
+    try:
+        since = seconds_arg('since')
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        # SQLite reads a negative LIMIT as no limit at all
+        if limit < 1:
+            raise ValueError(limit)
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': 'since must be seconds or a duration like 1h and limit a positive number'
+        }), 400
+
+    actions = history.actions(project.name, request.args.get('service'),
+                              time.time() - since if since else None, limit)
+    return jsonify({
+        'status': 'success',
+        'project': project.name,
+        'actions': actions,
+        'total': len(actions)
+    })
+
+@app.route('/api/containers/<any(start, stop, restart, up, down, pull):action>/<service_name>',
+           methods=['POST'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/containers/<any(start, stop, restart, up, down, pull):action>/<service_name>',
+           methods=['POST'])
+def container_action(action, service_name, project_name):
+    """Queue a start/stop/restart/up/down/pull job for a service"""
+    project = projects.get(project_name)
+    try:
+        # Resolve the compose file through the shared, change-invalidated cache
+        try:
+            project.compose_cache.get()
+        except ComposeError as e:
+            return compose_error_response(e)
         
-        # Run docker-compose rm -s -f for specific service (stop and remove)
-        result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'rm', '-s', '-f', service_name],
-            capture_output=True,
-            text=True,
-            timeout=60
+        job = job_manager.submit(
+            action,
+            service_name,
+            lambda job: project.actions.run(action, service_name, job.cancel_event, job.report),
+            project=project.name,
+            client=client_id(),
+            # A second click on the same action joins the job already queued or running
+            key=(project.name, action, service_name),
+            heavy=action in HEAVY_ACTIONS
         )
         
-        if result.returncode == 0:
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'message': f'Service {service_name} stopped and removed'
-            })
-        else:
-            return jsonify({
-                'status': 'error',
-                'service': service_name,
-                'message': 'Failed to remove service',
-                'error': result.stderr
-            }), 500
-            
-    except subprocess.TimeoutExpired:
-        return jsonify({
-            'status': 'error',
-            'service': service_name,
-            'message': 'Down command timed out'
-        }), 500
+        # ?wait=<seconds> keeps the old synchronous behaviour for scripts
+        return job_response(job, action, service_name)
+        
+    except JobQueueFull as e:
+        return queue_full_response(e)
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -424,165 +800,287 @@ def down_container(service_name):
             'message': str(e)
         }), 500
 
-@app.route('/api/containers/pull/<service_name>', methods=['POST'])
-def pull_container(service_name):
-    """Pull the latest image for a service and restart it if it was running"""
+def body_concurrency(body):
+    """A request's "concurrency", capped at BATCH_CONCURRENCY; None when it isn't a positive number"""
+    value = body.get('concurrency')
+    if value is None:
+        return BATCH_CONCURRENCY
     try:
-        # Get docker-compose file path from environment variable
-        compose_path = os.getenv('DOCKER_COMPOSE_PATH')
+        concurrency = int(value)
+    except (TypeError, ValueError):
+        return None
+    return min(concurrency, BATCH_CONCURRENCY) if concurrency > 0 else None
+
+def concurrency_error_response():
+    return jsonify({
+        'status': 'error',
+        'message': '"concurrency" must be a positive number'
+    }), 400
+
+@app.route('/api/containers/batch', methods=['POST'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/containers/batch', methods=['POST'])
+def batch_action(project_name):
+    """Queue one action for many services, run in depends_on order with a concurrency cap"""
+    project = projects.get(project_name)
+    try:
+        try:
+            compose = project.compose_cache.get()
+        except ComposeError as e:
+            return compose_error_response(e)
         
-        if not compose_path:
+        body = request.get_json(silent=True) or {}
+        action = body.get('action')
+        if action not in ACTIONS:
             return jsonify({
                 'status': 'error',
-                'message': 'DOCKER_COMPOSE_PATH environment variable not found'
-            }), 404
+                'message': f'Unknown action: {action}. Expected one of: {", ".join(ACTIONS)}'
+            }), 400
         
-        # Check if docker-compose file exists
-        if not os.path.exists(compose_path):
+        # services: a list of names or "all"; profile: every service in that profile
+        services = body.get('services')
+        if body.get('profile'):
+            services = compose.profile_services(body['profile'])
+        elif services == 'all':
+            services = compose.service_names
+        if not services or not isinstance(services, list):
             return jsonify({
                 'status': 'error',
-                'message': f'Docker compose file not found at: {compose_path}'
-            }), 404
-        
-        # Step 1: Check the current state of the container
-        status_result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'ps', '-a', '--format', 'json', service_name],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        was_running = False
-        container_exists = False
+                'message': 'Provide "services" (a list or "all") or a "profile"'
+            }), 400
         
-        if status_result.returncode == 0 and status_result.stdout.strip():
-            for line in status_result.stdout.strip().split('\n'):
-                if line:
-                    container_data = json.loads(line)
-                    if container_data.get('Service') == service_name:
-                        container_exists = True
-                        was_running = container_data.get('State', '').lower() == 'running'
-                        break
-        
-        # Step 2: Pull the latest image
-        pull_result = subprocess.run(
-            ['docker-compose', '-p', 'home-server', '-f', compose_path, 'pull', service_name],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minutes for pulling images
-        )
+        unknown = [service for service in services if service not in compose.all_services]
+        if unknown:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unknown services: {", ".join(unknown)}'
+            }), 400
         
-        if pull_result.returncode != 0:
+        graph = dependency_graph(compose, services)
+        try:
+            # Reject dependency cycles before queueing anything
+            execution_order(graph)
+        except BatchError as e:
             return jsonify({
                 'status': 'error',
-                'service': service_name,
-                'message': 'Failed to pull latest image',
-                'error': pull_result.stderr
-            }), 500
+                'message': str(e)
+            }), 400
         
-        # Check if image was actually updated
-        pull_output = pull_result.stdout + pull_result.stderr
-        image_updated = 'Pulled' in pull_output or 'Downloaded newer image' in pull_output or 'Digest:' in pull_output
+        concurrency = body_concurrency(body)
+        if concurrency is None:
+            return concurrency_error_response()
         
-        # Step 3: Handle container based on its previous state
-        if was_running:
-            # Container was running, so stop it, remove it, and bring it up with new image
-            # Stop and remove the container
-            down_result = subprocess.run(
-                ['docker-compose', '-p', 'home-server', '-f', compose_path, 'rm', '-s', '-f', service_name],
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-            
-            if down_result.returncode != 0:
-                return jsonify({
-                    'status': 'error',
-                    'service': service_name,
-                    'message': 'Image pulled but failed to stop old container',
-                    'error': down_result.stderr
-                }), 500
-            
-            # Bring up the service with new image
-            up_result = subprocess.run(
-                ['docker-compose', '-p', 'home-server', '-f', compose_path, 'up', '-d', service_name],
-                capture_output=True,
-                text=True,
-                timeout=60
+        def run(job):
+            return run_batch(
+                action,
+                graph,
+                lambda service: project.actions.run(action, service, job.cancel_event),
+                concurrency=concurrency,
+                cancel_event=job.cancel_event
             )
-            
-            if up_result.returncode != 0:
-                return jsonify({
-                    'status': 'error',
-                    'service': service_name,
-                    'message': 'Image pulled and old container removed, but failed to start new container',
-                    'error': up_result.stderr
-                }), 500
-            
-            update_msg = 'updated to latest image' if image_updated else 'already on latest image'
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'image_updated': image_updated,
-                'message': f'Service {service_name} {update_msg} and restarted',
-                'was_running': True
-            })
         
-        elif container_exists:
-            # Container exists but was stopped, just remove it
-            down_result = subprocess.run(
-                ['docker-compose', '-p', 'home-server', '-f', compose_path, 'rm', '-f', service_name],
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-            
-            if down_result.returncode != 0:
-                return jsonify({
-                    'status': 'error',
-                    'service': service_name,
-                    'message': 'Failed to remove old container',
-                    'error': down_result.stderr
-                }), 500
-            
-            update_status = '(new version available)' if image_updated else '(already up to date)'
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'image_updated': image_updated,
-                'message': f'Latest image pulled for {service_name} {update_status}. Old container removed. Use "Bring Up" to start with new image.',
-                'was_running': False
-            })
+        job = job_manager.submit(action, None, run, project=project.name, client=client_id(), locks=list(graph),
+                                 heavy=action in HEAVY_ACTIONS)
+        return job_response(job, action)
         
-        else:
-            # Container didn't exist, just pulled the image
-            update_status = '(new version available)' if image_updated else '(already up to date)'
-            return jsonify({
-                'status': 'success',
-                'service': service_name,
-                'image_updated': image_updated,
-                'message': f'Latest image pulled for {service_name} {update_status}. Use "Bring Up" to start the container.',
-                'was_running': False
-            })
-            
-    except subprocess.TimeoutExpired:
+    except JobQueueFull as e:
+        return queue_full_response(e)
+    except Exception as e:
         return jsonify({
             'status': 'error',
-            'service': service_name,
-            'message': 'Pull command timed out (image might be large)'
+            'message': str(e)
         }), 500
-    except json.JSONDecodeError as e:
+
+def current_plan(project, services=None):
+    """The project's plan from one bulk container listing, optionally limited to some services"""
+    compose = project.compose_cache.get()
+    plan = compose_plan(compose, project.config_hashes.get(), docker_client.list_containers(project.name))
+    if services is not None:
+        plan = {key: [entry for entry in entries if (entry if key == 'unchanged' else entry['service']) in services]
+                for key, entries in plan.items()}
+    return compose, plan
+
+@app.route('/api/plan', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/plan', methods=['GET'])
+def get_plan(project_name):
+    """Services whose containers don't match the compose file: to create, recreate or remove"""
+    project = projects.get(project_name)
+    try:
+        _, plan = current_plan(project)
+    except ComposeError as e:
+        return compose_error_response(e)
+    except PlanError as e:
         return jsonify({
             'status': 'error',
-            'service': service_name,
-            'message': f'Error parsing container status: {str(e)}'
+            'message': str(e)
+        }), e.status_code
+    except DockerAPIError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to list containers: {str(e)}'
         }), 500
-    except Exception as e:
+    
+    return jsonify({
+        'status': 'success',
+        'project': project.name,
+        'plan': plan,
+        'changes': plan_changes(plan)
+    })
+
+@app.route('/api/apply', methods=['POST'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/apply', methods=['POST'])
+def apply_changes(project_name):
+    """Queue a job converging only the services in the plan, in parallel"""
+    project = projects.get(project_name)
+    body = request.get_json(silent=True) or {}
+    # services: limit the apply to some services; remove_orphans: false keeps orphaned containers
+    services = body.get('services')
+    if services is not None and not isinstance(services, list):
+        return jsonify({
+            'status': 'error',
+            'message': '"services" must be a list of service names'
+        }), 400
+    remove_orphans = body.get('remove_orphans', True) is not False
+    concurrency = body_concurrency(body)
+    if concurrency is None:
+        return concurrency_error_response()
+    
+    try:
+        _, plan = current_plan(project, services)
+    except ComposeError as e:
+        return compose_error_response(e)
+    except PlanError as e:
         return jsonify({
             'status': 'error',
-            'service': service_name,
             'message': str(e)
+        }), e.status_code
+    except DockerAPIError as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'Failed to list containers: {str(e)}'
         }), 500
+    
+    if not remove_orphans:
+        plan['remove'] = []
+    if not plan_changes(plan):
+        return jsonify({
+            'status': 'success',
+            'project': project.name,
+            'message': 'Nothing to apply, every service matches the compose file',
+            'changes': 0
+        })
+    
+    def run(job):
+        # Planned again when the job starts, so changes made while it was queued count
+        compose, fresh = current_plan(project, services)
+        result = apply_plan(project.name, compose, fresh, docker_client, concurrency=concurrency,
+                            cancel_event=job.cancel_event, remove_orphans=remove_orphans)
+        result['plan'] = fresh
+        return result
+    
+    # Locks the planned services; `up` may pull missing images, so apply counts as heavy
+    planned = {entry['service'] for key in ('create', 'recreate', 'remove') for entry in plan[key]}
+    job = job_manager.submit('apply', None, run, project=project.name, client=client_id(), locks=sorted(planned),
+                             heavy=True)
+    return job_response(job, 'apply')
+
+def find_job(job_id, project_name):
+    """A job by ID; scoped URLs only see the jobs of their project"""
+    job = job_manager.get(job_id)
+    if job is not None and project_name and job.project != projects.get(project_name).name:
+        return None
+    return job
+
+@app.route('/api/schedules', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/schedules', methods=['GET'])
+def list_schedules(project_name):
+    """Scheduled actions with their next run, the run in progress and the last run"""
+    project = projects.get(project_name).name if project_name else None
+    results = scheduler.report(project)
+    return jsonify({
+        'status': 'success',
+        'schedules': results,
+        'total': len(results)
+    })
+
+@app.route('/api/jobs', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/jobs', methods=['GET'])
+def list_jobs(project_name):
+    """List queued, running and recently finished jobs"""
+    project = projects.get(project_name).name if project_name else None
+    jobs = job_manager.list(request.args.get('status'), project)
+    return jsonify({
+        'status': 'success',
+        'jobs': [job.to_dict() for job in jobs],
+        'total': len(jobs)
+    })
+
+@app.route('/api/jobs/<job_id>', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/jobs/<job_id>', methods=['GET'])
+def get_job(job_id, project_name):
+    """Get the status and, once finished, the result of a job"""
+    job = find_job(job_id, project_name)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Job {job_id} not found'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'job': job.to_dict()
+    })
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id, project_name):
+    """Stream a job's progress (e.g. image pull layers) and final result as Server-Sent Events"""
+    job = find_job(job_id, project_name)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Job {job_id} not found'
+        }), 404
+    
+    def generate():
+        version = -1
+        while True:
+            current = job.wait_for_change(version, timeout=15)
+            if job.finished:
+                yield format_event('result', current, job.to_dict())
+                return
+            if current == version or job.progress is None:
+                yield ': keepalive\n\n'
+            else:
+                yield format_event('progress', current, job.progress)
+            version = current
+    
+    return Response(
+        until_drained(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'], defaults={'project_name': None})
+@app.route('/api/projects/<project_name>/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id, project_name):
+    """Cancel a queued job or kill the command of a running one"""
+    job = find_job(job_id, project_name) and job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({
+            'status': 'error',
+            'message': f'Job {job_id} not found'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'job': job.to_dict()
+    })
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Development server; production runs under gunicorn (see gunicorn.conf.py).
+    # The debugger and reloader are only enabled with FLASK_DEBUG=1.
+    app.run(
+        debug=os.getenv('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes'),
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '5000'))
+    )
@@ -0,0 +1 @@
+"""Support modules for the home-server-manager Flask API"""
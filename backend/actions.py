@@ -0,0 +1,364 @@
+"""Container actions (start, stop, restart, up, down, pull) run through docker-compose"""
+import json
+import subprocess
+import time
+from urllib.parse import quote
+
+from .commands import CommandCancelled, compose_command, run_command
+from .common import CONFIG_HASH_LABEL
+from .containers import StatusError
+from .docker_api import DockerAPIError, DockerUnavailable
+from .images import ImageReference, image_id, pull_image
+
+# action -> (compose arguments, success message, failure message, timeout message)
+SIMPLE_ACTIONS = {
+    # start only works on stopped containers that already exist
+    'start': (['start'], 'Service {service} started successfully', 'Failed to start service',
+              'Start command timed out'),
+    'stop': (['stop'], 'Service {service} stopped successfully', 'Failed to stop service',
+             'Stop command timed out'),
+    'restart': (['restart'], 'Service {service} restarted successfully', 'Failed to restart service',
+                'Restart command timed out'),
+    'up': (['up', '-d'], 'Service {service} is up and running', 'Failed to bring service up',
+           'Up command timed out'),
+    # rm -s -f stops and removes the service's containers
+    'down': (['rm', '-s', '-f'], 'Service {service} stopped and removed', 'Failed to remove service',
+             'Down command timed out'),
+}
+
+ACTIONS = tuple(SIMPLE_ACTIONS) + ('pull',)
+# Actions that download images; the job manager runs only a few of them at once
+HEAVY_ACTIONS = ('pull',)
+
+# Seconds a recreated container gets to report healthy (or, without a healthcheck, to keep running)
+HEALTH_TIMEOUT = 120
+
+
+class ComposeActions:
+    """Runs container actions for one compose project
+
+    Every action returns the JSON payload the API responds with; 'status' is
+    'success' or 'error'. cancel_event, when set, kills the running command;
+    report(progress) receives pull progress.
+    """
+
+    def __init__(self, project, compose_cache, status_backend, docker_client, config_hashes=None,
+                 health_timeout=HEALTH_TIMEOUT):
+        self.project = project
+        self.compose_cache = compose_cache
+        self.status_backend = status_backend
+        self.docker_client = docker_client
+        self.config_hashes = config_hashes
+        self.health_timeout = health_timeout
+
+    def run(self, action, service_name, cancel_event=None, report=None):
+        compose_path = self.compose_cache.get().path
+        if action == 'pull':
+            return self.pull(compose_path, service_name, cancel_event, report)
+        return self.simple(action, compose_path, service_name, cancel_event)
+
+    def _compose(self, compose_path, *args):
+        return compose_command(self.project, compose_path, *args)
+
+    def simple(self, action, compose_path, service_name, cancel_event=None):
+        """Run one single-step docker-compose action for a service"""
+        args, success, failure, timed_out = SIMPLE_ACTIONS[action]
+        try:
+            result = run_command(self._compose(compose_path, *args, service_name), timeout=60,
+                                 cancel_event=cancel_event)
+
+            if result.returncode == 0:
+                return {
+                    'status': 'success',
+                    'service': service_name,
+                    'message': success.format(service=service_name)
+                }
+            return {
+                'status': 'error',
+                'service': service_name,
+                'message': failure,
+                'error': result.stderr
+            }
+
+        except subprocess.TimeoutExpired:
+            return {
+                'status': 'error',
+                'service': service_name,
+                'message': timed_out
+            }
+
+    def pull(self, compose_path, service_name, cancel_event=None, report=None):
+        """Pull the latest image for a service and restart it if it was running"""
+        try:
+            # Step 1: Check the current state of the container
+            try:
+                service_containers = self.status_backend.list(compose_path, service_name)
+            except StatusError:
+                service_containers = []
+
+            was_running = False
+            container_exists = False
+
+            for container_data in service_containers:
+                if container_data.get('Service') == service_name:
+                    container_exists = True
+                    was_running = container_data.get('State', '').lower() == 'running'
+                    break
+
+            # Step 2: Pull the latest image, streaming progress from the Engine API when possible
+            image = (self.compose_cache.get().services.get(service_name) or {}).get('image')
+            image_before = image_id(self.docker_client, image) if image else None
+            try:
+                if not image:
+                    raise DockerAPIError(f'Service {service_name} has no image to pull directly')
+                pull_image(self.docker_client, image, report=report, cancel_event=cancel_event)
+                pull_output = None
+            except DockerAPIError as e:
+                # Only a build-only service or an unusable socket goes to the CLI. Registry errors and
+                # timeouts come from a pull that already ran, and retrying it in full would only repeat them
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CommandCancelled(f'pull {service_name}')
+                if image and not isinstance(e, DockerUnavailable):
+                    return {
+                        'status': 'error',
+                        'service': service_name,
+                        'message': 'Failed to pull latest image',
+                        'error': str(e)
+                    }
+                pull_result = run_command(
+                    self._compose(compose_path, 'pull', service_name),
+                    timeout=300,  # 5 minutes for pulling images
+                    cancel_event=cancel_event
+                )
+
+                if pull_result.returncode != 0:
+                    return {
+                        'status': 'error',
+                        'service': service_name,
+                        'message': 'Failed to pull latest image',
+                        'error': pull_result.stderr
+                    }
+                pull_output = pull_result.stdout + pull_result.stderr
+
+            # The image was updated if its local ID changed
+            image_after = image_id(self.docker_client, image) if image else None
+            if image_after is not None:
+                image_updated = image_after != image_before
+            else:
+                pull_output = pull_output or ''
+                image_updated = 'Pulled' in pull_output or 'Downloaded newer image' in pull_output or 'Digest:' in pull_output
+
+            # Step 3: Handle container based on its previous state
+            return self.after_pull(compose_path, service_name, was_running, container_exists,
+                                   image_updated, cancel_event)
+
+        except subprocess.TimeoutExpired:
+            return {
+                'status': 'error',
+                'service': service_name,
+                'message': 'Pull command timed out (image might be large)'
+            }
+        except json.JSONDecodeError as e:
+            return {
+                'status': 'error',
+                'service': service_name,
+                'message': f'Error parsing container status: {str(e)}'
+            }
+
+    def after_pull(self, compose_path, service_name, was_running, container_exists, image_updated,
+                   cancel_event=None):
+        """Recreate or remove the service's container once its image has been pulled"""
+        if was_running:
+            return self.update(compose_path, service_name, image_updated, cancel_event)
+
+        elif container_exists:
+            # Container exists but was stopped, just remove it
+            down_result = run_command(self._compose(compose_path, 'rm', '-f', service_name),
+                                      timeout=60, cancel_event=cancel_event)
+
+            if down_result.returncode != 0:
+                return {
+                    'status': 'error',
+                    'service': service_name,
+                    'message': 'Failed to remove old container',
+                    'error': down_result.stderr
+                }
+
+            update_status = '(new version available)' if image_updated else '(already up to date)'
+            return {
+                'status': 'success',
+                'service': service_name,
+                'image_updated': image_updated,
+                'message': f'Latest image pulled for {service_name} {update_status}. Old container removed. Use "Bring Up" to start with new image.',
+                'was_running': False
+            }
+
+        else:
+            # Container didn't exist, just pulled the image
+            update_status = '(new version available)' if image_updated else '(already up to date)'
+            return {
+                'status': 'success',
+                'service': service_name,
+                'image_updated': image_updated,
+                'message': f'Latest image pulled for {service_name} {update_status}. Use "Bring Up" to start the container.',
+                'was_running': False
+            }
+
+    def update(self, compose_path, service_name, image_updated, cancel_event=None):
+        """Recreate a running service only if its image or config changed, and wait until it is healthy
+
+        The container's image ID and config-hash label are compared with the
+        local image and the compose config first; when both match, the
+        container is left alone. Otherwise `up -d --no-deps` replaces it in one
+        step. If the new container doesn't become healthy, the previous image
+        is tagged back and the service recreated on it.
+        """
+        image = (self.compose_cache.get().services.get(service_name) or {}).get('image')
+        try:
+            before = self._service_container(service_name)
+        except DockerAPIError:
+            # No Engine API: nothing to compare with, compose decides whether to recreate
+            before = None
+
+        image_changed = False
+        if before is not None:
+            expected_hash = (self.config_hashes.get() if self.config_hashes else {}).get(service_name)
+            current_hash = (before.get('Labels') or {}).get(CONFIG_HASH_LABEL)
+            current_image = image_id(self.docker_client, image) if image else None
+            image_changed = current_image is not None and current_image != before.get('ImageID')
+            # An unknown hash counts as changed; `up` then still only recreates if compose sees a difference
+            config_changed = expected_hash is None or expected_hash != current_hash
+            if not image_changed and not config_changed:
+                return {
+                    'status': 'success',
+                    'service': service_name,
+                    'image_updated': image_updated,
+                    'recreated': False,
+                    'downtime': 0.0,
+                    'message': f'Service {service_name} already on latest image and config, left running',
+                    'was_running': True
+                }
+
+        started = time.monotonic()
+        try:
+            up_result = run_command(self._compose(compose_path, 'up', '-d', '--no-deps', service_name),
+                                    timeout=60, cancel_event=cancel_event)
+        except subprocess.TimeoutExpired:
+            up_result = None
+        if up_result is None or up_result.returncode != 0:
+            failure = {
+                'message': 'Image pulled but failed to recreate the container',
+                'error': up_result.stderr if up_result is not None else 'Up command timed out'
+            }
+            return self._rollback(compose_path, service_name, image, before, image_changed, started, failure,
+                                  cancel_event)
+
+        if before is None:
+            update_msg = 'updated to latest image' if image_updated else 'already on latest image'
+            return {
+                'status': 'success',
+                'service': service_name,
+                'image_updated': image_updated,
+                'recreated': None,
+                'downtime': round(time.monotonic() - started, 3),
+                'message': f'Service {service_name} {update_msg} and brought up',
+                'was_running': True
+            }
+
+        after = self._service_container(service_name)
+        if after is not None and after['Id'] == before['Id']:
+            # compose found nothing to change after all
+            return {
+                'status': 'success',
+                'service': service_name,
+                'image_updated': image_updated,
+                'recreated': False,
+                'downtime': 0.0,
+                'message': f'Service {service_name} already up to date, left running',
+                'was_running': True
+            }
+
+        health = self._wait_healthy(after['Id'], cancel_event) if after is not None else 'missing'
+        downtime = round(time.monotonic() - started, 3)
+        if health in ('healthy', 'running'):
+            return {
+                'status': 'success',
+                'service': service_name,
+                'image_updated': image_updated,
+                'recreated': True,
+                'health': health,
+                'downtime': downtime,
+                'message': f'Service {service_name} recreated and {health} after {downtime:g}s',
+                'was_running': True
+            }
+
+        failure = {'message': f'New container for {service_name} did not become healthy ({health})', 'health': health}
+        return self._rollback(compose_path, service_name, image, before, image_changed, started, failure,
+                              cancel_event)
+
+    def _rollback(self, compose_path, service_name, image, before, image_changed, started, failure,
+                  cancel_event=None):
+        """Tag the previous image back and recreate the service on it; returns the error payload"""
+        result = {'status': 'error', 'service': service_name, 'was_running': True, **failure, 'rolled_back': False}
+        reference = ImageReference(image) if image else None
+        # Only an image change can be undone; digest-pinned references can't be retagged
+        if before is None or not image_changed or reference is None or reference.digest:
+            result['downtime'] = round(time.monotonic() - started, 3)
+            return result
+
+        try:
+            self.docker_client.request_json('POST', f'/images/{quote(before["ImageID"], safe="")}/tag',
+                                            {'repo': reference.name, 'tag': reference.tag})
+            up_result = run_command(self._compose(compose_path, 'up', '-d', '--no-deps', service_name),
+                                    timeout=60, cancel_event=cancel_event)
+            if up_result.returncode != 0:
+                raise DockerAPIError(up_result.stderr.strip() or 'up failed')
+            after = self._service_container(service_name)
+            health = self._wait_healthy(after['Id'], cancel_event) if after is not None else 'missing'
+        except (DockerAPIError, subprocess.TimeoutExpired) as e:
+            result['rollback_error'] = str(e)
+            health = None
+
+        result['rolled_back'] = health in ('healthy', 'running')
+        result['downtime'] = round(time.monotonic() - started, 3)
+        result['message'] += '; rolled back to the previous image' if result['rolled_back'] else '; rollback failed'
+        return result
+
+    def _service_container(self, service_name):
+        """The service's running container from the Engine API (its first one), or None"""
+        containers = self.docker_client.list_containers(self.project, service_name)
+        running = [c for c in containers if c.get('State') == 'running']
+        return (running or containers or [None])[0]
+
+    def _wait_healthy(self, container_id, cancel_event=None, interval=1.0, settle=3.0):
+        """'healthy', or 'running' for containers without a healthcheck that stay up for `settle` seconds
+
+        Anything else names why the container failed: 'unhealthy', 'exited',
+        'restarting' or 'timeout'.
+        """
+        deadline = time.monotonic() + self.health_timeout
+        running_since = None
+        while True:
+            try:
+                data = self.docker_client.get_json(f'/containers/{container_id}/json')
+            except DockerAPIError as e:
+                return 'missing' if e.status_code == 404 else 'timeout'
+            state = data.get('State') or {}
+            health = (state.get('Health') or {}).get('Status')
+            if data.get('RestartCount') or state.get('Restarting'):
+                return 'restarting'
+            if not state.get('Running'):
+                return 'exited'
+            if health in ('healthy', 'unhealthy'):
+                return health
+            if health is None:
+                running_since = running_since or time.monotonic()
+                if time.monotonic() - running_since >= settle:
+                    return 'running'
+            if time.monotonic() >= deadline:
+                return 'timeout'
+            if cancel_event is not None:
+                if cancel_event.wait(interval):
+                    raise CommandCancelled(f'waiting for {container_id} to become healthy')
+            else:
+                time.sleep(interval)
@@ -0,0 +1,119 @@
+"""In-memory index of the React build with cache headers and precompressed variants"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Build outputs whose name carries a content hash (main.3f2a1b9c.js, logo.6ce24c58023cc2f8caf5.svg)
+_HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+
+# Encodings in order of preference, with the file suffix a build step may have produced
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json',
+                       'application/xml', 'image/svg+xml', 'application/wasm')
+
+# Smaller files gain less from compression than they cost in headers
+_MIN_COMPRESS_SIZE = 256
+
+
+def _compressible(content_type):
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+def _compress(encoding, data):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output, and so its ETag, stable across restarts
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+class Asset:
+    """One file of the build: its bytes, headers and compressed variants"""
+
+    def __init__(self, path, data, content_type, cache_control):
+        self.path = path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        etag = hashlib.sha256(data).hexdigest()[:32]
+        # encoding -> (body, strong ETag); each representation gets its own validator
+        self.variants = {'identity': (data, etag)}
+
+    def add_variant(self, encoding, data):
+        identity, etag = self.variants['identity']
+        if data is not None and len(data) < len(identity) * 0.9:
+            self.variants[encoding] = (data, f'{etag}-{encoding}')
+
+    def select(self, accepted):
+        """(encoding, body, etag) of the best variant `accepted(encoding)` allows"""
+        for encoding, _ in ENCODINGS:
+            if encoding in self.variants and accepted(encoding):
+                return (encoding,) + self.variants[encoding]
+        return ('identity',) + self.variants['identity']
+
+
+class StaticAssets:
+    """The frontend build read once into memory
+
+    Content-hashed files are served as immutable; everything else (index.html,
+    service-worker.js, manifest.json) is revalidated with its ETag. Text
+    assets get gzip and, when the brotli module is installed, brotli variants;
+    .gz/.br files already present in the build are used as they are. Paths
+    that are not files of the build fall back to index.html so client-side
+    routes load the app, except under static/ where a stale bundle must 404.
+    """
+
+    def __init__(self, root, index='index.html'):
+        self.root = root
+        self.index = index
+        self.assets = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.root):
+            return
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                full = os.path.join(directory, name)
+                files[os.path.relpath(full, self.root).replace(os.sep, '/')] = full
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+
+        for path, full in files.items():
+            if path.endswith(suffixes) and path.rsplit('.', 1)[0] in files:
+                # A precompressed copy; attached to its original below
+                continue
+            with open(full, 'rb') as file:
+                data = file.read()
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            if content_type.startswith('text/') or content_type == 'application/javascript':
+                content_type += '; charset=utf-8'
+            hashed = path.startswith('static/') and _HASHED_NAME.search(os.path.basename(path))
+            asset = Asset(path, data, content_type, IMMUTABLE if hashed else REVALIDATE)
+
+            for encoding, suffix in ENCODINGS:
+                if path + suffix in files:
+                    with open(files[path + suffix], 'rb') as file:
+                        asset.add_variant(encoding, file.read())
+                elif _compressible(content_type) and len(data) >= _MIN_COMPRESS_SIZE:
+                    asset.add_variant(encoding, _compress(encoding, data))
+            self.assets[path] = asset
+
+    def find(self, path):
+        """The asset for a request path, the index.html fallback, or None"""
+        path = path.strip('/') or self.index
+        asset = self.assets.get(path)
+        if asset is None and not path.startswith('static/'):
+            asset = self.assets.get(self.index)
+        return asset
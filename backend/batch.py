@@ -0,0 +1,130 @@
+"""Run one action over many services in depends_on order"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .commands import CommandCancelled
+
+# Actions that tear services down run dependents first
+REVERSE_ORDER_ACTIONS = ('stop', 'down')
+
+
+class BatchError(Exception):
+    """Raised when a batch request cannot be planned"""
+
+
+def dependency_graph(compose, services):
+    """Map each selected service to the selected services it depends on"""
+    selected = set(services)
+    return {service: [dep for dep in compose.dependencies(service) if dep in selected] for service in services}
+
+
+def execution_order(graph, reverse=False):
+    """Topological order of the graph, dependencies first (or last when reverse)
+
+    Also used to reject dependency cycles before anything runs.
+    """
+    waiting = {service: set(deps) for service, deps in graph.items()}
+    if reverse:
+        waiting = {service: set() for service in graph}
+        for service, deps in graph.items():
+            for dep in deps:
+                waiting[dep].add(service)
+
+    order = []
+    ready = [service for service, deps in waiting.items() if not deps]
+    while ready:
+        service = ready.pop(0)
+        order.append(service)
+        for other, deps in waiting.items():
+            if service in deps:
+                deps.discard(service)
+                if not deps and other not in order and other not in ready:
+                    ready.append(other)
+
+    if len(order) != len(graph):
+        cycle = sorted(service for service in graph if service not in order)
+        raise BatchError(f'Dependency cycle between services: {", ".join(cycle)}')
+    return order
+
+
+def run_batch(action, graph, run_one, concurrency=4, cancel_event=None):
+    """Run run_one(service) for every service, in parallel where dependencies allow
+
+    Services start only after everything they wait on has succeeded; if a
+    prerequisite fails, its waiters are skipped. Returns the batch payload
+    with per-service results and timings.
+    """
+    reverse = action in REVERSE_ORDER_ACTIONS
+    order = execution_order(graph, reverse)
+
+    # service -> services that must finish first
+    prerequisites = {service: set(deps) for service, deps in graph.items()}
+    if reverse:
+        prerequisites = {service: {other for other, deps in graph.items() if service in deps}
+                         for service in graph}
+
+    cancel_event = cancel_event or threading.Event()
+    results = {}
+    pending = dict(prerequisites)
+    started = time.time()
+
+    def execute(service):
+        begin = time.time()
+        try:
+            result = run_one(service)
+        except CommandCancelled:
+            result = {'status': 'cancelled', 'service': service, 'message': 'Cancelled while running'}
+        except Exception as e:
+            result = {'status': 'error', 'service': service, 'message': str(e)}
+        # Seconds after the batch started, to show what ran in parallel
+        result['start_offset'] = round(begin - started, 3)
+        result['duration'] = round(time.time() - begin, 3)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        running = {}
+        while pending or running:
+            # Skip services whose prerequisites did not succeed
+            for service in [s for s, deps in pending.items() if deps & set(results)]:
+                failed = [dep for dep in pending[service] if dep in results and results[dep]['status'] != 'success']
+                if failed:
+                    del pending[service]
+                    results[service] = {
+                        'status': 'skipped',
+                        'service': service,
+                        'message': f'Skipped because {", ".join(sorted(failed))} did not succeed',
+                    }
+
+            ready = [s for s, deps in pending.items() if all(results.get(dep, {}).get('status') == 'success' for dep in deps)]
+            for service in ready:
+                del pending[service]
+                if cancel_event.is_set():
+                    results[service] = {'status': 'cancelled', 'service': service, 'message': 'Batch cancelled'}
+                else:
+                    running[pool.submit(execute, service)] = service
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+
+    if cancel_event.is_set():
+        status = 'cancelled'
+    else:
+        status = 'success' if counts.get('success', 0) == len(graph) else 'error'
+
+    return {
+        'status': status,
+        'action': action,
+        'message': f'{action.capitalize()} finished for {counts.get("success", 0)} of {len(graph)} services',
+        'order': order,
+        'results': results,
+        'counts': counts,
+        'duration': round(time.time() - started, 3),
+    }
@@ -0,0 +1,149 @@
+"""Shared runner for docker / docker-compose subprocesses"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import (COMMAND_DURATION, COMMAND_TIMEOUTS, COMMANDS, COMMANDS_IN_FLIGHT, COMMANDS_WAITING,
+                      command_labels)
+
+# Own process group per command so a kill also reaches helpers it spawned
+_NEW_SESSION = hasattr(os, 'killpg')
+
+# Subcommands that download or build images: network and disk bound, and slow
+HEAVY_SUBCOMMANDS = ('pull', 'build')
+
+
+class CommandCancelled(Exception):
+    """Raised when a running command was cancelled and its process killed"""
+
+
+class CommandSlots:
+    """Caps how many docker operations run at once, with a lower cap for heavy ones
+
+    Waiters are admitted in arrival order, except that a heavy operation held
+    back by the heavy cap doesn't block light ones queued behind it. Keeping
+    `heavy_limit` below `limit` leaves room for status listings and
+    start/stop while pulls are running.
+    """
+
+    def __init__(self, limit=8, heavy_limit=2):
+        self.limit = limit
+        self.heavy_limit = heavy_limit
+        self._running = 0
+        self._heavy_running = 0
+        self._waiters = []
+        self._cond = threading.Condition()
+
+    def configure(self, limit, heavy_limit):
+        with self._cond:
+            self.limit = max(1, limit)
+            self.heavy_limit = max(1, min(heavy_limit, self.limit))
+            self._admit()
+            self._cond.notify_all()
+
+    def _admit(self):
+        # Called with self._cond held
+        for waiter in self._waiters:
+            if self._running >= self.limit:
+                break
+            if waiter['heavy'] and self._heavy_running >= self.heavy_limit:
+                continue
+            waiter['admitted'] = True
+            self._running += 1
+            self._heavy_running += waiter['heavy']
+        self._waiters = [waiter for waiter in self._waiters if not waiter['admitted']]
+
+    @contextmanager
+    def slot(self, heavy=False, cancel_event=None, poll_interval=0.5):
+        """Hold one slot for the duration of the block; raises CommandCancelled if cancelled while waiting"""
+        waiter = {'heavy': heavy, 'admitted': False}
+        with self._cond:
+            self._waiters.append(waiter)
+            self._admit()
+            if not waiter['admitted']:
+                COMMANDS_WAITING.inc()
+                try:
+                    while not waiter['admitted']:
+                        if cancel_event is not None and cancel_event.is_set():
+                            self._waiters.remove(waiter)
+                            raise CommandCancelled('cancelled while waiting for a command slot')
+                        self._cond.wait(poll_interval if cancel_event is not None else None)
+                finally:
+                    COMMANDS_WAITING.dec()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._heavy_running -= heavy
+                self._admit()
+                self._cond.notify_all()
+
+
+# Shared by every docker / docker-compose process and Engine API pull
+SLOTS = CommandSlots()
+
+
+def run_command(args, timeout, cancel_event=None, poll_interval=0.5):
+    """subprocess.run(capture_output=True, text=True) that can also be cancelled
+
+    Raises subprocess.TimeoutExpired like subprocess.run, and CommandCancelled
+    when cancel_event is set while the process is still running. The command
+    first waits for a slot in SLOTS; that wait doesn't count towards the timeout.
+    """
+    command, subcommand = command_labels(args)
+    with SLOTS.slot(subcommand in HEAVY_SUBCOMMANDS, cancel_event, poll_interval):
+        return _run(args, command, subcommand, timeout, cancel_event, poll_interval)
+
+
+def _run(args, command, subcommand, timeout, cancel_event, poll_interval):
+    exit_code = 'error'
+    started = time.monotonic()
+    deadline = started + timeout
+    COMMANDS_IN_FLIGHT.inc()
+    try:
+        with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                              start_new_session=_NEW_SESSION) as process:
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    stdout, stderr = process.communicate(timeout=max(0.0, min(poll_interval, remaining)))
+                    break
+                except subprocess.TimeoutExpired:
+                    # communicate() can be retried without losing output
+                    if cancel_event is not None and cancel_event.is_set():
+                        _kill(process)
+                        process.communicate()
+                        exit_code = 'cancelled'
+                        raise CommandCancelled(' '.join(args))
+                    if time.monotonic() >= deadline:
+                        _kill(process)
+                        stdout, stderr = process.communicate()
+                        exit_code = 'timeout'
+                        COMMAND_TIMEOUTS.inc(command=command, subcommand=subcommand)
+                        raise subprocess.TimeoutExpired(args, timeout, output=stdout, stderr=stderr)
+        exit_code = process.returncode
+        return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+    finally:
+        # Every docker / docker-compose call site goes through here, so all are measured alike
+        COMMANDS_IN_FLIGHT.dec()
+        COMMANDS.inc(command=command, subcommand=subcommand, exit_code=exit_code)
+        COMMAND_DURATION.observe(time.monotonic() - started, command=command, subcommand=subcommand)
+
+
+def _kill(process):
+    if _NEW_SESSION:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+            return
+        except ProcessLookupError:
+            pass
+    process.kill()
+
+
+def compose_command(project, compose_path, *args):
+    """Build a docker-compose command line for a project"""
+    return ['docker-compose', '-p', project, '-f', compose_path, *args]
@@ -0,0 +1,35 @@
+"""Constants and helpers shared by the backend modules"""
+import fcntl
+from datetime import datetime, timezone
+
+# Labels docker compose puts on the containers it creates
+PROJECT_LABEL = 'com.docker.compose.project'
+SERVICE_LABEL = 'com.docker.compose.service'
+CONFIG_HASH_LABEL = 'com.docker.compose.config-hash'
+# `docker compose run` containers belong to the project but not to its desired state
+ONEOFF_LABEL = 'com.docker.compose.oneoff'
+
+
+def timestamp(value):
+    """An epoch time as an ISO 8601 UTC string; None stays None"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).isoformat()
+
+
+def exclusive_lock(path):
+    """An open file holding an exclusive lock on `path`, or None while another process holds it
+
+    The lock lasts until the file is closed or the process exits, so another
+    server worker can take over from one that died.
+    """
+    try:
+        file = open(path, 'a')
+    except OSError:
+        return None
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        file.close()
+        return None
+    return file
@@ -0,0 +1,422 @@
+"""Cached, fully resolved view of a docker-compose file"""
+import hashlib
+import io
+import os
+import re
+import subprocess
+import threading
+
+import yaml
+from dotenv import dotenv_values
+
+from .commands import compose_command, run_command
+from .metrics import CACHE_REQUESTS
+
+class ComposeError(Exception):
+    """Raised when the compose file is missing or cannot be resolved"""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# Keys that may be written either as a mapping or as a list of KEY=VALUE strings
+_MAPPING_KEYS = {'environment', 'labels', 'annotations', 'sysctls'}
+
+# List keys that extends appends to instead of replacing
+_SEQUENCE_KEYS = {
+    'cap_add', 'cap_drop', 'devices', 'dns', 'dns_search', 'env_file', 'expose',
+    'external_links', 'extra_hosts', 'links', 'ports', 'secrets', 'configs',
+    'security_opt', 'tmpfs', 'volumes', 'volumes_from',
+}
+
+_NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def interpolate(value, env):
+    """Substitute ${VAR} style references in every string of a parsed document"""
+    if isinstance(value, dict):
+        return {key: interpolate(item, env) for key, item in value.items()}
+    if isinstance(value, list):
+        return [interpolate(item, env) for item in value]
+    if isinstance(value, str) and '$' in value:
+        return _interpolate_string(value, env)
+    return value
+
+
+def _interpolate_string(text, env):
+    out = []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char != '$' or i + 1 >= len(text):
+            out.append(char)
+            i += 1
+            continue
+
+        nxt = text[i + 1]
+        if nxt == '$':
+            # $$ escapes a literal dollar sign
+            out.append('$')
+            i += 2
+        elif nxt == '{':
+            end = _closing_brace(text, i + 2)
+            out.append(_expand(text[i + 2:end], env))
+            i = end + 1
+        else:
+            match = _NAME_RE.match(text, i + 1)
+            if match:
+                out.append(env.get(match.group(0)) or '')
+                i = match.end()
+            else:
+                out.append(char)
+                i += 1
+    return ''.join(out)
+
+
+def _closing_brace(text, start):
+    depth = 1
+    for pos in range(start, len(text)):
+        if text[pos] == '{':
+            depth += 1
+        elif text[pos] == '}':
+            depth -= 1
+            if depth == 0:
+                return pos
+    raise ComposeError(f'Invalid interpolation format: unterminated "${{" in "{text}"')
+
+
+def _expand(expression, env):
+    match = _NAME_RE.match(expression)
+    if not match:
+        raise ComposeError(f'Invalid interpolation format: "${{{expression}}}"')
+
+    name = match.group(0)
+    rest = expression[match.end():]
+    value = env.get(name)
+
+    if not rest:
+        return value or ''
+
+    for operator in (':-', ':?', ':+', '-', '?', '+'):
+        if rest.startswith(operator):
+            argument = _interpolate_string(rest[len(operator):], env)
+            # The colon forms also treat an empty value as unset
+            unset = value is None or (operator.startswith(':') and value == '')
+            kind = operator[-1]
+            if kind == '-':
+                return argument if unset else value
+            if kind == '+':
+                return '' if unset else argument
+            if unset:
+                raise ComposeError(f'Required variable "{name}" is missing a value: {argument}')
+            return value
+
+    raise ComposeError(f'Invalid interpolation format: "${{{expression}}}"')
+
+
+def _as_mapping(value):
+    if isinstance(value, dict):
+        return dict(value)
+    mapping = {}
+    for item in value or []:
+        key, sep, val = str(item).partition('=')
+        mapping[key] = val if sep else None
+    return mapping
+
+
+def _depends_on_mapping(value):
+    if isinstance(value, dict):
+        return dict(value)
+    return {name: {'condition': 'service_started'} for name in value or []}
+
+
+def _merge_mappings(base, override):
+    result = dict(base)
+    for key, value in override.items():
+        if isinstance(result.get(key), dict) and isinstance(value, dict):
+            result[key] = _merge_mappings(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def merge_service(base, override):
+    """Merge an extending service definition on top of its base"""
+    result = dict(base)
+    for key, value in override.items():
+        if key not in result:
+            result[key] = value
+        elif key in _MAPPING_KEYS:
+            result[key] = {**_as_mapping(result[key]), **_as_mapping(value)}
+        elif key == 'depends_on':
+            result[key] = {**_depends_on_mapping(result[key]), **_depends_on_mapping(value)}
+        elif key in _SEQUENCE_KEYS and isinstance(result[key], list) and isinstance(value, list):
+            result[key] = result[key] + [item for item in value if item not in result[key]]
+        elif isinstance(result[key], dict) and isinstance(value, dict):
+            result[key] = _merge_mappings(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def service_enabled(config, active_profiles):
+    """Whether compose would run a service for the given active profiles"""
+    profiles = config.get('profiles') or []
+    if not profiles or '*' in active_profiles:
+        return True
+    return any(profile in active_profiles for profile in profiles)
+
+
+class ComposeModel:
+    """Resolved compose project: enabled services, active profiles and source files"""
+
+    def __init__(self, path, name, all_services, active_profiles, sources):
+        self.path = path
+        self.name = name
+        self.all_services = all_services
+        self.active_profiles = active_profiles
+        self.services = {
+            service: config for service, config in all_services.items()
+            if service_enabled(config, active_profiles)
+        }
+        # Source file path -> [mtime_ns, size, sha256]; None when the file is absent
+        self.sources = sources
+        digests = ''.join(f'{source}:{info[2] if info else "-"};' for source, info in sorted(sources.items()))
+        self.content_hash = hashlib.sha256(digests.encode()).hexdigest()
+
+    @property
+    def service_names(self):
+        return list(self.services.keys())
+
+    def dependencies(self, service):
+        """Names of the services a service depends_on"""
+        config = self.all_services.get(service) or {}
+        return list(_depends_on_mapping(config.get('depends_on')))
+
+    def profile_services(self, profile):
+        """Services that belong to a profile, whether or not it is active"""
+        return [
+            service for service, config in self.all_services.items()
+            if profile in (config.get('profiles') or [])
+        ]
+
+
+class _Loader:
+    """Reads compose and .env files once each, recording them as cache sources"""
+
+    def __init__(self):
+        self.sources = {}
+
+    def _read(self, path):
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.sources[path] = None
+            return None
+        self.sources[path] = [stat.st_mtime_ns, stat.st_size, hashlib.sha256(data).hexdigest()]
+        return data
+
+    def environment(self, env_files):
+        """Variables available for interpolation; the process environment wins over .env files"""
+        env = {}
+        for env_file in env_files:
+            data = self._read(env_file)
+            if data is not None:
+                env.update(dotenv_values(stream=io.StringIO(data.decode('utf-8'))))
+        env.update(os.environ)
+        return env
+
+    def load(self, path, env):
+        data = self._read(path)
+        if data is None:
+            raise ComposeError(f'Docker compose file not found at: {path}', 404)
+        try:
+            document = yaml.safe_load(data) or {}
+        except yaml.YAMLError as e:
+            raise ComposeError(f'Error parsing docker-compose file: {str(e)}')
+        if not isinstance(document, dict):
+            raise ComposeError(f'Docker compose file {path} must contain a mapping')
+        return interpolate(document, env)
+
+
+def _resolve_extends(loader, name, services, file_path, env, stack):
+    config = services[name] or {}
+    extends = config.get('extends')
+    if not extends:
+        return config
+    if isinstance(extends, str):
+        extends = {'service': extends}
+
+    key = (file_path, name)
+    if key in stack:
+        raise ComposeError(f'Circular extends detected for service {name}')
+
+    base_name = extends.get('service')
+    base_file = file_path
+    base_services = services
+    if extends.get('file'):
+        base_file = os.path.join(os.path.dirname(file_path), extends['file'])
+        base_services = loader.load(base_file, env).get('services') or {}
+
+    if base_name not in base_services:
+        raise ComposeError(f'Service {name} extends unknown service {base_name}')
+
+    base = _resolve_extends(loader, base_name, base_services, base_file, env, stack | {key})
+    return merge_service(base, {k: v for k, v in config.items() if k != 'extends'})
+
+
+def _resolve_file(loader, path, env, stack):
+    """Load a compose file and return its (document, services) with includes and extends applied"""
+    path = os.path.abspath(path)
+    if path in stack:
+        raise ComposeError(f'Circular include detected for {path}')
+
+    document = loader.load(path, env)
+    raw_services = document.get('services') or {}
+    services = {
+        name: _resolve_extends(loader, name, raw_services, path, env, frozenset())
+        for name in raw_services
+    }
+
+    base_dir = os.path.dirname(path)
+    for entry in document.get('include') or []:
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        paths = entry.get('path')
+        paths = [paths] if isinstance(paths, str) else list(paths or [])
+        paths = [os.path.join(base_dir, p) for p in paths]
+        if not paths:
+            continue
+
+        project_dir = os.path.join(base_dir, entry.get('project_directory') or os.path.dirname(paths[0]))
+        env_files = entry.get('env_file') or [os.path.join(project_dir, '.env')]
+        if isinstance(env_files, str):
+            env_files = [env_files]
+        include_env = loader.environment([os.path.join(base_dir, f) for f in env_files])
+
+        # Several paths in one include entry behave like -f overrides of each other
+        included = {}
+        for include_path in paths:
+            _, file_services = _resolve_file(loader, include_path, include_env, stack | {path})
+            for name, config in file_services.items():
+                included[name] = merge_service(included[name], config) if name in included else config
+
+        for name, config in included.items():
+            if name in services:
+                raise ComposeError(f'Service {name} from {paths[0]} conflicts with a service in {path}')
+            services[name] = config
+
+    return document, services
+
+
+def load_compose(path):
+    """Parse a compose file into a ComposeModel, resolving include, extends, profiles and variables"""
+    path = os.path.abspath(path)
+    loader = _Loader()
+    env = loader.environment([os.path.join(os.path.dirname(path), '.env')])
+    document, services = _resolve_file(loader, path, env, frozenset())
+
+    active_profiles = [p.strip() for p in (env.get('COMPOSE_PROFILES') or '').split(',') if p.strip()]
+    name = document.get('name') or env.get('COMPOSE_PROJECT_NAME') or os.path.basename(os.path.dirname(path))
+    return ComposeModel(path, name, services, active_profiles, loader.sources)
+
+
+class ComposeCache:
+    """Parses a compose file once and reuses the model until one of its source files changes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return the current ComposeModel, re-parsing only when a source changed"""
+        if not self.path:
+            raise ComposeError('DOCKER_COMPOSE_PATH environment variable not found', 404)
+
+        with self._lock:
+            if self._model is not None and self._is_fresh(self._model):
+                CACHE_REQUESTS.inc(cache='compose', result='hit')
+                return self._model
+
+            CACHE_REQUESTS.inc(cache='compose', result='miss')
+            if not os.path.exists(self.path):
+                self._model = None
+                raise ComposeError(f'Docker compose file not found at: {self.path}', 404)
+
+            self._model = load_compose(self.path)
+            return self._model
+
+    def invalidate(self):
+        with self._lock:
+            self._model = None
+
+    @staticmethod
+    def _is_fresh(model):
+        for path, info in model.sources.items():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if info is None:
+                    continue
+                return False
+            if info is None:
+                return False
+            if [stat.st_mtime_ns, stat.st_size] == info[:2]:
+                continue
+
+            # Touched but possibly unchanged (e.g. an editor rewrite): compare content
+            with open(path, 'rb') as file:
+                digest = hashlib.sha256(file.read()).hexdigest()
+            if digest != info[2]:
+                return False
+            info[0], info[1] = stat.st_mtime_ns, stat.st_size
+        return True
+
+
+class ConfigHashCache:
+    """Per-service config hashes as docker compose computes them, cached per compose content
+
+    These are the values compose compares with a container's config-hash label
+    to decide whether `up` recreates it. `docker-compose config --hash` only
+    runs again once the compose model's content hash changes.
+    """
+
+    def __init__(self, project, compose_cache, timeout=30):
+        self.project = project
+        self.compose_cache = compose_cache
+        self.timeout = timeout
+        self._content_hash = None
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self):
+        """{service: config hash}; empty when the compose CLI can't compute them"""
+        model = self.compose_cache.get()
+        with self._lock:
+            if self._content_hash == model.content_hash:
+                CACHE_REQUESTS.inc(cache='config_hash', result='hit')
+                return dict(self._hashes)
+
+            CACHE_REQUESTS.inc(cache='config_hash', result='miss')
+            try:
+                result = run_command(compose_command(self.project, model.path, 'config', '--hash', '*'),
+                                     timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                return {}
+            if result.returncode != 0:
+                # Not cached, so a transient failure is retried on the next call
+                return {}
+
+            hashes = {}
+            for line in result.stdout.splitlines():
+                service, _, digest = line.strip().partition(' ')
+                if service and digest:
+                    hashes[service] = digest.strip()
+            self._content_hash = model.content_hash
+            self._hashes = hashes
+            return dict(hashes)
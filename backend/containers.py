@@ -0,0 +1,242 @@
+"""Container status backends producing the docker-compose ps JSON shape"""
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from .commands import compose_command, run_command
+from .common import SERVICE_LABEL
+from .docker_api import DockerAPIError
+from .metrics import CACHE_REQUESTS
+
+# Fields of the default status payload
+SUMMARY_FIELDS = ('Name', 'Service', 'State', 'Status', 'Ports')
+# Fields only container inspects have, added on request
+DETAIL_FIELDS = ('Id', 'Image', 'ImageId', 'ImageDigest', 'Health', 'RestartCount', 'StartedAt', 'FinishedAt',
+                 'ExitCode')
+
+# The health suffix the Engine API adds to a Status: "Up 3 hours (healthy)", "(health: starting)"
+_STATUS_HEALTH = re.compile(r'\((?:health: )?(healthy|unhealthy|starting)\)')
+
+
+class StatusError(Exception):
+    """Raised when container status could not be retrieved"""
+
+    def __init__(self, message, error=''):
+        super().__init__(message)
+        self.error = error
+
+
+def publishers_from_ports(ports):
+    """Convert Engine API port entries to compose's Publishers list"""
+    publishers = [{
+        'URL': port.get('IP', ''),
+        'TargetPort': port.get('PrivatePort', 0),
+        'PublishedPort': port.get('PublicPort', 0),
+        'Protocol': port.get('Type', 'tcp'),
+    } for port in ports or []]
+    # Same ordering docker-compose uses for Publishers
+    publishers.sort(key=lambda p: (p['URL'], p['TargetPort'], p['PublishedPort'], p['Protocol']))
+    return publishers
+
+
+def summary_from_api(container):
+    """Convert an Engine API /containers/json entry to the status payload shape"""
+    names = container.get('Names') or ['']
+    labels = container.get('Labels') or {}
+    return {
+        'Name': names[0].lstrip('/'),
+        'Service': labels.get(SERVICE_LABEL, ''),
+        'State': container.get('State', ''),
+        'Status': container.get('Status', ''),
+        'Ports': publishers_from_ports(container.get('Ports')),
+    }
+
+
+def summary_from_cli(container_data):
+    """Convert a docker-compose ps --format json entry to the status payload shape"""
+    return {
+        'Name': container_data.get('Name', ''),
+        'Service': container_data.get('Service', ''),
+        'State': container_data.get('State', ''),
+        'Status': container_data.get('Status', ''),
+        'Ports': container_data.get('Publishers', [])
+    }
+
+
+def ps_via_api(client, project, service=None):
+    """List project containers with a single Engine API call"""
+    containers = [summary_from_api(c) for c in client.list_containers(project, service)]
+    containers.sort(key=lambda c: c['Name'])
+    return containers
+
+
+def ps_via_cli(compose_path, project, service=None):
+    """List project containers by running docker-compose ps"""
+    command = compose_command(project, compose_path, 'ps', '-a', '--format', 'json')
+    if service:
+        command.append(service)
+
+    result = run_command(command, timeout=30)
+    if result.returncode != 0:
+        raise StatusError('Failed to get container status', result.stderr)
+
+    containers = []
+    if result.stdout.strip():
+        # Parse JSON output (one JSON object per line)
+        for line in result.stdout.strip().split('\n'):
+            if line:
+                containers.append(summary_from_cli(json.loads(line)))
+    return containers
+
+
+class StatusBackend:
+    """Lists containers via the Engine API, falling back to the docker-compose CLI
+
+    mode is 'api', 'cli' or 'auto' (API first, CLI when the socket is unusable).
+    """
+
+    def __init__(self, client, project, mode='auto'):
+        if mode not in ('auto', 'api', 'cli'):
+            raise ValueError(f'Unknown status backend: {mode}')
+        self.client = client
+        self.project = project
+        self.mode = mode
+
+    def list(self, compose_path, service=None):
+        if self.mode != 'cli':
+            try:
+                return ps_via_api(self.client, self.project, service)
+            except DockerAPIError as e:
+                if self.mode == 'api':
+                    raise StatusError('Failed to get container status', str(e))
+        return ps_via_cli(compose_path, self.project, service)
+
+
+def _digest(repo_digests):
+    # 'nginx@sha256:...' -> 'sha256:...'
+    return repo_digests[0].rpartition('@')[2] if repo_digests else None
+
+
+class ContainerDetails:
+    """Health, restart count, image digest, start time and exit code for every container of a project
+
+    One bulk listing finds the containers; only those not cached are
+    inspected, concurrently on a bounded pool, and each distinct image is
+    inspected once for its digest. Details are cached per container Id, State
+    and health, so a container is re-inspected when it changes state, and at
+    the latest after `ttl` seconds (a quick restart keeps State 'running').
+    With several Docker hosts each host's containers are cached separately,
+    so collecting one host never evicts another's.
+    """
+
+    def __init__(self, project, ttl=60.0, concurrency=8):
+        self.project = project
+        self.ttl = ttl
+        # (host, Id) -> ((State, health), expires_at, details); image ID -> (digest, expires_at)
+        self._containers = {}
+        self._images = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='inspect')
+
+    def close(self):
+        """Stop the inspect pool"""
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def collect(self, client, host=None):
+        """{container name: details} from one listing of `host` plus inspects of the changed containers"""
+        listing = client.list_containers(self.project)
+        now = time.monotonic()
+        details = {}
+        misses = []
+        with self._lock:
+            for container in listing:
+                health = _STATUS_HEALTH.search(container.get('Status', ''))
+                key = (container.get('State', ''), health.group(1) if health else None)
+                cached = self._containers.get((host, container['Id']))
+                if cached and cached[0] == key and cached[1] > now:
+                    details[container['Id']] = cached[2]
+                else:
+                    misses.append((container, key))
+            images = {container.get('ImageID') for container, _ in misses} - {None}
+            images = [image for image in images if not (image in self._images and self._images[image][1] > now)]
+            # Forget this host's containers that are gone
+            listed = {(host, container['Id']) for container in listing}
+            for key in [key for key in self._containers if key[0] == host and key not in listed]:
+                del self._containers[key]
+        CACHE_REQUESTS.inc(len(listing) - len(misses), cache='details', result='hit')
+        CACHE_REQUESTS.inc(len(misses), cache='details', result='miss')
+
+        inspected = list(self._pool.map(lambda entry: self._inspect(client, entry[0]), misses))
+        digests = dict(zip(images, self._pool.map(lambda image: self._image_digest(client, image), images)))
+
+        with self._lock:
+            for image, digest in digests.items():
+                self._images[image] = (digest, now + self.ttl)
+            for (container, key), entry in zip(misses, inspected):
+                entry['ImageDigest'] = self._images.get(container.get('ImageID'), (None,))[0]
+                details[container['Id']] = entry
+                # A failed inspect is retried on the next request
+                if entry.get('RestartCount') is not None:
+                    self._containers[(host, container['Id'])] = (key, now + self.ttl, entry)
+
+        return {(container.get('Names') or [''])[0].lstrip('/'): details[container['Id']] for container in listing}
+
+    def _inspect(self, client, container):
+        entry = dict.fromkeys(DETAIL_FIELDS)
+        entry.update({'Id': container['Id'], 'Image': container.get('Image'), 'ImageId': container.get('ImageID')})
+        try:
+            data = client.get_json(f'/containers/{container["Id"]}/json')
+        except DockerAPIError:
+            # Removed between the listing and the inspect, or the daemon hiccuped
+            return entry
+        state = data.get('State') or {}
+        entry.update({
+            'Health': (state.get('Health') or {}).get('Status') or 'none',
+            'RestartCount': data.get('RestartCount', 0),
+            'StartedAt': state.get('StartedAt'),
+            'FinishedAt': state.get('FinishedAt'),
+            'ExitCode': state.get('ExitCode'),
+        })
+        return entry
+
+    def _image_digest(self, client, image):
+        try:
+            return _digest(client.get_json(f'/images/{quote(image, safe="")}/json').get('RepoDigests'))
+        except DockerAPIError:
+            return None
+
+
+def query_containers(containers, fields=None, states=None, healths=None, sort='Name', offset=0, limit=None):
+    """(page, total matched) of status rows, filtered, sorted and trimmed to `fields`
+
+    `sort` is a field name, '-' prefixed for descending order; rows without
+    the field sort last. Name (and Host, with several Docker hosts) is always
+    kept. Raises ValueError for unknown fields.
+    """
+    known = set(SUMMARY_FIELDS + DETAIL_FIELDS + ('Host',))
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    unknown = [field for field in (fields or []) + [sort] if field not in known]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    if sort == 'Ports':
+        raise ValueError('Cannot sort by Ports')
+
+    if states:
+        containers = [c for c in containers if c.get('State', '').lower() in states]
+    if healths:
+        containers = [c for c in containers if (c.get('Health') or 'none') in healths]
+    present = [c for c in containers if c.get(sort) is not None]
+    missing = [c for c in containers if c.get(sort) is None]
+    present.sort(key=lambda c: c[sort], reverse=descending)
+    containers = present + missing
+
+    total = len(containers)
+    page = containers[offset:offset + limit if limit is not None else None]
+    if fields:
+        keep = ['Name', 'Host'] + [field for field in fields if field not in ('Name', 'Host')]
+        page = [{field: c.get(field) for field in keep if field in c or field in fields} for c in page]
+    return page, total
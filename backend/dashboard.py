@@ -0,0 +1,112 @@
+"""Versioned join of compose services and container status for conditional polling"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def _digest(entry):
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, separators=(',', ':')).encode()).digest()
+
+
+class DashboardView:
+    """Services with their containers, versioned per service
+
+    Every change to a service's entry (or to the service order) bumps the
+    view's version. A version token is '<epoch>.<version>'; the epoch changes
+    on restart so tokens from an earlier process are never mistaken for
+    current ones. Removed services are remembered for the last `history`
+    removals so ?since can report them.
+    """
+
+    def __init__(self, history=1000):
+        self.history = history
+        self.epoch = os.urandom(4).hex()
+        self.version = 0
+        # service -> (digest, entry, version it last changed in)
+        self._entries = {}
+        self._order = ()
+        # service -> version it was removed in, oldest first
+        self._removed = OrderedDict()
+        # Oldest version a ?since delta is still complete for
+        self._horizon = 0
+        self._inputs = None
+        self._lock = threading.Lock()
+
+    @property
+    def token(self):
+        return f'{self.epoch}.{self.version}'
+
+    def _parse(self, since):
+        """Version number of a token from this process, or None"""
+        epoch, _, version = (since or '').partition('.')
+        if epoch != self.epoch or not version.isdigit():
+            return None
+        version = int(version)
+        if version < self._horizon or version > self.version:
+            return None
+        return version
+
+    def _apply(self, services, containers):
+        # Called with self._lock held
+        by_service = {}
+        for container in containers:
+            by_service.setdefault(container.get('Service', ''), []).append(container)
+        defined = set(services)
+        # Services only known from running containers (removed from compose, other hosts) go last
+        order = tuple(services) + tuple(sorted(set(by_service) - defined - {''}))
+
+        changed = []
+        for service in order:
+            entry = {'name': service, 'defined': service in defined, 'containers': by_service.get(service, [])}
+            digest = _digest(entry)
+            current = self._entries.get(service)
+            if current is None or current[0] != digest:
+                changed.append((service, digest, entry))
+        listed = set(order)
+        gone = [service for service in self._entries if service not in listed]
+        if not changed and not gone and order == self._order:
+            return
+
+        self.version += 1
+        for service, digest, entry in changed:
+            self._entries[service] = (digest, entry, self.version)
+            self._removed.pop(service, None)
+        for service in gone:
+            del self._entries[service]
+            self._removed[service] = self.version
+        while len(self._removed) > self.history:
+            _, version = self._removed.popitem(last=False)
+            self._horizon = version
+        self._order = order
+
+    def update(self, services, containers, since=None):
+        """Fold in the current services and containers; return the view, or the changes after `since`
+
+        The result has 'version', 'full', 'order' (every service name),
+        'services' (entries) and 'removed' (names removed after `since`).
+        An unknown or too old `since` gets the full view.
+        """
+        with self._lock:
+            # The snapshot hands out equal lists until something changes; skip rehashing those
+            inputs = (services, containers)
+            if inputs != self._inputs:
+                self._apply(services, containers)
+                self._inputs = inputs
+
+            base = self._parse(since)
+            if base is None:
+                entries = [self._entries[service][1] for service in self._order]
+                removed = []
+            else:
+                entries = [self._entries[service][1] for service in self._order
+                           if self._entries[service][2] > base]
+                removed = [service for service, version in self._removed.items() if version > base]
+            return {
+                'version': self.token,
+                'full': base is None,
+                'order': list(self._order),
+                'services': entries,
+                'removed': removed,
+            }
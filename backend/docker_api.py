@@ -0,0 +1,242 @@
+"""Minimal Docker Engine API client speaking HTTP over the Docker unix socket"""
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+from .common import PROJECT_LABEL, SERVICE_LABEL
+from .metrics import API_DURATION, API_REQUESTS, api_endpoint
+
+DEFAULT_DOCKER_HOST = 'unix:///var/run/docker.sock'
+
+# Connection errors that mean a pooled keep-alive connection went stale
+_STALE_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class DockerAPIError(Exception):
+    """Raised when the Docker Engine API is unreachable or returns an error"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class DockerUnavailable(DockerAPIError):
+    """Raised when the Docker socket can't be connected to or gives no response"""
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection that connects to a unix domain socket instead of TCP"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class StreamResponse:
+    """A streaming API response that owns its (non-pooled) connection"""
+
+    def __init__(self, connection, response):
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def read1(self, amt=-1):
+        """Return whatever is available (up to amt bytes) without waiting for more"""
+        return self.response.read1(amt)
+
+    def readinto(self, buffer):
+        return self.response.readinto(buffer)
+
+    def readline(self):
+        return self.response.readline()
+
+    def iter_json(self):
+        """Yield one decoded object per line of a JSON-lines stream"""
+        while True:
+            line = self.response.readline()
+            if not line:
+                return
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+    def close(self):
+        # Shutting the socket down first wakes a read blocked in another thread,
+        # which would otherwise hold the buffer lock close() needs
+        sock = self.connection.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DockerClient:
+    """Docker Engine API client that reuses keep-alive connections across calls"""
+
+    def __init__(self, host=None, timeout=10, api_version=None, max_idle=4):
+        self.host = host or os.getenv('DOCKER_HOST') or DEFAULT_DOCKER_HOST
+        self.timeout = timeout
+        self.max_idle = max_idle
+        api_version = api_version or os.getenv('DOCKER_API_VERSION')
+        self.prefix = f'/v{api_version.lstrip("v")}' if api_version else ''
+
+        parsed = urlparse(self.host)
+        if parsed.scheme == 'unix':
+            self._socket_path = parsed.path
+            self._address = None
+        elif parsed.scheme in ('tcp', 'http'):
+            self._socket_path = None
+            self._address = (parsed.hostname, parsed.port or 2375)
+        else:
+            raise ValueError(f'Unsupported Docker host: {self.host}')
+
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self, timeout):
+        if self._socket_path:
+            return UnixHTTPConnection(self._socket_path, timeout=timeout)
+        return http.client.HTTPConnection(*self._address, timeout=timeout)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(self.timeout), False
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Close every idle pooled connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _url(self, path, params):
+        url = self.prefix + path
+        if params:
+            # Docker expects structured parameters (filters) as JSON strings
+            encoded = {
+                key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                for key, value in params.items() if value is not None
+            }
+            url += '?' + urlencode(encoded)
+        return url
+
+    def request(self, method, path, params=None, body=None, headers=None):
+        """Perform a request on a pooled connection and return (status, body bytes)"""
+        url = self._url(path, params)
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers.setdefault('Content-Type', 'application/json')
+
+        started = time.monotonic()
+        while True:
+            connection, reused = self._acquire()
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except _STALE_ERRORS as e:
+                connection.close()
+                if reused:
+                    # The daemon closed an idle keep-alive connection; retry on a fresh one
+                    continue
+                self._observe(method, path, 'error', started)
+                raise DockerUnavailable(f'Docker API connection failed: {e}')
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                self._observe(method, path, 'error', started)
+                raise DockerUnavailable(f'Docker API request failed: {e}')
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            self._observe(method, path, response.status, started)
+            return response.status, data
+
+    @staticmethod
+    def _observe(method, path, status, started):
+        endpoint = api_endpoint(path)
+        API_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+        API_DURATION.observe(time.monotonic() - started, method=method, endpoint=endpoint)
+
+    def get_json(self, path, params=None):
+        """GET an endpoint and decode its JSON body, raising DockerAPIError on failure"""
+        return self.request_json('GET', path, params)
+
+    def request_json(self, method, path, params=None, body=None):
+        status, data = self.request(method, path, params=params, body=body)
+        if status >= 400:
+            raise DockerAPIError(_error_message(data, status), status)
+        return json.loads(data) if data else None
+
+    def stream(self, method, path, params=None, body=None, headers=None, timeout=None):
+        """Open a dedicated connection for a long-lived streaming response"""
+        started = time.monotonic()
+        connection = self._connect(timeout)
+        try:
+            connection.request(method, self._url(path, params), body=body, headers=headers or {})
+            response = connection.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            self._observe(method, path, 'error', started)
+            raise DockerUnavailable(f'Docker API request failed: {e}')
+        self._observe(method, path, response.status, started)
+
+        if response.status >= 400:
+            data = response.read()
+            connection.close()
+            raise DockerAPIError(_error_message(data, response.status), response.status)
+        return StreamResponse(connection, response)
+
+    def list_containers(self, project, service=None):
+        """List all containers (running or not) labelled with a compose project
+
+        With project None, containers of every compose project are listed.
+        """
+        labels = [f'{PROJECT_LABEL}={project}' if project else PROJECT_LABEL]
+        if service:
+            labels.append(f'{SERVICE_LABEL}={service}')
+        return self.get_json('/containers/json', {'all': 1, 'filters': {'label': labels}})
+
+
+def _error_message(data, status):
+    try:
+        return json.loads(data).get('message') or f'Docker API returned {status}'
+    except (ValueError, AttributeError):
+        return f'Docker API returned {status}'
@@ -0,0 +1,234 @@
+"""Push container status changes from one Docker /events subscription (or polling) to SSE clients"""
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+from .common import PROJECT_LABEL, SERVICE_LABEL
+
+# Container event actions that can change what the status listing shows
+_STATE_ACTIONS = {
+    'create', 'start', 'restart', 'die', 'stop', 'kill', 'pause', 'unpause',
+    'destroy', 'oom', 'rename', 'update',
+}
+
+
+def format_event(event, event_id, data):
+    """Encode one Server-Sent Events message"""
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class StatusEventHub:
+    """Keeps per-service container state from Docker events and fans deltas out to clients
+
+    A single background thread holds the /events subscription. Each change is
+    re-read with one service-filtered listing, compared with the previous state
+    and, when different, published as a numbered delta. Clients resume from a
+    Last-Event-ID while it is still in the history buffer, otherwise they get a
+    full snapshot.
+
+    The subscription only runs while clients are connected: the last one
+    leaving closes it and ends the thread. State is resynced with a full
+    listing each time the subscription (re)opens. While /events can't be
+    opened (socket down, CLI-only host), and always without `subscribe`
+    (several Docker hosts, which one local subscription can't cover), the
+    thread instead diffs a `poll()` listing every `poll_interval` seconds.
+    Subscription retries back off up to `max_retry_interval`.
+    """
+
+    def __init__(self, client, project, fetch, on_change=None, history=1000,
+                 heartbeat=15.0, retry_interval=5.0, max_retry_interval=300.0,
+                 poll=None, poll_interval=5.0, subscribe=True):
+        self.client = client
+        self.project = project
+        self.fetch = fetch
+        self.on_change = on_change
+        # Full listing to diff when there are no events, e.g. the shared status snapshot
+        self.poll = poll or fetch
+        self.poll_interval = poll_interval
+        self.subscribe = subscribe
+        self.heartbeat = heartbeat
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        # Event IDs are only meaningful within one process lifetime
+        self.epoch = uuid.uuid4().hex[:8]
+
+        self._state = {}
+        self._seq = 0
+        self._history = deque(maxlen=history)
+        self._cond = threading.Condition()
+        self._ready = threading.Event()
+        self._thread = None
+        self._response = None
+        self._closed = False
+        self.clients = 0
+
+    def _start(self):
+        # Called with self._cond held
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name=f'docker-events-{self.project}', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """Stop the subscription for good; connected clients see no further changes"""
+        with self._cond:
+            self._closed = True
+            response = self._response
+        if response is not None:
+            response.close()
+
+    def stream(self, last_event_id=None):
+        """Generator of SSE messages for one client"""
+        with self._cond:
+            # Counted before the thread is started so it can't stop again for lack of clients
+            self.clients += 1
+            self._start()
+        try:
+            self._ready.wait(timeout=10)
+            with self._cond:
+                position = self._resume_position(last_event_id)
+            yield from self._messages(position)
+        finally:
+            with self._cond:
+                self.clients -= 1
+                # The last client leaving ends the subscription
+                response = self._response if not self.clients else None
+            if response is not None:
+                response.close()
+
+    def _messages(self, position):
+
+        yield f'retry: {int(self.retry_interval * 1000)}\n\n'
+        if position is None:
+            position, message = self._snapshot_message()
+            yield message
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._seq > position, timeout=self.heartbeat)
+                if self._seq == position:
+                    pending = None
+                elif self._history and position + 1 < self._history[0][0]:
+                    # Fell out of the history buffer; resend everything
+                    pending = []
+                else:
+                    start = position + 1 - self._history[0][0]
+                    pending = list(itertools.islice(self._history, start, None))
+
+            if pending is None:
+                yield ': keepalive\n\n'
+            elif not pending:
+                position, message = self._snapshot_message()
+                yield message
+            else:
+                for seq, delta in pending:
+                    yield format_event('delta', f'{self.epoch}:{seq}', delta)
+                position = pending[-1][0]
+
+    def _resume_position(self, last_event_id):
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = self._history[0][0] if self._history else self._seq + 1
+        if seq > self._seq or seq + 1 < oldest:
+            return None
+        return seq
+
+    def _snapshot_message(self):
+        with self._cond:
+            seq = self._seq
+            containers = [c for group in self._state.values() for c in group]
+        containers.sort(key=lambda c: c['Name'])
+        return seq, format_event('snapshot', f'{self.epoch}:{seq}', {'containers': containers})
+
+    def _apply(self, service, containers, notify=True):
+        with self._cond:
+            if self._state.get(service, []) == containers:
+                return
+            if containers:
+                self._state[service] = containers
+            else:
+                self._state.pop(service, None)
+            self._seq += 1
+            self._history.append((self._seq, {'service': service, 'containers': containers}))
+            self._cond.notify_all()
+        if notify and self.on_change:
+            self.on_change(service)
+
+    def _resync(self, listing=None):
+        # A polled listing came from the status cache, so the cache needn't be told about its changes
+        notify = listing is None
+        grouped = {}
+        for container in self.fetch() if listing is None else listing():
+            grouped.setdefault(container.get('Service', ''), []).append(container)
+        with self._cond:
+            services = set(self._state) | set(grouped)
+        for service in sorted(services):
+            self._apply(service, grouped.get(service, []), notify)
+
+    def _run(self):
+        delay = self.retry_interval
+        retry_at = 0.0
+        while True:
+            with self._cond:
+                if not self.clients or self._closed:
+                    self._thread = None
+                    # The next client waits for a fresh resync instead of seeing stale state
+                    self._ready.clear()
+                    return
+            response = None
+            if self.subscribe and time.monotonic() >= retry_at:
+                try:
+                    response = self._subscribe()
+                except Exception:
+                    pass
+                if response is None:
+                    retry_at = time.monotonic() + delay
+                    delay = min(delay * 2, self.max_retry_interval)
+            if response is None:
+                # No event stream: diff a fresh listing until a subscription opens
+                try:
+                    self._resync(self.poll)
+                except Exception:
+                    pass
+                self._ready.set()
+                time.sleep(self.poll_interval)
+                continue
+
+            delay = self.retry_interval
+            try:
+                with response:
+                    # Resync on every (re)connect so nothing missed while disconnected is lost
+                    self._resync()
+                    self._ready.set()
+                    self._consume_events(response)
+            except Exception:
+                self._ready.set()
+            with self._cond:
+                self._response = None
+            time.sleep(self.retry_interval)
+
+    def _subscribe(self):
+        filters = {'type': ['container'], 'label': [f'{PROJECT_LABEL}={self.project}']}
+        response = self.client.stream('GET', '/events', {'filters': filters})
+        with self._cond:
+            if not self.clients or self._closed:
+                response.close()
+                return None
+            self._response = response
+        return response
+
+    def _consume_events(self, response):
+        for event in response.iter_json():
+            action = (event.get('Action') or event.get('status') or '').split(':')[0]
+            if action not in _STATE_ACTIONS and action != 'health_status':
+                continue
+            attributes = (event.get('Actor') or {}).get('Attributes') or {}
+            service = attributes.get(SERVICE_LABEL)
+            if service:
+                self._apply(service, self.fetch(service))
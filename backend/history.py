@@ -0,0 +1,410 @@
+"""SQLite store of container state transitions and container actions"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from .common import PROJECT_LABEL, SERVICE_LABEL, exclusive_lock, timestamp
+from .metrics import HISTORY_DROPPED
+
+# State recorded for a container that disappeared from a full listing
+REMOVED = 'removed'
+
+# Container event -> state it leaves the container in; kill and stop are followed by die
+_EVENT_STATES = {
+    'create': 'created',
+    'start': 'running',
+    'restart': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+    'destroy': REMOVED,
+}
+# A container becoming running again after one of these was restarted; its first start and unpausing are not restarts
+_DOWN_STATES = ('exited', 'dead', 'restarting')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transitions (
+    id INTEGER PRIMARY KEY,
+    at REAL NOT NULL,
+    project TEXT NOT NULL,
+    service TEXT NOT NULL,
+    container TEXT NOT NULL,
+    state TEXT NOT NULL,
+    previous TEXT
+);
+CREATE INDEX IF NOT EXISTS transitions_service ON transitions (project, service, at);
+CREATE INDEX IF NOT EXISTS transitions_container ON transitions (project, container, at);
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    at REAL NOT NULL,
+    project TEXT,
+    service TEXT,
+    action TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration REAL,
+    client TEXT,
+    job_id TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS actions_project ON actions (project, at);
+CREATE INDEX IF NOT EXISTS actions_service ON actions (project, service, at);
+'''
+
+
+def _container_key(name, host=None):
+    # Federated listings can hold the same container name on several hosts
+    return f'{host}/{name}' if host else name
+
+
+class HistoryStore:
+    """State transitions and actions in one SQLite database (WAL mode)
+
+    Callers only put records on a bounded queue, never touching the database;
+    when the queue is full records are dropped and counted. A writer thread
+    turns container listings into transitions by comparing them with the last
+    state it saw and commits everything queued in batches of up to
+    `batch_size` rows or every `flush_interval` seconds. Rows older than
+    `retention` seconds are pruned hourly.
+
+    Container state is fed by HistoryWatchers. Only the process holding the
+    lock file next to the database runs them (see claim()), so several
+    server workers don't record every transition several times.
+    """
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0, queue_size=10000, retention=90 * 86400):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=queue_size)
+        # (project, container) -> (service, state), as the writer last recorded them
+        self._states = {}
+        self._loaded = set()
+        self._local = threading.local()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._claim = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(_SCHEMA)
+        connection.commit()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        # WAL only needs syncing at checkpoints; a crash loses at most the last batch
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self):
+        # One read connection per thread; WAL lets them run alongside the writer
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def claim(self):
+        """Whether this process records container state; retried until the holder exits"""
+        with self._lock:
+            if self._claim is None:
+                self._claim = exclusive_lock(self.path + '.lock')
+            return self._claim is not None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+                self._thread.start()
+
+    def _put(self, record):
+        self.start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            HISTORY_DROPPED.inc()
+
+    def observe(self, project, containers, service=None, host=None):
+        """Queue a container listing of a project (or of one service, or one host's) to diff against the last one"""
+        states = [(_container_key(c['Name'], c.get('Host')), c.get('Service', ''), (c.get('State') or '').lower())
+                  for c in containers]
+        self._put(('observe', time.time(), project, service, host, states))
+
+    def record_state(self, project, service, container, state, at=None, host=None):
+        """Queue the state one container entered, from a Docker event"""
+        self._put(('state', at or time.time(), project, service, _container_key(container, host), state))
+
+    def record_action(self, project, service, action, outcome, duration=None, client=None, job_id=None,
+                      message=None, at=None):
+        """Queue one finished action for the audit log"""
+        self._put(('action', at or time.time(), project, service, action, outcome, duration, client, job_id,
+                   message))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is committed; returns False on timeout"""
+        done = threading.Event()
+        self._put(('flush', done))
+        return done.wait(timeout)
+
+    def _run(self):
+        connection = self._connect()
+        pruned_at = 0.0
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or batch[-1][0] == 'flush':
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(connection, batch)
+                if time.time() - pruned_at > 3600:
+                    pruned_at = time.time()
+                    cutoff = pruned_at - self.retention
+                    connection.execute('DELETE FROM transitions WHERE at < ?', (cutoff,))
+                    connection.execute('DELETE FROM actions WHERE at < ?', (cutoff,))
+                connection.commit()
+            except sqlite3.Error:
+                connection.rollback()
+            for record in batch:
+                if record[0] == 'flush':
+                    record[1].set()
+
+    def _write(self, connection, batch):
+        transitions = []
+        actions = []
+        for record in batch:
+            if record[0] == 'observe':
+                transitions.extend(self._diff(connection, *record[1:]))
+            elif record[0] == 'state':
+                transitions.extend(self._change(connection, *record[1:]))
+            elif record[0] == 'action':
+                actions.append(record[1:])
+        if transitions:
+            connection.executemany(
+                'INSERT INTO transitions (at, project, service, container, state, previous) '
+                'VALUES (?, ?, ?, ?, ?, ?)', transitions)
+        if actions:
+            connection.executemany(
+                'INSERT INTO actions (at, project, service, action, outcome, duration, client, job_id, message) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', actions)
+
+    def _load(self, connection, project):
+        if project not in self._loaded:
+            # Pick up where the last process left off instead of recording every container again
+            self._loaded.add(project)
+            rows = connection.execute(
+                'SELECT container, service, state, MAX(at) FROM transitions WHERE project = ? GROUP BY container',
+                (project,))
+            for container, row_service, state, _ in rows:
+                self._states[(project, container)] = (row_service, state)
+
+    def _change(self, connection, at, project, service, container, state):
+        self._load(connection, project)
+        previous = self._states.get((project, container))
+        if previous is not None and previous[1] == state:
+            return []
+        self._states[(project, container)] = (service, state)
+        return [(at, project, service, container, state, previous[1] if previous else None)]
+
+    def _diff(self, connection, at, project, service, host, states):
+        self._load(connection, project)
+        rows = []
+        seen = set()
+        for container, container_service, state in states:
+            seen.add(container)
+            previous = self._states.get((project, container))
+            if previous is None or previous[1] != state:
+                rows.append((at, project, container_service, container, state, previous[1] if previous else None))
+                self._states[(project, container)] = (container_service, state)
+
+        # Containers missing from a listing that should have included them were removed
+        for (known_project, container), (known_service, state) in list(self._states.items()):
+            if known_project != project or container in seen or state == REMOVED:
+                continue
+            if host is not None and not container.startswith(f'{host}/'):
+                continue
+            if service is None or known_service == service:
+                rows.append((at, project, known_service, container, REMOVED, state))
+                self._states[(project, container)] = (known_service, REMOVED)
+        return rows
+
+    def uptime(self, project, since, service=None, now=None):
+        """Per service: seconds observed, seconds with a running container and restarts since `since`
+
+        A service counts as up while any of its containers is running. Time
+        before the first recorded state is not counted as observed.
+        """
+        now = now or time.time()
+        filters, params = ('AND service = ?', [service]) if service else ('', [])
+        connection = self._reader()
+        # Each container's state as of `since`, then everything that happened after
+        baseline = connection.execute(
+            f'SELECT service, container, state, MAX(at) FROM transitions '
+            f'WHERE project = ? AND at < ? {filters} GROUP BY container', [project, since] + params).fetchall()
+        changes = connection.execute(
+            f'SELECT service, container, state, at FROM transitions WHERE project = ? AND at >= ? {filters} '
+            f'ORDER BY at, id', [project, since] + params).fetchall()
+
+        timelines = {}
+        for row_service, container, state, _ in baseline:
+            timelines.setdefault(row_service, []).append((since, container, state))
+        for row_service, container, state, at in changes:
+            timelines.setdefault(row_service, []).append((at, container, state))
+
+        restarts = dict(connection.execute(
+            f'SELECT service, COUNT(*) FROM transitions WHERE project = ? AND at >= ? {filters} '
+            f"AND state = 'running' AND previous IN ({', '.join('?' * len(_DOWN_STATES))}) GROUP BY service",
+            [project, since] + params + list(_DOWN_STATES)).fetchall())
+
+        results = []
+        for row_service, timeline in sorted(timelines.items()):
+            running = set()
+            observed = up = 0.0
+            for i, (at, container, state) in enumerate(timeline):
+                if state == 'running':
+                    running.add(container)
+                else:
+                    running.discard(container)
+                end = timeline[i + 1][0] if i + 1 < len(timeline) else now
+                observed += end - at
+                if running:
+                    up += end - at
+            results.append({
+                'service': row_service,
+                'uptime_percent': round(100.0 * up / observed, 3) if observed else None,
+                'observed_seconds': round(observed, 3),
+                'running_seconds': round(up, 3),
+                'restarts': restarts.get(row_service, 0),
+                'first_seen': timestamp(timeline[0][0]),
+            })
+        return results
+
+    def actions(self, project, service=None, since=None, limit=100):
+        """Most recent actions first"""
+        query = 'SELECT at, service, action, outcome, duration, client, job_id, message FROM actions WHERE project = ?'
+        params = [project]
+        if service:
+            query += ' AND service = ?'
+            params.append(service)
+        if since is not None:
+            query += ' AND at >= ?'
+            params.append(since)
+        query += ' ORDER BY at DESC LIMIT ?'
+        params.append(limit)
+        return [
+            {
+                'at': timestamp(at),
+                'service': row_service,
+                'action': action,
+                'outcome': outcome,
+                'duration': duration,
+                'client': client,
+                'job_id': job_id,
+                'message': message,
+            }
+            for at, row_service, action, outcome, duration, client, job_id, message
+            in self._reader().execute(query, params)
+        ]
+
+
+class HistoryWatcher:
+    """Feeds a project's container state on one Docker host to the history store, viewers or not
+
+    Holds its own /events subscription and records the state every
+    create/start/die/pause/destroy event leaves a container in, at the time of
+    the event, so restarts faster than any poll are counted. Each time the
+    subscription (re)opens, one full listing catches up on what was missed.
+    Without an event stream (socket down, CLI-only host) the project is listed
+    every `poll_interval` seconds instead, while the subscription is retried.
+    """
+
+    def __init__(self, store, client, project, list_containers, host=None, poll_interval=30.0,
+                 retry_interval=5.0):
+        self.store = store
+        self.client = client
+        self.project = project
+        self.list_containers = list_containers
+        self.host = host
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._response = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and not self._closed.is_set():
+                name = f'history-{self.project}' + (f'-{self.host}' if self.host else '')
+                self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+                self._thread.start()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            response = self._response
+        if response is not None:
+            response.close()
+
+    def _run(self):
+        while not self._closed.is_set():
+            # Another server worker holds the database lock and does the recording
+            if not self.store.claim():
+                self._closed.wait(self.poll_interval)
+                continue
+            try:
+                response = self._subscribe()
+            except Exception:
+                response = None
+            if response is None:
+                self._observe()
+                self._closed.wait(self.poll_interval)
+                continue
+            try:
+                with response:
+                    self._observe()
+                    self._consume(response)
+            except Exception:
+                pass
+            with self._lock:
+                self._response = None
+            self._closed.wait(self.retry_interval)
+
+    def _subscribe(self):
+        filters = {'type': ['container'], 'label': [f'{PROJECT_LABEL}={self.project}'],
+                   'event': sorted(_EVENT_STATES)}
+        response = self.client.stream('GET', '/events', {'filters': filters})
+        with self._lock:
+            if self._closed.is_set():
+                response.close()
+                return None
+            self._response = response
+        return response
+
+    def _observe(self):
+        try:
+            containers = self.list_containers()
+        except Exception:
+            # Nothing is known about this round; the last recorded states stand
+            return
+        self.store.observe(self.project, containers, host=self.host)
+
+    def _consume(self, response):
+        for event in response.iter_json():
+            action = (event.get('Action') or event.get('status') or '').split(':')[0]
+            state = _EVENT_STATES.get(action)
+            attributes = (event.get('Actor') or {}).get('Attributes') or {}
+            if state is None or not attributes.get('name'):
+                continue
+            at = event['timeNano'] / 1e9 if event.get('timeNano') else event.get('time')
+            self.store.record_state(self.project, attributes.get(SERVICE_LABEL, ''), attributes['name'], state,
+                                    at, self.host)
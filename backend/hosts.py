@@ -0,0 +1,171 @@
+"""Fan requests out to several Docker hosts with per-host timeouts and circuit breakers"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from urllib.parse import parse_qs, urlparse
+
+from .common import SERVICE_LABEL
+from .containers import summary_from_api
+from .docker_api import DockerAPIError, DockerClient
+
+# Host states reported next to federated results
+OK = 'ok'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+CIRCUIT_OPEN = 'circuit_open'
+
+
+class CircuitBreaker:
+    """Stops calling a host after repeated failures and retries it after reset_timeout
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are refused; once `reset_timeout` seconds have passed one trial call is let
+    through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class DockerHost:
+    """One Docker endpoint of the federation"""
+
+    def __init__(self, name, url, timeout=5.0, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.url = url
+        self.timeout = timeout
+        # The socket timeout bounds calls the federation has stopped waiting for
+        self.client = DockerClient(url, timeout=timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def describe(self, status, duration=None, error=None):
+        report = {'name': self.name, 'url': self.url, 'status': status, 'circuit': self.breaker.state}
+        if duration is not None:
+            report['duration'] = round(duration, 3)
+        if error:
+            report['error'] = error
+        return report
+
+
+def parse_hosts(value, timeout=5.0, failure_threshold=3, reset_timeout=30.0):
+    """DockerHosts from 'local=unix:///var/run/docker.sock,nas=tcp://10.0.0.5:2375?timeout=2'"""
+    hosts = []
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, url = entry.partition('=')
+        if not sep or '://' in name:
+            name, url = '', entry
+        parsed = urlparse(url)
+        host_timeout = float(parse_qs(parsed.query).get('timeout', [timeout])[0])
+        url = url.partition('?')[0]
+        name = name or parsed.hostname or 'local'
+        hosts.append(DockerHost(name, url, host_timeout, failure_threshold, reset_timeout))
+    return hosts
+
+
+class HostFederation:
+    """Runs one call per host concurrently and merges whatever answered in time
+
+    A host that fails, is slower than its own timeout or has an open circuit
+    is reported instead of delaying or failing the whole response.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        # Twice the hosts so calls still finishing after a timeout don't starve new ones
+        self._pool = ThreadPoolExecutor(max_workers=max(2, 2 * len(hosts)), thread_name_prefix='docker-host')
+
+    def fan_out(self, fn):
+        """({host name: fn(host)} for the hosts that answered, [host report, ...])"""
+        started = time.monotonic()
+        futures = {}
+        reports = {}
+        for host in self.hosts:
+            if host.breaker.allow():
+                futures[host] = self._pool.submit(fn, host)
+            else:
+                reports[host.name] = host.describe(CIRCUIT_OPEN, error='Skipped after repeated failures')
+
+        results = {}
+        for host, future in futures.items():
+            remaining = host.timeout - (time.monotonic() - started)
+            try:
+                results[host.name] = future.result(timeout=max(0.0, remaining))
+            except FutureTimeout:
+                host.breaker.record_failure()
+                reports[host.name] = host.describe(TIMEOUT, time.monotonic() - started,
+                                                   f'No answer within {host.timeout:g}s')
+                continue
+            except (DockerAPIError, OSError, ValueError) as e:
+                host.breaker.record_failure()
+                reports[host.name] = host.describe(ERROR, time.monotonic() - started, str(e))
+                continue
+            host.breaker.record_success()
+            reports[host.name] = host.describe(OK, time.monotonic() - started)
+
+        return results, [reports[host.name] for host in self.hosts]
+
+    def list_containers(self, project, service=None):
+        """Container summaries of a project from every host, each tagged with its Host"""
+        results, reports = self.fan_out(lambda host: host.client.list_containers(project, service))
+        containers = []
+        for host in self.hosts:
+            for container in results.get(host.name, []):
+                summary = summary_from_api(container)
+                summary['Host'] = host.name
+                containers.append(summary)
+        containers.sort(key=lambda c: (c['Name'], c['Host']))
+        for report in reports:
+            if report['name'] in results:
+                report['containers'] = len(results[report['name']])
+        return containers, reports
+
+    def services(self, project):
+        """Compose services of a project per host, from its containers' labels"""
+        results, reports = self.fan_out(lambda host: host.client.list_containers(project))
+        services = {}
+        for name, containers in results.items():
+            services[name] = sorted({(c.get('Labels') or {}).get(SERVICE_LABEL, '') for c in containers} - {''})
+        for report in reports:
+            if report['name'] in services:
+                report['services'] = services[report['name']]
+        return services, reports
@@ -0,0 +1,205 @@
+"""Image references, registry credentials and streamed image pulls"""
+import base64
+import json
+import os
+import time
+from urllib.parse import quote
+
+from .commands import SLOTS, CommandCancelled, run_command
+from .docker_api import DockerAPIError
+
+DEFAULT_REGISTRY = 'docker.io'
+# Key Docker Hub credentials are stored under in ~/.docker/config.json
+_DOCKER_HUB_AUTH_KEY = 'https://index.docker.io/v1/'
+
+# Layer statuses after which all of a layer's bytes are downloaded
+_DOWNLOADED_STATUSES = ('Download complete', 'Verifying Checksum', 'Extracting', 'Pull complete')
+
+
+class ImageReference:
+    """A parsed image reference such as ghcr.io/owner/app:1.2 or nginx@sha256:..."""
+
+    def __init__(self, reference):
+        self.reference = reference
+        name, _, digest = reference.partition('@')
+        tag = None
+        # A ':' after the last '/' separates the tag (earlier ones are registry ports)
+        if ':' in name.rsplit('/', 1)[-1]:
+            name, tag = name.rsplit(':', 1)
+        self.digest = digest or None
+        self.tag = tag or (None if digest else 'latest')
+
+        first, sep, rest = name.partition('/')
+        if sep and ('.' in first or ':' in first or first == 'localhost'):
+            self.registry, self.repository = first, rest
+        else:
+            self.registry, self.repository = DEFAULT_REGISTRY, name
+        if self.registry == DEFAULT_REGISTRY and '/' not in self.repository:
+            self.repository = f'library/{self.repository}'
+        self.name = name
+
+    @property
+    def version(self):
+        """Tag or digest, as the Engine API expects it in ?tag="""
+        return self.digest or self.tag
+
+    def __str__(self):
+        return self.reference
+
+
+def registry_auth(registry):
+    """Credentials for a registry from the Docker CLI config, or None
+
+    Only inline 'auth' entries are supported; credential helpers are not.
+    """
+    config_dir = os.getenv('DOCKER_CONFIG') or os.path.join(os.path.expanduser('~'), '.docker')
+    try:
+        with open(os.path.join(config_dir, 'config.json')) as file:
+            auths = json.load(file).get('auths') or {}
+    except (OSError, ValueError):
+        return None
+
+    keys = [_DOCKER_HUB_AUTH_KEY, 'docker.io', 'index.docker.io'] if registry == DEFAULT_REGISTRY else [registry]
+    for key in keys:
+        for candidate in (key, f'https://{key}'):
+            entry = auths.get(candidate)
+            if entry and entry.get('auth'):
+                username, _, password = base64.b64decode(entry['auth']).decode().partition(':')
+                return {'username': username, 'password': password, 'serveraddress': key}
+    return None
+
+
+def image_id(client, reference):
+    """Local image ID for a reference (None when the image is not present)
+
+    Uses the Engine API and falls back to `docker image inspect`.
+    """
+    try:
+        return client.get_json(f'/images/{quote(reference, safe="")}/json')['Id']
+    except DockerAPIError as e:
+        if e.status_code == 404:
+            return None
+    try:
+        result = run_command(['docker', 'image', 'inspect', '--format', '{{.Id}}', reference], timeout=30)
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+
+def repo_digests(client, reference):
+    """Registry digests ('name@sha256:...') of a local image; None when the image is not present
+
+    Uses the Engine API and falls back to `docker image inspect`. Raises
+    DockerAPIError when neither can tell whether the image is present.
+    """
+    try:
+        return client.get_json(f'/images/{quote(reference, safe="")}/json').get('RepoDigests') or []
+    except DockerAPIError as e:
+        if e.status_code == 404:
+            return None
+        error = e
+    try:
+        result = run_command(['docker', 'image', 'inspect', '--format', '{{json .RepoDigests}}', reference],
+                             timeout=30)
+    except OSError:
+        raise error
+    if result.returncode != 0:
+        if 'no such image' in result.stderr.lower():
+            return None
+        raise DockerAPIError(result.stderr.strip() or str(error))
+    try:
+        return json.loads(result.stdout) or []
+    except ValueError:
+        return []
+
+
+class PullProgress:
+    """Aggregates the per-layer messages of an /images/create stream"""
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.layers = {}
+        self.status = 'Pulling'
+
+    def update(self, message):
+        """Apply one stream message; returns True when a layer changed state"""
+        layer_id = message.get('id')
+        status = message.get('status', '')
+        if not layer_id or status.startswith(('Pulling from', 'Digest:', 'Status:')):
+            self.status = status or self.status
+            return True
+
+        layer = self.layers.setdefault(layer_id, {'status': '', 'current': 0, 'total': 0})
+        changed = layer['status'] != status
+        layer['status'] = status
+        detail = message.get('progressDetail') or {}
+        if status == 'Downloading':
+            layer['current'] = detail.get('current', layer['current'])
+            layer['total'] = detail.get('total', layer['total'])
+        elif status in _DOWNLOADED_STATUSES:
+            layer['current'] = layer['total']
+        return changed
+
+    def to_dict(self):
+        current = sum(layer['current'] for layer in self.layers.values())
+        total = sum(layer['total'] for layer in self.layers.values())
+        done = sum(1 for layer in self.layers.values() if layer['status'] in ('Pull complete', 'Already exists'))
+        return {
+            'image': self.reference,
+            'status': self.status,
+            'layers': {layer_id: dict(layer) for layer_id, layer in self.layers.items()},
+            'layers_done': done,
+            'layers_total': len(self.layers),
+            'current': current,
+            'total': total,
+            'percent': round(100.0 * current / total, 1) if total else None,
+        }
+
+
+def pull_image(client, reference, report=None, cancel_event=None, timeout=300, interval=0.25):
+    """Pull an image through the Engine API, reading the progress stream incrementally
+
+    report(progress_dict) is called at most every `interval` seconds (and
+    whenever a layer changes state). Raises DockerAPIError on pull errors,
+    CommandCancelled when cancel_event is set. Takes a heavy slot like
+    `docker-compose pull` does.
+    """
+    with SLOTS.slot(heavy=True, cancel_event=cancel_event):
+        return _pull(client, reference, report, cancel_event, timeout, interval)
+
+
+def _pull(client, reference, report, cancel_event, timeout, interval):
+    image = ImageReference(reference)
+    headers = {}
+    auth = registry_auth(image.registry)
+    if auth:
+        headers['X-Registry-Auth'] = base64.urlsafe_b64encode(json.dumps(auth).encode()).decode()
+
+    progress = PullProgress(reference)
+    deadline = time.monotonic() + timeout
+    last_report = 0.0
+    params = {'fromImage': image.name, 'tag': image.version}
+    # Per-read socket timeout; the overall deadline is checked between messages
+    with client.stream('POST', '/images/create', params, headers=headers, timeout=timeout) as response:
+        try:
+            for message in response.iter_json():
+                if message.get('error'):
+                    raise DockerAPIError(message['error'])
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CommandCancelled(f'pull {reference}')
+                if time.monotonic() > deadline:
+                    raise DockerAPIError(f'Pull of {reference} timed out')
+
+                changed = progress.update(message)
+                now = time.monotonic()
+                if report and (changed or now - last_report >= interval):
+                    last_report = now
+                    report(progress.to_dict())
+        except (OSError, ValueError) as e:
+            raise DockerAPIError(f'Pull of {reference} failed: {e}')
+
+    if report:
+        report(progress.to_dict())
+    return progress
@@ -0,0 +1,304 @@
+"""Background job engine for long-running container actions"""
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from .commands import CommandCancelled
+from .common import timestamp
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Result payload 'status' -> job status; anything else means the job failed
+_RESULT_STATUS = {'success': SUCCEEDED, 'cancelled': CANCELLED}
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at its limit"""
+
+    def __init__(self, message, retry_after=1, status_code=429):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class Job:
+    """One queued or running unit of work and, once finished, its result"""
+
+    def __init__(self, action, service, fn, project=None, client=None, key=None, locks=None, heavy=False):
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.service = service
+        self.project = project
+        # Who asked for the job (address or X-Client-Id), for the audit log and fair scheduling
+        self.client = client
+        # Identical submissions share one job while it is queued or running
+        self.key = key
+        # Services the job acts on; jobs sharing one never run at the same time
+        if locks is None:
+            locks = [service] if service else []
+        self.locks = frozenset((project, name) for name in locks)
+        self.heavy = heavy
+        self.fn = fn
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = None
+        # Bumped on every progress report and when the job finishes
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self.done = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def report(self, progress):
+        """Publish progress of the running job to anyone following it"""
+        with self._changed:
+            self.progress = progress
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        """Wait until the job's version moves past `version`; returns the current version"""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def _touch(self):
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def to_dict(self):
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            'id': self.id,
+            'action': self.action,
+            'project': self.project,
+            'service': self.service,
+            'client': self.client,
+            'status': self.status,
+            'created_at': timestamp(self.created_at),
+            'started_at': timestamp(self.started_at),
+            'finished_at': timestamp(self.finished_at),
+            'duration': duration,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """Runs jobs on a bounded pool of worker threads and keeps recent results
+
+    A job's fn receives the job (for job.cancel_event) and returns its result
+    payload; a payload 'status' of 'success' or 'cancelled' sets the job status,
+    anything else marks the job failed.
+
+    Scheduling: queued jobs are kept per client and workers take them round
+    robin, so one client's burst doesn't starve the others. A job waits while
+    another job holding one of its service locks runs, or while
+    `heavy_workers` heavy jobs (pulls) run; workers skip ahead to jobs that
+    can start. Submitting a job with the key of a queued or running one
+    returns that job instead. More than `max_queued` queued jobs raise
+    JobQueueFull.
+
+    Finished jobs are evicted after retention seconds or once more than
+    max_finished of them are kept.
+    """
+
+    def __init__(self, workers=4, retention=3600, max_finished=200, max_queued=100, heavy_workers=2):
+        self.workers = workers
+        self.retention = retention
+        self.max_finished = max_finished
+        self.max_queued = max_queued
+        self.heavy_workers = heavy_workers
+
+        self._jobs = OrderedDict()
+        # client -> its queued jobs; clients are served in this order, then moved to the end
+        self._queues = OrderedDict()
+        self._queued = 0
+        # key -> queued or running job, for collapsing identical submissions
+        self._inflight = {}
+        self._locked = set()
+        self._heavy_running = 0
+        # Moving average of job durations, for Retry-After estimates
+        self._average_duration = 1.0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._listeners = []
+        self._running = 0
+
+    def on_finish(self, callback):
+        """Register callback(job), called after every job finishes"""
+        self._listeners.append(callback)
+
+    def submit(self, action, service, fn, project=None, client=None, key=None, locks=None, heavy=False):
+        """Queue a job; returns the queued or running job with the same key instead when there is one"""
+        with self._cond:
+            if key is not None and key in self._inflight:
+                return self._inflight[key]
+            if self._queued >= self.max_queued:
+                raise JobQueueFull(f'Job queue is full ({self._queued} jobs waiting)', self._retry_after())
+            job = Job(action, service, fn, project, client, key, locks, heavy)
+            self._evict()
+            self._jobs[job.id] = job
+            self._queues.setdefault(client or '', deque()).append(job)
+            self._queued += 1
+            if key is not None:
+                self._inflight[key] = job
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self, status=None, project=None):
+        with self._cond:
+            self._evict()
+            jobs = list(self._jobs.values())
+        if status:
+            jobs = [job for job in jobs if job.status == status]
+        if project:
+            jobs = [job for job in jobs if job.project == project]
+        return jobs
+
+    def cancel(self, job_id):
+        """Cancel a job; queued jobs never run, running ones have their command killed"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job.cancel_event.set()
+            if job.status != QUEUED:
+                return job
+            self._dequeue(job)
+            self._finish(job, CANCELLED, error='Cancelled before it started')
+            self._cond.notify_all()
+        self._notify(job)
+        return job
+
+    def wait(self, job, timeout=None):
+        """Block until the job finished; returns False on timeout"""
+        return job.done.wait(timeout)
+
+    def drain(self, timeout=None):
+        """Block until no job is queued or running; returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queued and not self._running, timeout)
+
+    def _retry_after(self):
+        # Called with self._cond held: roughly when the jobs ahead will have made room
+        return max(1, min(300, math.ceil(self._average_duration * self._queued / max(1, self.workers))))
+
+    def _runnable(self, job):
+        if job.locks & self._locked:
+            return False
+        return not job.heavy or self._heavy_running < self.heavy_workers
+
+    def _next_job(self):
+        # Called with self._cond held; the first runnable job, taking clients in turn
+        for client, queue in self._queues.items():
+            for job in queue:
+                if self._runnable(job):
+                    self._dequeue(job)
+                    if client in self._queues:
+                        self._queues.move_to_end(client)
+                    return job
+        return None
+
+    def _dequeue(self, job):
+        # Called with self._cond held
+        client = job.client or ''
+        queue = self._queues[client]
+        queue.remove(job)
+        if not queue:
+            del self._queues[client]
+        self._queued -= 1
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f'job-worker-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                job.status = RUNNING
+                job.started_at = time.time()
+                self._running += 1
+                self._locked |= job.locks
+                self._heavy_running += job.heavy
+
+            try:
+                result = job.fn(job)
+                status = _RESULT_STATUS.get((result or {}).get('status'), FAILED)
+                finish = {'result': result}
+            except CommandCancelled:
+                status, finish = CANCELLED, {'error': 'Cancelled while running'}
+            except Exception as e:
+                status, finish = FAILED, {'error': str(e)}
+
+            with self._cond:
+                self._finish(job, status, **finish)
+                self._running -= 1
+                self._locked -= job.locks
+                self._heavy_running -= job.heavy
+                self._average_duration += 0.2 * (job.finished_at - job.started_at - self._average_duration)
+            self._notify(job)
+            with self._cond:
+                # Wakes drain() once listeners have seen the job finish, and workers
+                # waiting for the locks it released
+                self._cond.notify_all()
+
+    def _finish(self, job, status, result=None, error=None):
+        # Called with self._cond held
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        job.fn = None
+        if job.key is not None and self._inflight.get(job.key) is job:
+            del self._inflight[job.key]
+
+    def _notify(self, job):
+        # Listeners run before waiters are released so they observe their effects
+        for listener in self._listeners:
+            try:
+                listener(job)
+            except Exception:
+                pass
+        job.done.set()
+        job._touch()
+
+    def _evict(self):
+        # Called with self._cond held; jobs are kept in submission order
+        cutoff = time.time() - self.retention
+        finished = [job for job in self._jobs.values() if job.finished]
+        excess = len(finished) - self.max_finished
+        for job in finished:
+            if excess > 0 or job.finished_at < cutoff:
+                del self._jobs[job.id]
+                excess -= 1
@@ -0,0 +1,444 @@
+"""Container log tailing with bounded memory and a shared per-service ring buffer"""
+import calendar
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from .docker_api import DockerAPIError
+from .metrics import CACHE_REQUESTS
+
+STDOUT = 1
+STDERR = 2
+
+# Content-Type Docker (API >= 1.42) uses for stdout/stderr multiplexed log streams
+_MULTIPLEXED = 'application/vnd.docker.multiplexed-stream'
+_RAW = 'application/vnd.docker.raw-stream'
+
+# Written to a quiet follow stream so disconnected clients and a draining server are noticed
+_KEEPALIVE = b'\n'
+
+_DURATION_RE = re.compile(r'^(\d+(?:\.\d+)?)([smhd])$')
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+class LogError(Exception):
+    """Raised for invalid log requests or containers that cannot be found"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_duration(value):
+    """Seconds in a duration like 90s, 10m, 2h or 7d (None if it isn't one)"""
+    match = _DURATION_RE.match(value)
+    if not match:
+        return None
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def parse_since(value, now=None):
+    """Unix time from a unix timestamp, an RFC 3339 time or a duration like 10m"""
+    if value is None or value == '':
+        return None
+    duration = parse_duration(value)
+    if duration is not None:
+        return (now or time.time()) - duration
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        raise LogError(f'Invalid since value: {value}')
+
+
+def timestamp_seconds(stamp):
+    """Unix time of a Docker RFC 3339 nanosecond log timestamp (None if malformed)"""
+    seconds, _, fraction = stamp.rstrip('Z').partition('.')
+    try:
+        whole = calendar.timegm(time.strptime(seconds, '%Y-%m-%dT%H:%M:%S'))
+        return whole + float(f'0.{fraction or 0}')
+    except ValueError:
+        return None
+
+
+def iter_frames(response, tty, chunk_size=65536):
+    """Yield (stream, bytes) pieces of a log stream
+
+    Multiplexed streams carry an 8-byte header per frame: stream id, three
+    padding bytes and a big-endian payload length. Payloads are read into one
+    reusable buffer in chunks of at most chunk_size bytes, so a huge frame is
+    never held in memory as a whole.
+    """
+    if tty:
+        while True:
+            chunk = response.read1(chunk_size)
+            if not chunk:
+                return
+            yield STDOUT, chunk
+
+    header = bytearray(8)
+    header_view = memoryview(header)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        if _read_exactly(response, header_view) < 8:
+            return
+        stream = header[0]
+        remaining = int.from_bytes(header[4:8], 'big')
+        while remaining:
+            size = _read_exactly(response, view[:min(remaining, chunk_size)])
+            if not size:
+                return
+            remaining -= size
+            yield stream, bytes(view[:size])
+
+
+def _read_exactly(response, view):
+    filled = 0
+    while filled < len(view):
+        size = response.readinto(view[filled:])
+        if not size:
+            break
+        filled += size
+    return filled
+
+
+class _LineSplitter:
+    """Turns stream chunks into complete lines, truncating lines over max_line bytes"""
+
+    def __init__(self, max_line):
+        self.max_line = max_line
+        self.partial = {}
+        # Streams whose current line was truncated; the rest of it is discarded
+        self.skipping = set()
+
+    def reset(self):
+        self.partial.clear()
+        self.skipping.clear()
+
+    def feed(self, stream, chunk):
+        if stream in self.skipping:
+            newline = chunk.find(b'\n')
+            if newline < 0:
+                return
+            self.skipping.discard(stream)
+            chunk = chunk[newline + 1:]
+        lines = (self.partial.pop(stream, b'') + chunk).split(b'\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line[:self.max_line] + b'\n'
+        if len(tail) > self.max_line:
+            # Never buffer more than max_line bytes of an unterminated line
+            self.skipping.add(stream)
+            yield tail[:self.max_line] + b'\n'
+        elif tail:
+            self.partial[stream] = tail
+
+
+class _Follower:
+    """A client following a session; its backlog is bounded and drops the oldest lines"""
+
+    def __init__(self, backlog):
+        self.queue = deque(maxlen=backlog)
+        self.dropped = 0
+
+
+class LogSession:
+    """One upstream log stream of a container, buffered and fanned out to followers
+
+    The session first reads the last `capacity` lines (with timestamps), then
+    follows from the newest timestamp. Lines are (stream, timestamp, unix time,
+    bytes).
+    """
+
+    def __init__(self, client, container_id, tty, capacity, max_line, backlog):
+        self.client = client
+        self.container_id = container_id
+        self.tty = tty
+        self.capacity = capacity
+        self.backlog = backlog
+        self.lines = deque(maxlen=capacity)
+        # True while the buffer holds the container's entire log history
+        self.complete = False
+        self.closed = False
+        self.ready = threading.Event()
+        self.last_access = time.monotonic()
+        self._splitter = _LineSplitter(max_line)
+        self._followers = set()
+        self._cond = threading.Condition()
+        self._response = None
+        self._thread = threading.Thread(target=self._run, name=f'logs-{container_id[:12]}', daemon=True)
+        self._thread.start()
+
+    @property
+    def idle(self):
+        with self._cond:
+            return not self._followers
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            response = self._response
+            self._cond.notify_all()
+        if response is not None:
+            response.close()
+
+    def recent(self, tail=None, since=None):
+        """Buffered lines newer than since, at most the last `tail` of them"""
+        self.last_access = time.monotonic()
+        with self._cond:
+            return self._select(tail, since)
+
+    def can_serve(self, tail, since):
+        """Whether the buffer alone holds everything a request asks for"""
+        with self._cond:
+            if not self.ready.is_set() or self.closed:
+                return False
+            if self.complete:
+                return True
+            if tail is None:
+                return False
+            if since is not None and (not self.lines or self.lines[0][2] > since):
+                return False
+            return tail <= len(self.lines)
+
+    def follow(self, tail=None, since=None):
+        """Register a follower; returns (backlog lines, follower) atomically"""
+        self.last_access = time.monotonic()
+        follower = _Follower(self.backlog)
+        with self._cond:
+            self._followers.add(follower)
+            return self._select(tail, since), follower
+
+    def unfollow(self, follower):
+        self.last_access = time.monotonic()
+        with self._cond:
+            self._followers.discard(follower)
+
+    def next_lines(self, follower, timeout=15.0):
+        """Wait for lines for a follower; returns (lines, dropped count, closed)"""
+        with self._cond:
+            self._cond.wait_for(lambda: follower.queue or self.closed, timeout)
+            lines = list(follower.queue)
+            follower.queue.clear()
+            dropped, follower.dropped = follower.dropped, 0
+            return lines, dropped, self.closed and not lines
+
+    def _select(self, tail, since):
+        lines = self.lines
+        if since is not None:
+            lines = [line for line in lines if line[2] >= since]
+        lines = list(lines)
+        if tail is not None:
+            lines = lines[-tail:] if tail else []
+        return lines
+
+    def _append(self, stream, chunk, after=None):
+        for raw in self._splitter.feed(stream, chunk):
+            stamp, _, text = raw.partition(b' ')
+            stamp = stamp.decode('ascii', 'replace')
+            seconds = timestamp_seconds(stamp)
+            if seconds is None:
+                seconds = self.lines[-1][2] if self.lines else 0.0
+            # 'since' has whole-second precision on older daemons: skip lines already buffered
+            if after is not None and seconds <= after:
+                continue
+            line = (stream, stamp, seconds, text)
+            with self._cond:
+                if len(self.lines) == self.capacity:
+                    self.complete = False
+                self.lines.append(line)
+                for follower in self._followers:
+                    if len(follower.queue) == follower.queue.maxlen:
+                        follower.dropped += 1
+                    follower.queue.append(line)
+                self._cond.notify_all()
+
+    def _open(self, params):
+        params = dict(params, stdout=1, stderr=1, timestamps=1)
+        response = self.client.stream('GET', f'/containers/{self.container_id}/logs', params)
+        with self._cond:
+            if self.closed:
+                response.close()
+                return None
+            self._response = response
+        return response
+
+    def _run(self):
+        try:
+            # Seed the ring buffer from the last `capacity` lines
+            response = self._open({'tail': self.capacity})
+            if response is None:
+                return
+            with response:
+                for stream, chunk in iter_frames(response, self.tty):
+                    self._append(stream, chunk)
+            with self._cond:
+                self.complete = len(self.lines) < self.capacity
+            self.ready.set()
+
+            # Then follow everything after the newest buffered line
+            self._splitter.reset()
+            newest = self.lines[-1][2] if self.lines else None
+            response = self._open({'follow': 1, 'since': f'{newest or 0:.9f}'})
+            if response is None:
+                return
+            with response:
+                for stream, chunk in iter_frames(response, self.tty):
+                    self._append(stream, chunk, after=newest)
+        except (OSError, ValueError, DockerAPIError):
+            pass
+        except Exception:
+            # close() from another thread pulled the connection out from under the read
+            if not self.closed:
+                raise
+        finally:
+            self.ready.set()
+            with self._cond:
+                self.closed = True
+                self._cond.notify_all()
+
+
+class LogManager:
+    """Serves container logs from per-service sessions, streaming upstream only when needed
+
+    A reaper thread runs while sessions exist and closes those without
+    followers that nobody has read for `linger` seconds, so an upstream follow
+    stream doesn't outlive its last viewer by more than that.
+    """
+
+    def __init__(self, client, project, buffer_lines=1000, max_line=16384, client_backlog=1000,
+                 linger=60.0):
+        self.client = client
+        self.project = project
+        self.buffer_lines = buffer_lines
+        self.max_line = max_line
+        self.client_backlog = client_backlog
+        self.linger = linger
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._closed = threading.Event()
+
+    def _container(self, service):
+        containers = self.client.list_containers(self.project, service)
+        if not containers:
+            raise LogError(f'No container found for service {service}', 404)
+        # Prefer a running container, then the most recently created one
+        containers.sort(key=lambda c: (c.get('State') == 'running', c.get('Created', 0)), reverse=True)
+        return containers[0]
+
+    def close(self):
+        """Close every session and stop the reaper"""
+        self._closed.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _session(self, container):
+        container_id = container['Id']
+        with self._lock:
+            if self._closed.is_set():
+                raise LogError(f'Project {self.project} is no longer managed', 404)
+            self._reap()
+            session = self._sessions.get(container_id)
+            if session is None or session.closed:
+                tty = self._is_tty(container_id)
+                session = LogSession(self.client, container_id, tty, self.buffer_lines, self.max_line,
+                                     self.client_backlog)
+                self._sessions[container_id] = session
+                if self._reaper is None:
+                    self._reaper = threading.Thread(target=self._reap_loop, name=f'logs-reaper-{self.project}',
+                                                    daemon=True)
+                    self._reaper.start()
+            return session
+
+    def _is_tty(self, container_id):
+        details = self.client.get_json(f'/containers/{container_id}/json')
+        return bool((details.get('Config') or {}).get('Tty'))
+
+    def _reap(self):
+        # Called with self._lock held: stop sessions nobody has used for `linger` seconds
+        now = time.monotonic()
+        for container_id, session in list(self._sessions.items()):
+            if session.closed or (session.idle and now - session.last_access > self.linger):
+                session.close()
+                del self._sessions[container_id]
+
+    def _reap_loop(self):
+        # Checks twice per linger period; ends once the last session is gone
+        while not self._closed.wait(max(1.0, self.linger / 2)):
+            with self._lock:
+                self._reap()
+                if not self._sessions:
+                    self._reaper = None
+                    return
+
+    def stream(self, service, tail=None, since=None, timestamps=False, follow=False):
+        """Generator of log bytes for a service's container"""
+        container = self._container(service)
+        session = self._session(container)
+        session.ready.wait(timeout=10)
+
+        if session.can_serve(tail, since):
+            CACHE_REQUESTS.inc(cache='logs', result='hit')
+            return self._from_session(session, tail, since, timestamps, follow)
+        CACHE_REQUESTS.inc(cache='logs', result='miss')
+        return self._direct(container['Id'], session.tty, tail, since, timestamps, follow)
+
+    def _from_session(self, session, tail, since, timestamps, follow):
+        def render(lines):
+            if timestamps:
+                return b''.join(stamp.encode() + b' ' + text for _, stamp, _, text in lines)
+            return b''.join(text for _, _, _, text in lines)
+
+        if not follow:
+            yield render(session.recent(tail, since))
+            return
+
+        backlog, follower = session.follow(tail, since)
+        try:
+            if backlog:
+                yield render(backlog)
+            while True:
+                lines, dropped, closed = session.next_lines(follower)
+                if dropped:
+                    yield f'... {dropped} lines dropped (client too slow) ...\n'.encode()
+                if lines:
+                    yield render(lines)
+                elif closed:
+                    return
+                elif not dropped:
+                    yield _KEEPALIVE
+        finally:
+            session.unfollow(follower)
+
+    def _direct(self, container_id, tty, tail, since, timestamps, follow):
+        params = {
+            'stdout': 1,
+            'stderr': 1,
+            'tail': 'all' if tail is None else tail,
+            'timestamps': int(bool(timestamps)),
+            'follow': int(bool(follow)),
+        }
+        if since is not None:
+            params['since'] = f'{since:.9f}'
+        response = self.client.stream('GET', f'/containers/{container_id}/logs', params)
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.startswith(_RAW):
+            tty = True
+        elif content_type.startswith(_MULTIPLEXED):
+            tty = False
+
+        def generate():
+            with response:
+                for _, chunk in iter_frames(response, tty):
+                    yield chunk
+        return generate()
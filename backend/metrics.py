@@ -0,0 +1,247 @@
+"""In-process metrics rendered in the Prometheus text exposition format"""
+import math
+import re
+import threading
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; commands such as pulls can take minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Path segments that identify one object (container IDs, names) and would explode label cardinality
+_PATH_IDS = re.compile(r'^/(containers|images|exec|networks|volumes)/(?!(?:json|create|prune|search|load|get)(?:/|$))[^/]+')
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def stats(self):
+        """{label values: count} of every label combination counted so far"""
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down; set_function computes it at scrape time instead"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """function() returns {label tuple: value} (or a number for unlabelled gauges)"""
+        self._function = function
+
+    def samples(self):
+        if self._function is None:
+            return super().samples()
+        values = self._function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, self._labels(key), value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', self._labels(key, [('le', _format_value(bound))]), cumulative))
+            samples.append((f'{self.name}_sum', self._labels(key), total))
+            samples.append((f'{self.name}_count', self._labels(key), count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Latency of API requests by route', ('method', 'route', 'status')))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    'http_requests_in_flight', 'Requests currently being handled'))
+
+COMMANDS = REGISTRY.register(Counter(
+    'docker_commands_total', 'docker / docker-compose commands run, by subcommand and exit code',
+    ('command', 'subcommand', 'exit_code')))
+COMMAND_DURATION = REGISTRY.register(Histogram(
+    'docker_command_duration_seconds', 'Duration of docker / docker-compose commands', ('command', 'subcommand')))
+COMMAND_TIMEOUTS = REGISTRY.register(Counter(
+    'docker_command_timeouts_total', 'Commands killed after exceeding their timeout', ('command', 'subcommand')))
+COMMANDS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'docker_commands_in_flight', 'docker / docker-compose commands currently running'))
+COMMANDS_WAITING = REGISTRY.register(Gauge(
+    'docker_commands_waiting', 'docker operations waiting for a free slot'))
+
+API_REQUESTS = REGISTRY.register(Counter(
+    'docker_api_requests_total', 'Docker Engine API requests, by endpoint and HTTP status',
+    ('method', 'endpoint', 'status')))
+API_DURATION = REGISTRY.register(Histogram(
+    'docker_api_request_duration_seconds', 'Docker Engine API request latency (time to response headers for streams)',
+    ('method', 'endpoint')))
+
+JOBS = REGISTRY.register(Gauge(
+    'job_manager_jobs', 'Jobs currently kept by the job manager, by status', ('status',)))
+
+HISTORY_DROPPED = REGISTRY.register(Counter(
+    'history_records_dropped_total', 'History records dropped because the write queue was full'))
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit or miss)', ('cache', 'result')))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    'cache_hit_ratio', 'Share of cache lookups served without recomputing', ('cache',)))
+
+
+def _hit_ratios():
+    totals = {}
+    for (cache, result), value in CACHE_REQUESTS.stats().items():
+        hits, lookups = totals.get((cache,), (0, 0))
+        totals[(cache,)] = (hits + (value if result == 'hit' else 0), lookups + value)
+    return {key: hits / lookups for key, (hits, lookups) in totals.items() if lookups}
+
+
+CACHE_HIT_RATIO.set_function(_hit_ratios)
+
+
+def command_labels(args):
+    """(command, subcommand) of a docker / docker-compose argument list
+
+    Skips global options, including those taking a value (-p, -f, --project-name, ...).
+    """
+    command = args[0].rsplit('/', 1)[-1] if args else ''
+    valued = {'-p', '-f', '--project-name', '--file', '--env-file', '--profile', '-H', '--host',
+              '--context', '-c', '--project-directory', '--config'}
+    skip = False
+    for arg in args[1:]:
+        if skip:
+            skip = False
+        elif arg in valued:
+            skip = True
+        elif not arg.startswith('-'):
+            return command, arg
+    return command, ''
+
+
+def api_endpoint(path):
+    """A Docker API path with object IDs replaced, e.g. /containers/{id}/logs"""
+    path = path.split('?', 1)[0]
+    path = re.sub(r'^/v[\d.]+', '', path)
+    return _PATH_IDS.sub(lambda match: f'/{match.group(1)}/{{id}}', path)
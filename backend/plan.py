@@ -0,0 +1,111 @@
+"""Compare containers with the compose file and converge only the services that drifted"""
+import subprocess
+
+from .batch import dependency_graph, run_batch
+from .commands import compose_command, run_command
+from .common import CONFIG_HASH_LABEL, ONEOFF_LABEL, SERVICE_LABEL
+from .docker_api import DockerAPIError
+
+CREATE = 'create'
+RECREATE = 'recreate'
+REMOVE = 'remove'
+
+
+class PlanError(Exception):
+    """Raised when the desired state can't be computed"""
+
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def compose_plan(compose, hashes, containers):
+    """What `up` would change: services to create or recreate and orphaned containers to remove
+
+    `hashes` are the compose config hashes per service and `containers` the
+    Engine API listing of the project (one bulk query). A service needs
+    recreating when any of its containers carries a different config-hash
+    label. Containers of services not in the compose file at all are orphans;
+    services of inactive profiles are left out.
+    """
+    missing = [service for service in compose.services if service not in hashes]
+    if missing:
+        raise PlanError(f'No config hash for {", ".join(missing)}; docker-compose config --hash failed')
+
+    by_service = {}
+    for container in containers:
+        labels = container.get('Labels') or {}
+        if labels.get(ONEOFF_LABEL, '').lower() == 'true':
+            continue
+        by_service.setdefault(labels.get(SERVICE_LABEL, ''), []).append(container)
+
+    plan = {CREATE: [], RECREATE: [], REMOVE: [], 'unchanged': []}
+    for service, expected in hashes.items():
+        if service not in compose.services:
+            continue
+        current = by_service.get(service, [])
+        if not current:
+            plan[CREATE].append({'service': service, 'config_hash': expected})
+            continue
+        drifted = [c for c in current if (c.get('Labels') or {}).get(CONFIG_HASH_LABEL) != expected]
+        if drifted:
+            plan[RECREATE].append({
+                'service': service,
+                'containers': [(c.get('Names') or [''])[0].lstrip('/') for c in drifted],
+                'current_hash': (drifted[0].get('Labels') or {}).get(CONFIG_HASH_LABEL),
+                'config_hash': expected,
+            })
+        else:
+            plan['unchanged'].append(service)
+
+    for service, current in sorted(by_service.items()):
+        if service not in compose.all_services:
+            plan[REMOVE].append({
+                'service': service,
+                'containers': [(c.get('Names') or [''])[0].lstrip('/') for c in current],
+                'ids': [c['Id'] for c in current],
+            })
+    return plan
+
+
+def plan_changes(plan):
+    return len(plan[CREATE]) + len(plan[RECREATE]) + len(plan[REMOVE])
+
+
+def apply_plan(project, compose, plan, docker_client, concurrency=4, cancel_event=None, remove_orphans=True):
+    """Converge the services of a plan in parallel, dependencies first; returns the batch payload
+
+    Created and recreated services get `up -d --no-deps`, so nothing outside
+    the plan is touched; orphaned containers are force-removed.
+    """
+    services = [entry['service'] for entry in plan[CREATE] + plan[RECREATE]]
+    graph = dependency_graph(compose, services)
+    orphans = {entry['service']: entry for entry in plan[REMOVE]} if remove_orphans else {}
+    graph.update({service: [] for service in orphans})
+
+    def converge(service):
+        if service in orphans:
+            return _remove(docker_client, orphans[service])
+        try:
+            result = run_command(compose_command(project, compose.path, 'up', '-d', '--no-deps', service),
+                                 timeout=120, cancel_event=cancel_event)
+        except subprocess.TimeoutExpired:
+            return {'status': 'error', 'service': service, 'message': 'Up command timed out'}
+        if result.returncode != 0:
+            return {'status': 'error', 'service': service, 'message': 'Failed to bring service up',
+                    'error': result.stderr}
+        return {'status': 'success', 'service': service, 'message': f'Service {service} is up to date'}
+
+    return run_batch('apply', graph, converge, concurrency=concurrency, cancel_event=cancel_event)
+
+
+def _remove(docker_client, orphan):
+    for container_id in orphan['ids']:
+        try:
+            docker_client.request_json('DELETE', f'/containers/{container_id}', {'force': 1})
+        except DockerAPIError as e:
+            if e.status_code != 404:
+                return {'status': 'error', 'service': orphan['service'], 'message': 'Failed to remove orphan',
+                        'error': str(e)}
+    return {'status': 'success', 'service': orphan['service'],
+            'message': f'Removed orphaned {", ".join(orphan["containers"])}'}
@@ -0,0 +1,278 @@
+"""Registry of the compose projects one instance manages"""
+import os
+import re
+import threading
+import time
+
+import yaml
+
+from .actions import ComposeActions
+from .common import PROJECT_LABEL
+from .compose import ComposeCache, ConfigHashCache
+from .containers import ContainerDetails, StatusBackend, summary_from_api
+from .dashboard import DashboardView
+from .events import StatusEventHub
+from .history import HistoryWatcher
+from .logs import LogManager
+from .registry import RegistryClient, UpdateChecker, UpdateScanner
+from .stats import StatsSampler
+from .status import StatusSnapshot
+
+# File names docker compose looks for in a project directory, in its order of preference
+COMPOSE_FILENAMES = ('compose.yaml', 'compose.yml', 'docker-compose.yaml', 'docker-compose.yml')
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-z0-9_-]')
+
+
+class ProjectError(Exception):
+    """Raised when a requested project is not registered"""
+
+    def __init__(self, message, status_code=404):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def normalize_project_name(name):
+    """Project name as docker compose normalizes it (lowercase, [a-z0-9_-])"""
+    return _INVALID_NAME_CHARS.sub('', name.lower()).lstrip('_-')
+
+
+def project_name_for(compose_path):
+    """Name docker compose would give a project: its top-level 'name', else its directory"""
+    try:
+        with open(compose_path) as file:
+            document = yaml.safe_load(file) or {}
+        name = document.get('name') if isinstance(document, dict) else None
+    except (OSError, yaml.YAMLError):
+        name = None
+    if not name or '$' in name:
+        name = os.path.basename(os.path.dirname(os.path.abspath(compose_path)))
+    return normalize_project_name(name)
+
+
+def find_compose_file(directory):
+    for filename in COMPOSE_FILENAMES:
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def parse_project_list(value):
+    """{name: compose path} from 'name=/path/compose.yml,/other/compose.yml'"""
+    projects = {}
+    for entry in (value or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, sep, path = entry.partition('=')
+        if not sep:
+            name, path = '', entry
+        if os.path.isdir(path):
+            path = find_compose_file(path) or os.path.join(path, COMPOSE_FILENAMES[0])
+        projects[normalize_project_name(name) if name else project_name_for(path)] = path
+    return projects
+
+
+def scan_projects(directory):
+    """{name: compose path} for every subdirectory of `directory` holding a compose file"""
+    projects = {}
+    try:
+        entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+    except OSError:
+        return projects
+    for entry in entries:
+        if entry.is_dir():
+            path = find_compose_file(entry.path)
+            if path:
+                projects.setdefault(project_name_for(path), path)
+    return projects
+
+
+class Project:
+    """The compose cache, status and its details, dashboard, events, actions, logs, stats and update scanner of one project"""
+
+    def __init__(self, name, compose_path, docker_client, status_mode='auto', snapshot_options=None,
+                 log_options=None, stats_options=None, action_options=None, federation=None,
+                 update_checker=None, update_options=None, history=None, details_options=None,
+                 history_options=None, event_options=None):
+        self.name = name
+        # With several Docker hosts, status is merged from all of them
+        self.federation = federation
+        self.host_reports = []
+        self.compose_cache = ComposeCache(compose_path)
+        self.config_hashes = ConfigHashCache(name, self.compose_cache)
+        self.status_backend = StatusBackend(docker_client, name, status_mode)
+        self.status_snapshot = StatusSnapshot(self.fetch_containers, **(snapshot_options or {}))
+        self.details = ContainerDetails(name, **(details_options or {}))
+        self.dashboard = DashboardView()
+        # One local /events subscription can't see other hosts, so federated projects poll the snapshot
+        self.event_hub = StatusEventHub(docker_client, name, self.fetch_containers,
+                                        on_change=self.status_snapshot.invalidate,
+                                        poll=lambda: self.status_snapshot.get()[0],
+                                        subscribe=federation is None, **(event_options or {}))
+        self.actions = ComposeActions(name, self.compose_cache, self.status_backend, docker_client,
+                                      config_hashes=self.config_hashes, **(action_options or {}))
+        self.logs = LogManager(docker_client, name, **(log_options or {}))
+        self.stats = StatsSampler(docker_client, name, **(stats_options or {}))
+        # The checker (and its registry cache) is normally shared by all projects
+        checker = update_checker or UpdateChecker(RegistryClient(), docker_client)
+        self.updates = UpdateScanner(checker, self.compose_cache, **(update_options or {}))
+        # State transitions are recorded from the project's own event subscriptions, one per Docker host
+        self.history_watchers = []
+        if history is not None:
+            if federation is not None:
+                self.history_watchers = [
+                    HistoryWatcher(history, host.client, name, lambda host=host: self._host_containers(host),
+                                   host=host.name, **(history_options or {}))
+                    for host in federation.hosts
+                ]
+            else:
+                self.history_watchers = [
+                    HistoryWatcher(history, docker_client, name,
+                                   lambda: self.status_backend.list(self.compose_cache.get().path),
+                                   **(history_options or {}))
+                ]
+        for watcher in self.history_watchers:
+            watcher.start()
+
+    @property
+    def compose_path(self):
+        return self.compose_cache.path
+
+    def close(self):
+        """Stop the project's background threads and close its Engine API streams"""
+        self.status_snapshot.close()
+        self.event_hub.close()
+        self.stats.close()
+        self.updates.close()
+        self.logs.close()
+        self.details.close()
+        for watcher in self.history_watchers:
+            watcher.close()
+
+    def fetch_containers(self, service=None):
+        """List the project's containers (or one service's) from the status backend"""
+        if self.federation is not None:
+            containers, self.host_reports = self.federation.list_containers(self.name, service)
+            return containers
+        return self.status_backend.list(self.compose_cache.get().path, service)
+
+    def _host_containers(self, host):
+        return [dict(summary_from_api(container), Host=host.name) for container in host.client.list_containers(self.name)]
+
+    def container_details(self):
+        """{(host or None, container name): inspect details} for every container of the project"""
+        if self.federation is not None:
+            results, _ = self.federation.fan_out(lambda host: self.details.collect(host.client, host.name))
+            return {(host, name): details for host, by_name in results.items() for name, details in by_name.items()}
+        return {(None, name): details for name, details in self.details.collect(self.status_backend.client).items()}
+
+
+class ProjectRegistry:
+    """Projects from a config list and/or a directory scan, plus the legacy default project
+
+    The default project (DOCKER_COMPOSE_PATH) answers the unscoped URLs. A
+    scanned directory is re-read at most every `rescan_interval` seconds;
+    Project objects are created on first use and kept while registered, and
+    closed when they are unregistered or their compose file moves. With
+    `preload`, a background thread creates every registered project after
+    each rescan, for components that must run without requests (history).
+    """
+
+    def __init__(self, factory, docker_client, default_name=None, default_path=None, config=None,
+                 scan_dir=None, rescan_interval=30.0, preload=False):
+        self.factory = factory
+        self.docker_client = docker_client
+        self.default_path = default_path
+        self.config = config
+        self.scan_dir = scan_dir
+        self.rescan_interval = rescan_interval
+        self._paths = {}
+        self._projects = {}
+        self._scanned_at = None
+        self._lock = threading.Lock()
+        self._default = default_name
+        if preload:
+            threading.Thread(target=self._preload, name='project-preload', daemon=True).start()
+
+    def _preload(self):
+        while True:
+            for name in self.names():
+                try:
+                    self.get(name)
+                except ProjectError:
+                    # Unregistered by a rescan in between
+                    pass
+            time.sleep(max(1.0, self.rescan_interval))
+
+    def _refresh(self):
+        # Called with self._lock held
+        now = time.monotonic()
+        if self._scanned_at is not None and now - self._scanned_at < self.rescan_interval:
+            return
+        self._scanned_at = now
+        paths = {}
+        if self.scan_dir:
+            paths.update(scan_projects(self.scan_dir))
+        paths.update(parse_project_list(self.config))
+        if self.default_path or not paths:
+            # Keeps the unscoped URLs (and their "not configured" errors) working
+            paths[self._default] = self.default_path
+        self._paths = paths
+        for name in [name for name in self._projects if name not in paths]:
+            self._projects.pop(name).close()
+
+    @property
+    def default_name(self):
+        with self._lock:
+            self._refresh()
+            if self._default in self._paths:
+                return self._default
+            return min(self._paths)
+
+    def paths(self):
+        """{name: compose path} of every registered project"""
+        with self._lock:
+            self._refresh()
+            return dict(self._paths)
+
+    def names(self):
+        return sorted(self.paths())
+
+    def get(self, name=None):
+        """The named project, or the default one for unscoped URLs"""
+        name = name or self.default_name
+        with self._lock:
+            self._refresh()
+            if name not in self._paths:
+                raise ProjectError(f'Project {name} not found')
+            project = self._projects.get(name)
+            if project is None or project.compose_path != self._paths[name]:
+                if project is not None:
+                    project.close()
+                project = self._projects[name] = self.factory(name, self._paths[name])
+            return project
+
+    def overview(self):
+        """Every registered project with container counts from one label-filtered listing"""
+        counts = {}
+        for container in self.docker_client.list_containers(None):
+            project = (container.get('Labels') or {}).get(PROJECT_LABEL)
+            entry = counts.setdefault(project, {'running': 0, 'total': 0, 'containers': []})
+            entry['total'] += 1
+            entry['running'] += container.get('State') == 'running'
+            entry['containers'].append(summary_from_api(container))
+
+        default = self.default_name
+        projects = []
+        for name, path in sorted(self.paths().items()):
+            entry = counts.get(name, {'running': 0, 'total': 0, 'containers': []})
+            entry['containers'].sort(key=lambda c: c['Name'])
+            projects.append({
+                'name': name,
+                'compose_file': path,
+                'default': name == default,
+                **entry,
+            })
+        return projects
@@ -0,0 +1,301 @@
+"""Registry manifest lookups and the image update scanner"""
+import base64
+import http.client
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+
+from .common import timestamp
+from .docker_api import DockerAPIError
+from .images import DEFAULT_REGISTRY, ImageReference, registry_auth, repo_digests
+from .metrics import CACHE_REQUESTS
+
+# Docker Hub serves its registry API from a different host than its image names use
+_REGISTRY_HOSTS = {DEFAULT_REGISTRY: 'registry-1.docker.io'}
+
+# Manifest lists / OCI indexes first, so multi-arch images report the digest `docker pull` records
+MANIFEST_TYPES = ', '.join((
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+))
+
+_CHALLENGE_PARAM = re.compile(r'(\w+)="([^"]*)"')
+
+# Update states of a service's image
+UP_TO_DATE = 'up_to_date'
+OUTDATED = 'outdated'
+NOT_PULLED = 'not_pulled'
+PINNED = 'pinned'
+ERROR = 'error'
+
+
+class RegistryError(Exception):
+    """Raised when a registry can't be reached or refuses a manifest lookup"""
+
+
+def _is_local(host):
+    return host.split(':', 1)[0] in ('localhost', '127.0.0.1', '::1')
+
+
+class RegistryClient:
+    """Answers 'what digest does this tag point to' with one HEAD request per image
+
+    Handles the bearer-token challenge registries answer anonymous requests
+    with (using Docker CLI credentials when there are any) and caches tokens
+    until they expire. The challenge of each repository is remembered, so
+    later lookups send the cached token right away instead of being refused
+    first. Registries on localhost are spoken to over plain HTTP.
+    """
+
+    def __init__(self, timeout=10.0):
+        self.timeout = timeout
+        # (realm, service, scope) -> (token, expires_at)
+        self._tokens = {}
+        # (registry host, repository) -> its last bearer challenge
+        self._challenges = {}
+        self._lock = threading.Lock()
+
+    def _request(self, method, url, headers):
+        parsed = urlparse(url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(parsed.netloc, timeout=self.timeout)
+        try:
+            path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+            connection.request(method, path, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.headers, response.read()
+        except (OSError, http.client.HTTPException) as e:
+            raise RegistryError(f'{parsed.netloc}: {e}')
+        finally:
+            connection.close()
+
+    def _token(self, challenge, image, auth, renew=False):
+        params = dict(_CHALLENGE_PARAM.findall(challenge))
+        realm = params.get('realm')
+        if not realm:
+            raise RegistryError(f'{image.registry}: bearer challenge without a realm')
+        scope = params.get('scope') or f'repository:{image.repository}:pull'
+        key = (realm, params.get('service'), scope)
+        with self._lock:
+            cached = self._tokens.get(key)
+            if cached and cached[1] > time.monotonic() and not renew:
+                return cached[0]
+
+        query = {'scope': scope}
+        if params.get('service'):
+            query['service'] = params['service']
+        headers = {}
+        if auth:
+            credentials = f'{auth["username"]}:{auth["password"]}'.encode()
+            headers['Authorization'] = f'Basic {base64.b64encode(credentials).decode()}'
+        status, _, body = self._request('GET', f'{realm}?{urlencode(query)}', headers)
+        if status != 200:
+            raise RegistryError(f'{image.registry}: token request returned {status}')
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise RegistryError(f'{image.registry}: invalid token response')
+        token = data.get('token') or data.get('access_token')
+        if not token:
+            raise RegistryError(f'{image.registry}: token response without a token')
+        # Renew a little early so a token never expires between lookup and use
+        expires_at = time.monotonic() + max(0, int(data.get('expires_in') or 60) - 10)
+        with self._lock:
+            self._tokens[key] = (token, expires_at)
+        return token
+
+    def manifest_digest(self, image):
+        """Digest of the manifest `image` (an ImageReference) currently points to"""
+        host = _REGISTRY_HOSTS.get(image.registry, image.registry)
+        scheme = 'http' if _is_local(host) else 'https'
+        url = f'{scheme}://{host}/v2/{image.repository}/manifests/{image.version}'
+        headers = {'Accept': MANIFEST_TYPES}
+        auth = registry_auth(image.registry)
+        with self._lock:
+            known = self._challenges.get((host, image.repository))
+        if known:
+            headers['Authorization'] = f'Bearer {self._token(known, image, auth)}'
+
+        status, response_headers, _ = self._request('HEAD', url, headers)
+        if status == 401:
+            challenge = response_headers.get('WWW-Authenticate', '')
+            if challenge.lower().startswith('bearer'):
+                with self._lock:
+                    self._challenges[(host, image.repository)] = challenge
+                # A cached token the registry refused (revoked, or a new scope) is not reused
+                headers['Authorization'] = f'Bearer {self._token(challenge, image, auth, renew=bool(known))}'
+            elif auth:
+                credentials = f'{auth["username"]}:{auth["password"]}'.encode()
+                headers['Authorization'] = f'Basic {base64.b64encode(credentials).decode()}'
+            else:
+                raise RegistryError(f'{image.registry}: authentication required')
+            status, response_headers, _ = self._request('HEAD', url, headers)
+
+        if status == 404:
+            raise RegistryError(f'{image}: not found in {image.registry}')
+        if status != 200:
+            raise RegistryError(f'{image.registry}: manifest request returned {status}')
+        digest = response_headers.get('Docker-Content-Digest')
+        if not digest:
+            raise RegistryError(f'{image.registry}: no Docker-Content-Digest in the manifest response')
+        return digest
+
+
+class UpdateChecker:
+    """Compares local images with their registry digests
+
+    Registry answers are cached per image reference for `ttl` seconds
+    (failures for `error_ttl`), and at most `concurrency` registry requests
+    run at a time. Local digests are re-read on every check, so a pull is
+    noticed right away.
+    """
+
+    def __init__(self, registry, docker_client, ttl=3600.0, error_ttl=300.0, concurrency=4):
+        self.registry = registry
+        self.docker_client = docker_client
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        # reference -> (remote digest or None, error or None, checked_at, expires_at)
+        self._remote = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='registry')
+
+    def _remote_digest(self, reference, refresh=False):
+        with self._lock:
+            cached = self._remote.get(reference)
+            if cached and not refresh and cached[3] > time.monotonic():
+                CACHE_REQUESTS.inc(cache='registry', result='hit')
+                return cached
+        CACHE_REQUESTS.inc(cache='registry', result='miss')
+        try:
+            digest = self.registry.manifest_digest(ImageReference(reference))
+            entry = (digest, None, time.time(), time.monotonic() + self.ttl)
+        except RegistryError as e:
+            entry = (None, str(e), time.time(), time.monotonic() + self.error_ttl)
+        with self._lock:
+            self._remote[reference] = entry
+        return entry
+
+    def check(self, reference, refresh=False):
+        """Update state of one image reference"""
+        image = ImageReference(reference)
+        result = {'image': reference, 'local_digest': None, 'remote_digest': None, 'checked_at': None}
+        if image.digest:
+            return dict(result, status=PINNED, local_digest=image.digest)
+
+        try:
+            digests = repo_digests(self.docker_client, reference)
+        except DockerAPIError as e:
+            return dict(result, status=ERROR, error=str(e))
+        if digests is None:
+            return dict(result, status=NOT_PULLED)
+        # RepoDigests hold one entry per repository the image was pulled from
+        local = []
+        for entry in digests:
+            pulled = ImageReference(entry)
+            if (pulled.registry, pulled.repository) == (image.registry, image.repository):
+                local.append(pulled.digest)
+        result['local_digest'] = local[0] if local else None
+
+        remote, error, checked_at, _ = self._remote_digest(reference, refresh)
+        result['remote_digest'] = remote
+        result['checked_at'] = timestamp(checked_at)
+        if error:
+            return dict(result, status=ERROR, error=error)
+        return dict(result, status=UP_TO_DATE if remote in local else OUTDATED)
+
+    def check_many(self, references, refresh=False):
+        """{reference: check result}, the registry requests spread over the bounded pool"""
+        futures = {reference: self._pool.submit(self.check, reference, refresh) for reference in set(references)}
+        return {reference: future.result() for reference, future in futures.items()}
+
+
+class UpdateScanner:
+    """Periodically checks every image of a compose project for a newer registry version
+
+    The background thread starts on first use, scans right away and then
+    every `interval` seconds (only once when `interval` is 0). Requests are
+    answered from the last scan; report(refresh=True) has the thread rescan,
+    bypassing the registry cache, and waits at most `refresh_timeout`
+    seconds for it.
+    """
+
+    def __init__(self, checker, compose_cache, interval=3600.0, refresh_timeout=30.0):
+        self.checker = checker
+        self.compose_cache = compose_cache
+        self.interval = interval
+        self.refresh_timeout = refresh_timeout
+        self.results = None
+        self.scanned_at = None
+        self.scanning = False
+        # Completed scans, so a refresh can wait for one that started after it was asked for
+        self._scans = 0
+        self._refresh = False
+        self._thread = None
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+
+    def start(self):
+        with self._cond:
+            if self._thread is None and not self._closed.is_set():
+                self.scanning = True
+                self._thread = threading.Thread(target=self._run, name='update-scanner', daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Stop the periodic scan"""
+        self._closed.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._closed.is_set():
+            with self._cond:
+                refresh, self._refresh = self._refresh, False
+                self.scanning = True
+            try:
+                self.scan(refresh)
+            except Exception:
+                # An invalid compose file is reported by the next request
+                pass
+            with self._cond:
+                self.scanning = False
+                self._scans += 1
+                self._cond.notify_all()
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+
+    def scan(self, refresh=False):
+        """Check the image of every compose service; returns the per-service results"""
+        services = self.compose_cache.get().services
+        images = {service: (config or {}).get('image') for service, config in services.items()}
+        checked = self.checker.check_many([image for image in images.values() if image], refresh)
+        results = []
+        for service, image in images.items():
+            if image:
+                results.append(dict(checked[image], service=service))
+        self.results = results
+        self.scanned_at = time.time()
+        return results
+
+    def report(self, refresh=False):
+        """(results or None before the first scan, scanned_at, whether a scan is running)
+
+        With refresh, a rescan is started and waited for up to `refresh_timeout` seconds.
+        """
+        # Surfaces an invalid compose file to the caller instead of only to the background scan
+        self.compose_cache.get()
+        self.start()
+        with self._cond:
+            if refresh:
+                # A scan already running may have read the cache before the refresh was asked for
+                target = self._scans + (2 if self.scanning else 1)
+                self._refresh = True
+                self._wake.set()
+                self._cond.wait_for(lambda: self._scans >= target, self.refresh_timeout)
+            return self.results, timestamp(self.scanned_at), self.scanning
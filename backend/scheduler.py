@@ -0,0 +1,460 @@
+"""Cron-style recurring container actions with jitter, maintenance windows and a concurrency cap"""
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import yaml
+
+from .common import exclusive_lock, timestamp
+from .jobs import JobQueueFull
+from .logs import parse_duration
+
+_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+_MONTH_NAMES = {name: i for i, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+_DAY_NAMES = {name: i for i, name in enumerate(('sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'))}
+
+# Minute, hour, day of month, month, day of week: (low, high, names)
+_FIELDS = ((0, 59, {}), (0, 23, {}), (1, 31, {}), (1, 12, _MONTH_NAMES), (0, 7, _DAY_NAMES))
+
+
+class ScheduleError(Exception):
+    """Raised for an invalid schedule definition"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _parse_field(text, low, high, names):
+    values = set()
+    for part in text.lower().split(','):
+        base, _, step = part.partition('/')
+        if base == '*':
+            start, end = low, high
+        else:
+            start, _, end = base.partition('-')
+            try:
+                start = int(names.get(start, start))
+                end = int(names.get(end, end)) if end else (high if step else start)
+            except ValueError:
+                raise ScheduleError(f'Invalid cron field: {text}')
+        try:
+            step = int(step) if step else 1
+        except ValueError:
+            raise ScheduleError(f'Invalid cron step: {text}')
+        if not low <= start <= end <= high or step < 1:
+            raise ScheduleError(f'Cron field out of range: {text}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """A five-field cron expression (minute hour day month weekday) in server local time
+
+    Supports *, lists, ranges, steps, month and weekday names and the
+    @hourly/@daily/@weekly/@monthly/@yearly aliases. As in cron, a day
+    matches either restricted day field when both are restricted.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = _ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ScheduleError(f'Cron expression needs 5 fields: {expression}')
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_field(field, *spec) for field, spec in zip(fields, _FIELDS))
+        if 7 in self.weekdays:
+            self.weekdays = (self.weekdays - {7}) | {0}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        # datetime weekdays start on Monday, cron's on Sunday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """The first matching minute after `moment` (a naive local datetime)"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Four years cover every valid day-of-month / month / weekday combination
+        limit = moment + timedelta(days=4 * 366)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ScheduleError(f'Cron expression never matches: {self.expression}')
+
+
+class MaintenanceWindow:
+    """A daily 'HH:MM-HH:MM' local time range; it may wrap past midnight"""
+
+    def __init__(self, text):
+        self.text = text
+        try:
+            start, end = text.split('-')
+            self.start, self.end = (self._minutes(value) for value in (start, end))
+        except ValueError:
+            raise ScheduleError(f'Maintenance window must look like 02:00-05:00: {text}')
+
+    @staticmethod
+    def _minutes(value):
+        hours, minutes = value.strip().split(':')
+        hours, minutes = int(hours), int(minutes)
+        if not (0 <= hours <= 24 and 0 <= minutes < 60):
+            raise ValueError(value)
+        return hours * 60 + minutes
+
+    def contains(self, moment):
+        minute = moment.hour * 60 + moment.minute
+        if self.start <= self.end:
+            return self.start <= minute < self.end
+        return minute >= self.start or minute < self.end
+
+
+class Schedule:
+    """One rule: run `action` on some services of a project whenever `cron` matches
+
+    Each service of a firing is delayed by a random 0..`jitter` seconds, runs
+    only inside `window` (when set), and at most `concurrency` of the
+    schedule's jobs run at once.
+    """
+
+    def __init__(self, name, cron, action, services=None, profile=None, project=None, jitter=0.0,
+                 window=None, concurrency=1, enabled=True):
+        self.name = name
+        self.cron = CronExpression(cron)
+        # Fails here, not in the scheduler loop, for dates that never come (0 0 31 2 *)
+        self.cron.next_after(datetime.now())
+        self.action = action
+        self.services = services
+        self.profile = profile
+        self.project = project
+        self.jitter = jitter
+        self.window = MaintenanceWindow(window) if window else None
+        self.concurrency = max(1, concurrency)
+        self.enabled = enabled
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'project': self.project,
+            'action': self.action,
+            'cron': self.cron.expression,
+            'services': self.services,
+            'profile': self.profile,
+            'jitter': self.jitter,
+            'window': self.window.text if self.window else None,
+            'concurrency': self.concurrency,
+            'enabled': self.enabled,
+        }
+
+
+def load_schedules(path, actions):
+    """Schedules from a YAML file with a top-level `schedules` list"""
+    try:
+        with open(path) as file:
+            document = yaml.safe_load(file) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise ScheduleError(f'Cannot read schedules from {path}: {e}')
+
+    schedules = []
+    for i, entry in enumerate(document.get('schedules') or []):
+        name = str(entry.get('name') or f'schedule-{i + 1}')
+        if entry.get('action') not in actions:
+            raise ScheduleError(f'{name}: action must be one of {", ".join(actions)}')
+        services = entry.get('services')
+        if services is None and not entry.get('profile'):
+            raise ScheduleError(f'{name}: needs "services" (a list or "all") or a "profile"')
+        if services is not None and services != 'all' and not isinstance(services, list):
+            raise ScheduleError(f'{name}: "services" must be a list or "all"')
+        jitter = entry.get('jitter') or 0
+        if isinstance(jitter, str):
+            seconds = parse_duration(jitter)
+            if seconds is None:
+                raise ScheduleError(f'{name}: jitter must be seconds or a duration like 30m')
+            jitter = seconds
+        if name in {schedule.name for schedule in schedules}:
+            raise ScheduleError(f'Duplicate schedule name: {name}')
+        schedules.append(Schedule(
+            name, str(entry.get('cron', '')), entry['action'], services=services, profile=entry.get('profile'),
+            project=entry.get('project'), jitter=float(jitter), window=entry.get('window'),
+            concurrency=int(entry.get('concurrency') or 1), enabled=entry.get('enabled', True) is not False,
+        ))
+    return schedules
+
+
+class Scheduler:
+    """Fires schedules, spreads their jobs out and remembers how each run went
+
+    `resolve(schedule)` returns the service names a firing covers and
+    `start(schedule, service)` queues the job for one of them (returning the
+    Job). A firing's services wait for their jittered due time, their
+    schedule's window and a free slot (`concurrency` jobs of all schedules at
+    once) before they are started. Next runs, pending services and the last
+    run of every schedule and service are saved to `state_path`, so a restart
+    keeps them; a run missed while the server was down fires once on start.
+
+    Only one process fires schedules: the one holding an exclusive lock on
+    `state_path`.lock. Other server workers keep trying to take the lock,
+    pick up the saved state when they get it, and answer report() from the
+    state file in the meantime. Without a state_path every process fires.
+    """
+
+    def __init__(self, schedules, resolve, start, state_path=None, concurrency=2, interval=1.0):
+        self.schedules = {schedule.name: schedule for schedule in schedules}
+        self.resolve = resolve
+        self.start_job = start
+        self.state_path = state_path
+        self.concurrency = max(1, concurrency)
+        self.interval = interval
+        self._state = {name: {'next_run': None, 'last_run': None, 'current': None, 'services': {}, 'pending': []}
+                       for name in self.schedules}
+        # (schedule name, service) -> running Job
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._dirty = False
+        self._claim = None
+        self._load()
+
+    def _load(self):
+        if not self.state_path:
+            return
+        try:
+            with open(self.state_path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        for name, state in saved.items():
+            if name in self._state:
+                self._state[name].update({key: state.get(key, value) for key, value in self._state[name].items()})
+                # JSON turned the (due, service) tuples into lists
+                self._state[name]['pending'] = [tuple(entry) for entry in self._state[name]['pending']]
+
+    def _save(self):
+        # Called with self._lock held; written to a temporary file first so a crash can't truncate it
+        if not self.state_path or not self._dirty:
+            return
+        self._dirty = False
+        temporary = f'{self.state_path}.tmp'
+        try:
+            with open(temporary, 'w') as file:
+                json.dump(self._state, file)
+            os.replace(temporary, self.state_path)
+        except OSError:
+            pass
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and self.schedules:
+                self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop firing and starting jobs; running jobs are left to finish and pending ones are kept"""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            if self._claim is not None:
+                self._dirty = True
+                self._save()
+                # Lets another worker take over while this one drains
+                self._claim.close()
+                self._claim = None
+
+    @property
+    def leader(self):
+        """Whether this process fires the schedules"""
+        return self._claim is not None or not self.state_path
+
+    def wake(self):
+        """Tick now instead of at the next interval, e.g. because one of its jobs finished"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            if not self._claimed():
+                continue
+            try:
+                self.tick()
+            except Exception:
+                # A failing resolve or start is recorded per run; never let the loop die
+                pass
+
+    def _claimed(self):
+        # Called from the scheduler thread
+        if self.leader:
+            return True
+        claim = exclusive_lock(f'{self.state_path}.lock')
+        if claim is None:
+            return False
+        with self._lock:
+            if self._stop.is_set():
+                claim.close()
+                return False
+            # The previous holder may have fired and saved since this process started
+            self._load()
+            self._claim = claim
+        return True
+
+    def tick(self, now=None):
+        """Fire due schedules, reap finished jobs and start what may start"""
+        now = now or time.time()
+        with self._lock:
+            for name, schedule in self.schedules.items():
+                state = self._state[name]
+                if state['next_run'] is None:
+                    state['next_run'] = self._next_run(schedule, now)
+                    self._dirty = True
+                elif schedule.enabled and state['next_run'] <= now:
+                    self._fire(schedule, state, now)
+            self._reap(now)
+            self._dispatch(now)
+            self._save()
+
+    def _next_run(self, schedule, now):
+        return schedule.cron.next_after(datetime.fromtimestamp(now)).timestamp()
+
+    def _fire(self, schedule, state, now):
+        # Called with self._lock held
+        self._dirty = True
+        state['next_run'] = self._next_run(schedule, now)
+        try:
+            services = self.resolve(schedule)
+        except Exception as e:
+            state['last_run'] = {'fired_at': now, 'finished_at': now, 'duration': 0.0, 'services': 0,
+                                 'succeeded': 0, 'failed': 0, 'error': str(e)}
+            return
+        queued = {service for _, service in state['pending']}
+        added = [service for service in services
+                 if service not in queued and (schedule.name, service) not in self._running]
+        for service in added:
+            state['pending'].append((now + random.uniform(0, schedule.jitter), service))
+        state['pending'].sort()
+        if state['current'] is None:
+            state['current'] = {'fired_at': now, 'services': 0, 'succeeded': 0, 'failed': 0}
+        # A firing that overlaps the previous one's leftovers joins its run
+        state['current']['services'] += len(added)
+
+    def _reap(self, now):
+        # Called with self._lock held
+        for (name, service), job in list(self._running.items()):
+            if job.finished:
+                self._dirty = True
+                del self._running[(name, service)]
+                self._record(name, service, job.status, job.started_at, job.finished_at, job.id)
+        for name, state in self._state.items():
+            current = state['current']
+            if current and not state['pending'] and not any(key[0] == name for key in self._running):
+                self._dirty = True
+                current['finished_at'] = now
+                current['duration'] = round(now - current['fired_at'], 3)
+                state['last_run'] = current
+                state['current'] = None
+
+    def _record(self, name, service, status, started_at, finished_at, job_id=None, error=None):
+        # Called with self._lock held
+        self._dirty = True
+        state = self._state[name]
+        started_at = started_at or finished_at
+        state['services'][service] = {
+            'status': status,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'duration': round(finished_at - started_at, 3),
+            'job_id': job_id,
+            'error': error,
+        }
+        if state['current'] is not None:
+            state['current']['succeeded' if status == 'succeeded' else 'failed'] += 1
+
+    def _dispatch(self, now):
+        # Called with self._lock held; earliest due first across all schedules
+        if self._stop.is_set():
+            return
+        moment = datetime.fromtimestamp(now)
+        due = sorted((due, name, service) for name, state in self._state.items()
+                     for due, service in state['pending'] if due <= now)
+        for due_at, name, service in due:
+            if len(self._running) >= self.concurrency:
+                return
+            schedule = self.schedules[name]
+            if schedule.window and not schedule.window.contains(moment):
+                continue
+            if sum(1 for key in self._running if key[0] == name) >= schedule.concurrency:
+                continue
+            try:
+                job = self.start_job(schedule, service)
+            except JobQueueFull:
+                # Tried again on the next tick
+                return
+            except Exception as e:
+                self._state[name]['pending'].remove((due_at, service))
+                self._record(name, service, 'failed', None, now, error=str(e))
+                continue
+            self._dirty = True
+            self._state[name]['pending'].remove((due_at, service))
+            self._running[(name, service)] = job
+
+    def report(self, project=None):
+        """Every schedule (of one project) with its next run, current run, last run and per-service results"""
+        with self._lock:
+            if not self.leader:
+                # The leader's runs, as last saved
+                self._load()
+            results = []
+            for name, schedule in self.schedules.items():
+                if project and schedule.project != project:
+                    continue
+                state = self._state[name]
+                results.append({
+                    **schedule.to_dict(),
+                    'next_run': timestamp(state['next_run']) if schedule.enabled else None,
+                    'current_run': self._run_dict(state['current'], {
+                        'pending': [{'service': service, 'due': timestamp(due)} for due, service in state['pending']],
+                        'running': sorted(service for running_name, service in self._running if running_name == name),
+                    }),
+                    'last_run': self._run_dict(state['last_run']),
+                    'services': {
+                        service: {**entry, 'started_at': timestamp(entry['started_at']),
+                                  'finished_at': timestamp(entry['finished_at'])}
+                        for service, entry in sorted(state['services'].items())
+                    },
+                })
+            return results
+
+    @staticmethod
+    def _run_dict(run, extra=None):
+        if run is None:
+            return None
+        return {**run, 'fired_at': timestamp(run['fired_at']),
+                **({'finished_at': timestamp(run['finished_at'])} if 'finished_at' in run else {}),
+                **(extra or {})}
@@ -0,0 +1,311 @@
+"""Per-container resource stats sampled from the Engine API into fixed-size ring buffers"""
+import threading
+import time
+from array import array
+
+from .common import SERVICE_LABEL
+from .docker_api import DockerAPIError
+
+# Values stored per sample; network and block I/O are rates in bytes per second
+FIELDS = (
+    'cpu_percent', 'memory_usage', 'memory_limit', 'memory_percent',
+    'net_rx_rate', 'net_tx_rate', 'block_read_rate', 'block_write_rate',
+)
+
+# (resolution in seconds, samples kept): 10 minutes of 1s, 24 hours of 1min, 7 days of 15min
+DEFAULT_TIERS = ((1, 600), (60, 1440), (900, 672))
+
+
+class StatsError(Exception):
+    """Raised for stats queries that cannot be answered (unknown resolution, bad window)"""
+
+
+class RingBuffer:
+    """Fixed-capacity time series stored in flat float arrays, one per field"""
+
+    def __init__(self, capacity, fields=FIELDS):
+        self.capacity = capacity
+        self.fields = fields
+        self.times = array('d', bytes(8 * capacity))
+        self.columns = [array('d', bytes(8 * capacity)) for _ in fields]
+        self.start = 0
+        self.count = 0
+
+    def append(self, timestamp, values):
+        index = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.times[index] = timestamp
+        for column, value in zip(self.columns, values):
+            column[index] = value
+
+    def _first_since(self, since):
+        # Binary search over logical positions; times are appended in order
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[(self.start + middle) % self.capacity] < since:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def export(self, since):
+        """Samples at or after `since` as columns: {'t': [...], field: [...]}"""
+        first = self._first_since(since)
+        begin = (self.start + first) % self.capacity
+        size = self.count - first
+        end = begin + size
+
+        def window(values):
+            if end <= self.capacity:
+                return values[begin:end].tolist()
+            return values[begin:].tolist() + values[:end - self.capacity].tolist()
+
+        series = {'t': window(self.times)}
+        for field, column in zip(self.fields, self.columns):
+            series[field] = window(column)
+        return series
+
+
+class Tier:
+    """A ring buffer of bucket averages at one resolution"""
+
+    def __init__(self, resolution, capacity):
+        self.resolution = resolution
+        self.buffer = RingBuffer(capacity)
+        self._bucket = None
+        self._sums = [0.0] * len(FIELDS)
+        self._samples = 0
+
+    def add(self, timestamp, values):
+        bucket = timestamp - timestamp % self.resolution
+        if self._bucket is not None and bucket != self._bucket:
+            self.flush()
+        self._bucket = bucket
+        self._samples += 1
+        for i, value in enumerate(values):
+            self._sums[i] += value
+
+    def flush(self):
+        if self._samples:
+            self.buffer.append(self._bucket, [total / self._samples for total in self._sums])
+        self._sums = [0.0] * len(FIELDS)
+        self._samples = 0
+
+
+class ContainerSeries:
+    """Latest sample and downsampled history of one container"""
+
+    def __init__(self, name, service, tiers):
+        self.name = name
+        self.service = service
+        self.container_id = None
+        self.tiers = [Tier(resolution, capacity) for resolution, capacity in tiers]
+        self.latest = None
+        self.updated = None
+        self._counters = None
+        self._lock = threading.Lock()
+
+    def add(self, stats, timestamp):
+        sample = parse_stats(stats)
+        if sample is None:
+            return
+        counters = sample.pop('counters')
+        with self._lock:
+            previous, self._counters = self._counters, (timestamp, counters)
+            rates = [0.0] * len(counters)
+            if previous and timestamp > previous[0]:
+                elapsed = timestamp - previous[0]
+                # Counters reset when the container restarts
+                rates = [max(0.0, (now - before) / elapsed) for now, before in zip(counters, previous[1])]
+            sample.update(zip(FIELDS[4:], rates))
+            values = [sample[field] for field in FIELDS]
+            for tier in self.tiers:
+                tier.add(timestamp, values)
+            self.latest = sample
+            self.updated = timestamp
+
+    def export(self, resolution, since):
+        tier = next(tier for tier in self.tiers if tier.resolution == resolution)
+        with self._lock:
+            return {
+                'container': self.name,
+                'latest': dict(self.latest) if self.latest else None,
+                'updated': self.updated,
+                'samples': tier.buffer.export(since),
+            }
+
+
+def parse_stats(stats):
+    """CPU/memory values and I/O counters from one /containers/{id}/stats message
+
+    Uses the same formulas as `docker stats`. Returns None for messages
+    without a previous CPU reading (the first one of a stream).
+    """
+    cpu = stats.get('cpu_stats') or {}
+    precpu = stats.get('precpu_stats') or {}
+    system_delta = cpu.get('system_cpu_usage', 0) - precpu.get('system_cpu_usage', 0)
+    if not precpu.get('system_cpu_usage') or system_delta <= 0:
+        return None
+    cpu_delta = (cpu.get('cpu_usage') or {}).get('total_usage', 0) - (precpu.get('cpu_usage') or {}).get('total_usage', 0)
+    online = cpu.get('online_cpus') or len((cpu.get('cpu_usage') or {}).get('percpu_usage') or []) or 1
+    cpu_percent = max(0.0, cpu_delta / system_delta * online * 100.0)
+
+    memory = stats.get('memory_stats') or {}
+    details = memory.get('stats') or {}
+    # Page cache doesn't count: cgroup v2 reports inactive_file, v1 total_inactive_file
+    cache = details.get('inactive_file', details.get('total_inactive_file', 0))
+    usage = max(0, memory.get('usage', 0) - cache)
+    limit = memory.get('limit', 0)
+
+    rx = tx = 0
+    for network in (stats.get('networks') or {}).values():
+        rx += network.get('rx_bytes', 0)
+        tx += network.get('tx_bytes', 0)
+    read = write = 0
+    for entry in (stats.get('blkio_stats') or {}).get('io_service_bytes_recursive') or []:
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            read += entry.get('value', 0)
+        elif op == 'write':
+            write += entry.get('value', 0)
+
+    return {
+        'cpu_percent': round(cpu_percent, 2),
+        'memory_usage': usage,
+        'memory_limit': limit,
+        'memory_percent': round(100.0 * usage / limit, 2) if limit else 0.0,
+        'counters': (rx, tx, read, write),
+    }
+
+
+class StatsSampler:
+    """Follows one Engine API stats stream per running project container
+
+    A discovery thread lists the project's containers every
+    `discovery_interval` seconds, opens a stream for each newly running
+    container and closes streams of containers that went away. Samples are
+    keyed by container name, so a recreated container continues its series.
+    """
+
+    def __init__(self, client, project, tiers=DEFAULT_TIERS, discovery_interval=10.0):
+        self.client = client
+        self.project = project
+        self.tiers = tuple(sorted(tiers))
+        self.discovery_interval = discovery_interval
+        self._series = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = threading.Event()
+
+    def start(self):
+        """Start sampling if it is not running yet"""
+        with self._lock:
+            if self._thread is None and not self._closed.is_set():
+                self._thread = threading.Thread(target=self._run, name='stats-discovery', daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Stop discovery and close every stats stream"""
+        self._closed.set()
+        with self._lock:
+            responses = list(self._streams.values())
+            self._streams.clear()
+        for response in responses:
+            if response is not None:
+                response.close()
+
+    def _run(self):
+        while not self._closed.is_set():
+            try:
+                self._discover()
+            except DockerAPIError:
+                pass
+            self._closed.wait(self.discovery_interval)
+
+    def _discover(self):
+        containers = self.client.list_containers(self.project)
+        present = set()
+        for container in containers:
+            name = (container.get('Names') or ['/' + container['Id'][:12]])[0].lstrip('/')
+            present.add(name)
+            labels = container.get('Labels') or {}
+            with self._lock:
+                series = self._series.get(name)
+                if series is None:
+                    series = self._series[name] = ContainerSeries(
+                        name, labels.get(SERVICE_LABEL, ''), self.tiers)
+                streaming = container['Id'] in self._streams
+            if container.get('State') == 'running' and not streaming:
+                self._follow(series, container['Id'])
+
+        with self._lock:
+            for name in [name for name in self._series if name not in present]:
+                del self._series[name]
+            gone = [cid for cid in self._streams if cid not in {c['Id'] for c in containers if c.get('State') == 'running'}]
+            responses = [self._streams.pop(cid) for cid in gone]
+        for response in responses:
+            if response is not None:
+                response.close()
+
+    def _follow(self, series, container_id):
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._streams[container_id] = None
+        series.container_id = container_id
+        thread = threading.Thread(target=self._sample, args=(series, container_id),
+                                  name=f'stats-{container_id[:12]}', daemon=True)
+        thread.start()
+
+    def _sample(self, series, container_id):
+        try:
+            response = self.client.stream('GET', f'/containers/{container_id}/stats', {'stream': 1})
+            with self._lock:
+                if container_id not in self._streams:
+                    response.close()
+                    return
+                self._streams[container_id] = response
+            with response:
+                for stats in response.iter_json():
+                    series.add(stats, time.time())
+        except (OSError, ValueError, DockerAPIError):
+            pass
+        finally:
+            with self._lock:
+                self._streams.pop(container_id, None)
+
+    def resolution_for(self, window):
+        """Finest tier that covers the whole window"""
+        for resolution, capacity in self.tiers:
+            if resolution * capacity >= window:
+                return resolution
+        return self.tiers[-1][0]
+
+    def query(self, window, resolution=None, service=None):
+        """Samples of the last `window` seconds at a tier resolution, grouped by service"""
+        self.start()
+        if resolution is None:
+            resolution = self.resolution_for(window)
+        if resolution not in {res for res, _ in self.tiers}:
+            raise StatsError(f'Unknown resolution {resolution}; expected one of: '
+                             f'{", ".join(str(res) for res, _ in self.tiers)}')
+
+        since = time.time() - window
+        with self._lock:
+            series = sorted(self._series.values(), key=lambda s: s.name)
+        services = {}
+        for item in series:
+            if service and item.service != service:
+                continue
+            services.setdefault(item.service, []).append(item.export(resolution, since))
+        return {
+            'window': window,
+            'resolution': resolution,
+            'fields': list(FIELDS),
+            'services': services,
+        }
@@ -0,0 +1,146 @@
+"""Shared container status snapshot with single-flight refresh"""
+import threading
+import time
+
+from .metrics import CACHE_REQUESTS
+
+# Above this many invalidated services one full listing is cheaper than per-service calls
+_PARTIAL_REFRESH_LIMIT = 3
+
+
+class _Flight:
+    """One in-flight refresh that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class StatusSnapshot:
+    """Caches container status for a TTL and coalesces concurrent refreshes
+
+    fetch(service=None) returns the list of container summaries for the whole
+    project, or only for one service. A background thread keeps the snapshot
+    warm while clients are polling it.
+    """
+
+    def __init__(self, fetch, ttl=2.0, refresh_interval=None, idle_timeout=60.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.refresh_interval = ttl if refresh_interval is None else refresh_interval
+        self.idle_timeout = idle_timeout
+
+        self._by_service = {}
+        self._fetched_at = None
+        # Invalidated service -> generation, so invalidations racing a refresh are kept
+        self._stale = {}
+        self._generation = 0
+        self._flight = None
+        self._last_read = 0.0
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._closed = threading.Event()
+
+    def get(self):
+        """Return (containers, age_seconds), refreshing first when expired or invalidated"""
+        self._last_read = time.monotonic()
+        self._ensure_refresher()
+
+        with self._lock:
+            if self._is_fresh():
+                CACHE_REQUESTS.inc(cache='status', result='hit')
+                return self._assemble()
+        CACHE_REQUESTS.inc(cache='status', result='miss')
+        self.refresh()
+        with self._lock:
+            return self._assemble()
+
+    def invalidate(self, service=None):
+        """Mark one service (or the whole snapshot) as needing a refresh"""
+        with self._lock:
+            if service is None:
+                self._fetched_at = None
+            else:
+                self._generation += 1
+                self._stale[service] = self._generation
+
+    def refresh(self, force=False):
+        """Refresh the snapshot, sharing the work with any refresh already in flight"""
+        with self._lock:
+            if not force and self._is_fresh():
+                return
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+                stale = dict(self._stale)
+                full = force or self._expired() or len(stale) > _PARTIAL_REFRESH_LIMIT
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return
+
+        started = time.monotonic()
+        try:
+            if full:
+                fetched = {None: self.fetch()}
+            else:
+                fetched = {service: self.fetch(service) for service in stale}
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._flight = None
+            flight.done.set()
+            raise
+
+        with self._lock:
+            if full:
+                self._by_service = {}
+                self._fetched_at = started
+            for service, containers in fetched.items():
+                if service is not None:
+                    self._by_service.pop(service, None)
+                for container in containers:
+                    self._by_service.setdefault(container.get('Service', ''), []).append(container)
+            for service, generation in stale.items():
+                if self._stale.get(service) == generation:
+                    del self._stale[service]
+            self._flight = None
+        flight.done.set()
+
+    def _expired(self):
+        return self._fetched_at is None or time.monotonic() - self._fetched_at >= self.ttl
+
+    def _is_fresh(self):
+        return not self._expired() and not self._stale
+
+    def _assemble(self):
+        containers = [c for group in self._by_service.values() for c in group]
+        containers.sort(key=lambda c: c['Name'])
+        age = time.monotonic() - self._fetched_at if self._fetched_at is not None else 0.0
+        return containers, age
+
+    def close(self):
+        """Stop the background refresher"""
+        self._closed.set()
+
+    def _ensure_refresher(self):
+        if self._refresher is not None or self.refresh_interval <= 0 or self._closed.is_set():
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name='status-refresher', daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._closed.wait(self.refresh_interval):
+            # Only keep the snapshot warm while somebody is actually looking at it
+            if time.monotonic() - self._last_read > self.idle_timeout:
+                continue
+            try:
+                self.refresh(force=True)
+            except Exception:
+                # The next foreground read will surface the error
+                pass
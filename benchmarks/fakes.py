@@ -0,0 +1,224 @@
+"""Fake Docker Engine API socket and docker-compose CLI for offline benchmarks
+
+Both fakes answer for a generated fleet of services (svc-0001 ... svc-NNNN)
+with configurable latency and failure rate.
+"""
+import http.server
+import json
+import os
+import random
+import socketserver
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+PROJECT = 'bench'
+
+
+def service_names(fleet):
+    return [f'svc-{i:04d}' for i in range(1, fleet + 1)]
+
+
+def write_compose_file(directory, fleet):
+    """Compose file for the fleet; every service gets an image and a published port"""
+    path = os.path.join(directory, 'docker-compose.yml')
+    with open(path, 'w') as file:
+        file.write(f'name: {PROJECT}\nservices:\n')
+        for i, name in enumerate(service_names(fleet)):
+            file.write(f'  {name}:\n    image: nginx:alpine\n    ports:\n      - "{20000 + i}:80"\n')
+    return path
+
+
+def api_container(name, index):
+    state = 'running' if index % 10 else 'exited'
+    return {
+        'Id': f'{index:064x}',
+        'Names': [f'/{PROJECT}-{name}-1'],
+        'Image': 'nginx:alpine',
+        'ImageID': 'sha256:' + 'a' * 64,
+        'State': state,
+        'Status': 'Up 2 hours' if state == 'running' else 'Exited (0) 1 hour ago',
+        'Created': 1700000000 + index,
+        'Labels': {'com.docker.compose.project': PROJECT, 'com.docker.compose.service': name},
+        'Ports': [{'IP': '0.0.0.0', 'PrivatePort': 80, 'PublicPort': 20000 + index, 'Type': 'tcp'}],
+    }
+
+
+# What /images/create streams for an image that is already up to date
+PULL_STREAM = b''.join(json.dumps(message).encode() + b'\n' for message in (
+    {'status': 'Pulling from library/nginx', 'id': 'alpine'},
+    {'status': 'Digest: sha256:' + 'b' * 64},
+    {'status': 'Status: Image is up to date for nginx:alpine'},
+))
+
+
+def inspect_container(container):
+    running = container['State'] == 'running'
+    return {
+        'Id': container['Id'],
+        'RestartCount': int(container['Id'], 16) % 3,
+        'State': {
+            'Status': container['State'],
+            'StartedAt': '2024-01-01T10:00:00.000000000Z',
+            'FinishedAt': '0001-01-01T00:00:00Z' if running else '2024-01-01T11:00:00.000000000Z',
+            'ExitCode': 0,
+            'Health': {'Status': 'healthy'} if running else None,
+        },
+    }
+
+
+class _Behaviour:
+    def __init__(self, latency, failure_rate, jitter):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+
+    def delay(self):
+        if self.latency:
+            time.sleep(max(0.0, random.gauss(self.latency, self.latency * self.jitter)))
+
+    def fails(self):
+        return random.random() < self.failure_rate
+
+
+class FakeDockerAPI:
+    """Threaded HTTP server on a unix socket implementing the Engine API calls the app makes"""
+
+    def __init__(self, socket_path, fleet, latency=0.0, failure_rate=0.0, jitter=0.2):
+        self.socket_path = socket_path
+        self.behaviour = _Behaviour(latency, failure_rate, jitter)
+        containers = [api_container(name, i) for i, name in enumerate(service_names(fleet), 1)]
+        self.by_service = {c['Labels']['com.docker.compose.service']: c for c in containers}
+        self.by_id = {c['Id']: c for c in containers}
+        self.listing = json.dumps(containers).encode()
+
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self)
+
+            do_POST = do_GET
+
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+            def get_request(self):
+                request, _ = super().get_request()
+                return request, ('fake-docker', 0)
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.server = Server(socket_path, Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-docker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        path = url.path.split('/', 2)[-1] if url.path.startswith('/v1.') else url.path.lstrip('/')
+        if path == 'events':
+            # Hold the subscription open without sending anything
+            handler.send_response(200)
+            handler.send_header('Transfer-Encoding', 'chunked')
+            handler.end_headers()
+            time.sleep(3600)
+            return
+
+        self.behaviour.delay()
+        if self.behaviour.fails():
+            return self._send(handler, 500, b'{"message":"injected failure"}')
+        if path == 'containers/json':
+            labels = json.loads(parse_qs(url.query).get('filters', ['{}'])[0]).get('label', [])
+            service = next((label.split('=', 1)[1] for label in labels
+                            if label.startswith('com.docker.compose.service=')), None)
+            if service is None:
+                return self._send(handler, 200, self.listing)
+            found = [self.by_service[service]] if service in self.by_service else []
+            return self._send(handler, 200, json.dumps(found).encode())
+        if path.startswith('containers/') and path.endswith('/json'):
+            container = self.by_id.get(path.split('/')[1])
+            if container is None:
+                return self._send(handler, 404, b'{"message":"No such container"}')
+            return self._send(handler, 200, json.dumps(inspect_container(container)).encode())
+        if path.startswith('images/') and path.endswith('/json'):
+            # The image every fake container runs, so pulls find nothing to recreate
+            image = {'Id': 'sha256:' + 'a' * 64, 'RepoDigests': ['nginx@sha256:' + 'b' * 64]}
+            return self._send(handler, 200, json.dumps(image).encode())
+        if path == 'images/create':
+            return self._send(handler, 200, PULL_STREAM)
+        return self._send(handler, 404, b'{"message":"not implemented by the fake"}')
+
+    @staticmethod
+    def _send(handler, status, body):
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def write_fake_compose(directory, fleet, latency=0.0, failure_rate=0.0, jitter=0.2):
+    """Install an executable `docker-compose` in `directory` that runs fake_compose_main"""
+    path = os.path.join(directory, 'docker-compose')
+    with open(path, 'w') as file:
+        file.write(
+            f'#!/bin/sh\n'
+            f'BENCH_FLEET={fleet} BENCH_LATENCY={latency} BENCH_FAILURE_RATE={failure_rate} BENCH_JITTER={jitter} '
+            f'exec "{sys.executable}" "{os.path.abspath(__file__)}" "$@"\n'
+        )
+    os.chmod(path, 0o755)
+    return path
+
+
+def fake_compose_main(args):
+    """docker-compose stand-in: ps prints the fleet, every other subcommand just succeeds (or fails)"""
+    fleet = int(os.environ.get('BENCH_FLEET', '10'))
+    behaviour = _Behaviour(float(os.environ.get('BENCH_LATENCY', '0')),
+                           float(os.environ.get('BENCH_FAILURE_RATE', '0')),
+                           float(os.environ.get('BENCH_JITTER', '0.2')))
+    positional = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg in ('-p', '-f', '--format'):
+            skip = True
+        elif not arg.startswith('-'):
+            positional.append(arg)
+    subcommand = positional[0] if positional else ''
+
+    behaviour.delay()
+    if behaviour.fails():
+        sys.stderr.write(f'injected failure for {subcommand}\n')
+        return 1
+    if subcommand == 'ps':
+        wanted = set(positional[1:])
+        for i, name in enumerate(service_names(fleet), 1):
+            if wanted and name not in wanted:
+                continue
+            container = api_container(name, i)
+            print(json.dumps({
+                'Name': container['Names'][0].lstrip('/'),
+                'Service': name,
+                'State': container['State'],
+                'Status': container['Status'],
+                'Publishers': [{'URL': '0.0.0.0', 'TargetPort': 80, 'PublishedPort': 20000 + i, 'Protocol': 'tcp'}],
+            }))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(fake_compose_main(sys.argv[1:]))
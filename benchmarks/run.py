@@ -0,0 +1,210 @@
+"""Benchmark the API against fake Docker backends, fully offline
+
+    python benchmarks/run.py --fleet 100 --latency 0.05 --concurrency 16 --output results.json
+    python benchmarks/run.py --fleet 100 --baseline results.json
+
+Starts the Flask app in-process on a local port, pointed at a fake Docker
+socket and a fake docker-compose binary, drives each scenario at the given
+concurrency and prints JSON with throughput and p50/p95/p99 latency. With
+--baseline, scenarios whose p95 got worse than --threshold are reported and
+the exit status is 1.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import PROJECT, FakeDockerAPI, service_names, write_compose_file, write_fake_compose  # noqa: E402
+
+SCENARIOS = ('services', 'status', 'status_details', 'dashboard', 'actions')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    milliseconds = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput': round((len(latencies) + errors) / elapsed, 2) if elapsed else None,
+        'mean_ms': milliseconds(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': milliseconds(percentile(latencies, 0.50)),
+        'p95_ms': milliseconds(percentile(latencies, 0.95)),
+        'p99_ms': milliseconds(percentile(latencies, 0.99)),
+        'max_ms': milliseconds(latencies[-1]) if latencies else None,
+    }
+
+
+def drive(port, requests, concurrency, make_request):
+    """Send `requests` requests from `concurrency` keep-alive clients; returns the scenario summary
+
+    Responses below 500 count as successes, except for ?wait requests: their
+    job has to have finished successfully (200), not failed or still be queued.
+    """
+    local = threading.local()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        method, path = make_request(i)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status == 200 if 'wait=' in path else response.status < 500
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            local.connection = None
+            ok = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            (latencies if ok else errors).append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return summarize(latencies, len(errors), time.perf_counter() - started)
+
+
+def compare(results, baseline, threshold):
+    """Per-scenario p95 change against a baseline run; regressions exceed threshold"""
+    comparison = {}
+    for name, current in results.items():
+        before = (baseline.get('scenarios') or {}).get(name)
+        if not before or not before.get('p95_ms') or current.get('p95_ms') is None:
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        comparison[name] = {
+            'baseline_p95_ms': before['p95_ms'],
+            'p95_ms': current['p95_ms'],
+            'p95_change': round(change, 4),
+            'baseline_throughput': before.get('throughput'),
+            'throughput': current.get('throughput'),
+            'regression': change > threshold,
+        }
+    return comparison
+
+
+def start_app(env):
+    """Import the app with the fake environment and serve it on a free local port"""
+    os.environ.update(env)
+    from werkzeug.serving import make_server
+
+    # Per-request access logs would dominate the run
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    import app as server_module
+    server = make_server('127.0.0.1', 0, server_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--fleet', type=int, default=100, help='services in the fake project (10 to 1000)')
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds each fake Docker call takes')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of fake calls that fail')
+    parser.add_argument('--backend', choices=('api', 'cli'), default='api',
+                        help='status via the fake socket or the fake docker-compose ps')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'comma-separated: {", ".join(SCENARIOS)}')
+    parser.add_argument('--action', default='restart', help='action the actions scenario runs')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the JSON report to this file')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed p95 increase over the baseline')
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+
+    workdir = tempfile.mkdtemp(prefix='hsm-bench-')
+    compose_path = write_compose_file(workdir, args.fleet)
+    write_fake_compose(workdir, args.fleet, args.latency, args.failure_rate)
+    socket_path = os.path.join(workdir, 'docker.sock')
+    fake_api = FakeDockerAPI(socket_path, args.fleet, args.latency, args.failure_rate).start()
+
+    server = start_app({
+        'PATH': f'{workdir}{os.pathsep}{os.environ.get("PATH", "")}',
+        'DOCKER_HOST': f'unix://{socket_path}',
+        'DOCKER_COMPOSE_PATH': compose_path,
+        'COMPOSE_PROJECT_NAME': PROJECT,
+        'STATUS_BACKEND': args.backend,
+        'JOB_WORKERS': str(args.concurrency),
+        'HISTORY_DB': os.path.join(workdir, 'history.db'),
+    })
+    port = server.server_port
+    services = service_names(args.fleet)
+
+    requests = {
+        'services': lambda i: ('GET', '/api/services'),
+        'status': lambda i: ('GET', '/api/containers/status'),
+        'dashboard': lambda i: ('GET', '/api/dashboard'),
+        'status_details': lambda i: ('GET', '/api/containers/status?fields=all&sort=-RestartCount&limit=50'),
+        # ?wait makes the latency cover the whole action, not just queueing it
+        'actions': lambda i: ('POST', f'/api/containers/{args.action}/{services[i % len(services)]}?wait=120'),
+    }
+
+    results = {}
+    try:
+        for name in scenarios:
+            # One warm-up request so compose parsing isn't charged to the first sample
+            drive(port, 1, 1, requests[name])
+            results[name] = drive(port, args.requests, args.concurrency, requests[name])
+    finally:
+        server.shutdown()
+        fake_api.stop()
+
+    report = {
+        'config': {
+            'fleet': args.fleet,
+            'latency': args.latency,
+            'failure_rate': args.failure_rate,
+            'backend': args.backend,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'action': args.action,
+        },
+        'scenarios': results,
+    }
+    regressed = False
+    if args.baseline:
+        with open(args.baseline) as file:
+            report['comparison'] = compare(results, json.load(file), args.threshold)
+        regressed = any(entry['regression'] for entry in report['comparison'].values())
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,62 +1,133 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import "./App.css";
 import ContainerCard from "./components/ContainerCard";
 
 function App() {
   const [services, setServices] = useState([]);
   const [containerStatus, setContainerStatus] = useState({});
+  const [jobProgress, setJobProgress] = useState({});
   const [loading, setLoading] = useState(true);
   const [statusLoading, setStatusLoading] = useState(false);
   const [error, setError] = useState(null);
+  // Dashboard version we hold and the entries it describes, for conditional polls
+  const dashboardVersion = useRef(null);
+  const dashboardEntries = useRef({});
 
   useEffect(() => {
-    const initializeApp = async () => {
-      await fetchServices();
-      await fetchContainerStatus();
-    };
-    initializeApp();
+    fetchDashboard().finally(() => setLoading(false));
   }, []);
 
-  const fetchServices = async () => {
+  useEffect(() => {
+    // Live updates: the server pushes only the services whose containers changed
+    if (!window.EventSource) return;
+    const source = new EventSource("/api/containers/stream");
+
+    source.addEventListener("snapshot", (event) => {
+      const data = JSON.parse(event.data);
+      const statusMap = {};
+      data.containers.forEach((container) => {
+        statusMap[container.Service] = container;
+      });
+      setContainerStatus(statusMap);
+    });
+
+    source.addEventListener("delta", (event) => {
+      const { service, containers } = JSON.parse(event.data);
+      setContainerStatus((previous) => {
+        const next = { ...previous };
+        if (containers.length > 0) {
+          next[service] = containers[containers.length - 1];
+        } else {
+          delete next[service];
+        }
+        return next;
+      });
+    });
+
+    return () => source.close();
+  }, []);
+
+  const fetchDashboard = async () => {
+    // One request for services and status; unchanged polls come back as an empty 304
     try {
-      setLoading(true);
-      const response = await fetch("/api/services");
+      setStatusLoading(true);
+      const version = dashboardVersion.current;
+      const response = await fetch(
+        version ? `/api/dashboard?since=${encodeURIComponent(version)}` : "/api/dashboard",
+        { headers: version ? { "If-None-Match": `"${version}"` } : {} }
+      );
+      if (response.status === 304) return;
       const data = await response.json();
 
-      if (data.status === "success") {
-        setServices(data.services);
-        setError(null);
-      } else {
-        setError(data.message);
+      if (data.status !== "success") {
+        throw new Error(data.message);
       }
+
+      const entries = data.full ? {} : { ...dashboardEntries.current };
+      data.removed.forEach((name) => delete entries[name]);
+      data.services.forEach((entry) => {
+        entries[entry.name] = entry;
+      });
+      dashboardEntries.current = entries;
+      dashboardVersion.current = data.version;
+
+      // Create a map of service name to container data
+      const statusMap = {};
+      data.order.forEach((name) => {
+        const containers = entries[name] ? entries[name].containers : [];
+        if (containers.length > 0) {
+          statusMap[name] = containers[containers.length - 1];
+        }
+      });
+      setServices(data.order);
+      setContainerStatus(statusMap);
+      setError(null);
     } catch (err) {
-      setError(err.message);
+      // Once the dashboard has loaded, a failed refresh keeps showing the last view
+      if (dashboardVersion.current) {
+        console.error("Error refreshing dashboard:", err);
+      } else {
+        setError(err.message);
+      }
     } finally {
-      setLoading(false);
+      setStatusLoading(false);
     }
   };
 
-  const fetchContainerStatus = async () => {
-    try {
-      setStatusLoading(true);
-      const response = await fetch("/api/containers/status");
+  const pollJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`/api/jobs/${jobId}`);
       const data = await response.json();
-
-      if (data.status === "success") {
-        // Create a map of service name to container data
-        const statusMap = {};
-        data.containers.forEach((container) => {
-          statusMap[container.Service] = container;
-        });
-        setContainerStatus(statusMap);
+      if (data.status !== "success") {
+        throw new Error(data.message);
       }
-    } catch (err) {
-      console.error("Error fetching container status:", err);
-    } finally {
-      setStatusLoading(false);
+      if (["succeeded", "failed", "cancelled"].includes(data.job.status)) {
+        return data.job;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
     }
   };
 
+  const waitForJob = (jobId, onProgress) => {
+    // Actions run as background jobs; follow the job's event stream until it finishes
+    if (!window.EventSource) return pollJob(jobId);
+
+    return new Promise((resolve, reject) => {
+      const source = new EventSource(`/api/jobs/${jobId}/events`);
+      source.addEventListener("progress", (event) => {
+        onProgress(JSON.parse(event.data));
+      });
+      source.addEventListener("result", (event) => {
+        source.close();
+        resolve(JSON.parse(event.data));
+      });
+      source.onerror = () => {
+        source.close();
+        pollJob(jobId).then(resolve, reject);
+      };
+    });
+  };
+
   const handleContainerAction = async (service, action) => {
     try {
       const response = await fetch(`/api/containers/${action}/${service}`, {
@@ -64,14 +135,27 @@ function App() {
       });
       const data = await response.json();
 
-      if (data.status === "success") {
-        // Refresh status after action
-        setTimeout(() => {
-          fetchContainerStatus();
-        }, 1000);
-      } else {
+      if (data.status !== "accepted") {
         console.error(`Failed to ${action} ${service}:`, data.message);
         alert(`Failed to ${action} ${service}: ${data.message}`);
+        return;
+      }
+
+      const job = await waitForJob(data.job_id, (progress) => {
+        setJobProgress((previous) => ({ ...previous, [service]: progress }));
+      });
+      setJobProgress((previous) => {
+        const next = { ...previous };
+        delete next[service];
+        return next;
+      });
+      if (job.status === "succeeded") {
+        // Refresh status after action
+        fetchDashboard();
+      } else {
+        const message = job.result ? job.result.message : job.error;
+        console.error(`Failed to ${action} ${service}:`, message);
+        alert(`Failed to ${action} ${service}: ${message}`);
       }
     } catch (err) {
       console.error(`Error performing ${action} on ${service}:`, err);
@@ -126,7 +210,7 @@ function App() {
       <div className="status-control">
         <button
           className="btn-refresh-status"
-          onClick={fetchContainerStatus}
+          onClick={fetchDashboard}
           disabled={statusLoading}
         >
           {statusLoading ? "Refreshing..." : "🔄 Refresh Status"}
@@ -144,6 +228,7 @@ function App() {
               key={service}
               service={service}
               status={containerStatus[service]}
+              progress={jobProgress[service]}
               onAction={handleContainerAction}
             />
           ))
@@ -1,7 +1,7 @@
 import { useState } from "react";
 import "./ContainerCard.css";
 
-function ContainerCard({ service, status, onAction }) {
+function ContainerCard({ service, status, progress, onAction }) {
   const [actionLoading, setActionLoading] = useState(false);
 
   const getStateColor = (state) => {
@@ -58,6 +58,19 @@ function ContainerCard({ service, status, onAction }) {
         </div>
       )}
 
+      {progress && progress.percent !== null && (
+        <div className="pull-progress">
+          <div
+            className="pull-progress-bar"
+            style={{ width: `${progress.percent}%` }}
+          ></div>
+          <span className="pull-progress-label">
+            Pulling {progress.percent}% ({progress.layers_done}/
+            {progress.layers_total} layers)
+          </span>
+        </div>
+      )}
+
       <div className="card-actions">
         {isDown ? (
           <>
@@ -0,0 +1,48 @@
+"""Gunicorn settings for the production server
+
+    gunicorn -c gunicorn.conf.py app:app
+
+On SIGTERM a worker keeps serving while it finishes queued and running jobs
+(image pulls can take minutes), with /api/ready answering 503 and new actions
+refused, then stops accepting connections and lets in-flight requests end.
+"""
+import os
+import signal
+import threading
+
+bind = os.getenv('BIND', f'{os.getenv("HOST", "0.0.0.0")}:{os.getenv("PORT", "5000")}')
+
+# Jobs, status snapshots, log buffers and stats series live in process memory;
+# each extra worker keeps its own copies, so more than one only suits read-heavy setups
+workers = int(os.getenv('SERVER_WORKERS', '1'))
+worker_class = 'gthread'
+# Every open status, log or job event stream holds a thread
+threads = int(os.getenv('SERVER_THREADS', '32'))
+keepalive = int(os.getenv('SERVER_KEEPALIVE', '5'))
+# Seconds a stopping worker gets to drain before it is killed
+graceful_timeout = int(os.getenv('SERVER_DRAIN_TIMEOUT', '300'))
+# Worker heartbeat, not a request limit: gthread workers keep beating during long requests
+timeout = int(os.getenv('SERVER_TIMEOUT', '30'))
+accesslog = os.getenv('SERVER_ACCESS_LOG') or None
+
+# Part of the graceful timeout kept for in-flight requests once jobs are done
+_REQUEST_GRACE = 5
+
+
+def post_worker_init(worker):
+    """Replace the worker's SIGTERM handler with one that drains jobs first"""
+
+    def drain_then_exit(signum, frame):
+        threading.Thread(target=_drain, args=(worker,), name='drain', daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain_then_exit)
+
+
+def _drain(worker):
+    import app
+
+    worker.log.info('Draining: waiting for queued and running jobs')
+    if not app.drain(max(0, worker.cfg.graceful_timeout - _REQUEST_GRACE)):
+        worker.log.warning('Jobs still running at the end of the drain timeout')
+    # What gunicorn's own SIGTERM handler does: stop accepting and finish in-flight requests
+    worker.alive = False
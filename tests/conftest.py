@@ -0,0 +1,44 @@
+"""Fixtures running the backend against the in-process fakes the benchmarks use"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from benchmarks.fakes import FakeDockerAPI, write_fake_compose
+
+FLEET = 3
+
+
+@pytest.fixture
+def socket_dir():
+    # Short directory: unix socket paths are limited to about 100 characters
+    directory = tempfile.mkdtemp(prefix='hsm-')
+    yield directory
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def fake_docker(socket_dir):
+    """Factory starting fake Docker Engine API servers; all are stopped after the test"""
+    servers = []
+
+    def start(name='docker', fleet=FLEET, **behaviour):
+        server = FakeDockerAPI(os.path.join(socket_dir, f'{name}.sock'), fleet, **behaviour).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def fake_compose(tmp_path, monkeypatch):
+    """Factory putting a fake docker-compose first on PATH"""
+
+    def install(fleet=FLEET, **behaviour):
+        write_fake_compose(str(tmp_path), fleet, **behaviour)
+        monkeypatch.setenv('PATH', f'{tmp_path}{os.pathsep}{os.environ.get("PATH", "")}')
+
+    return install
@@ -0,0 +1,46 @@
+"""StatusEventHub falling back to polling when there is no Docker events subscription"""
+import json
+import os
+
+import pytest
+
+from backend.docker_api import DockerClient
+from backend.events import StatusEventHub
+from benchmarks.fakes import PROJECT
+
+
+def container(service, state):
+    return {'Name': f'{PROJECT}-{service}-1', 'Service': service, 'State': state, 'Status': '', 'Ports': []}
+
+
+def next_event(stream):
+    # Skips the retry hint and keepalives
+    for message in stream:
+        if message.startswith('id: '):
+            lines = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+            return lines['event'], json.loads(lines['data'])
+    raise AssertionError('stream ended')
+
+
+@pytest.mark.parametrize('subscribe', [True, False])
+def test_changes_are_pushed_from_polled_listings(socket_dir, subscribe):
+    listing = [container('web', 'running')]
+    changes = []
+    hub = StatusEventHub(DockerClient(f'unix://{os.path.join(socket_dir, "missing.sock")}', timeout=1), PROJECT,
+                         fetch=lambda service=None: list(listing), on_change=changes.append,
+                         poll=lambda: list(listing), poll_interval=0.05, heartbeat=1.0, subscribe=subscribe)
+    stream = hub.stream()
+    try:
+        assert next_event(stream) == ('snapshot', {'containers': [container('web', 'running')]})
+
+        listing[:] = [container('web', 'exited'), container('db', 'running')]
+        events = [next_event(stream), next_event(stream)]
+        assert sorted(events, key=lambda event: event[1]['service']) == [
+            ('delta', {'service': 'db', 'containers': [container('db', 'running')]}),
+            ('delta', {'service': 'web', 'containers': [container('web', 'exited')]}),
+        ]
+        # Polled changes come from the status cache, which needn't be invalidated for them
+        assert changes == []
+    finally:
+        stream.close()
+        hub.close()
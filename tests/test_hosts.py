@@ -0,0 +1,104 @@
+"""HostFederation fan-out, timeouts and circuit breakers against several fake Docker hosts"""
+import os
+import time
+
+from backend.hosts import CIRCUIT_OPEN, ERROR, OK, TIMEOUT, DockerHost, HostFederation, parse_hosts
+from benchmarks.fakes import PROJECT, service_names
+
+from .conftest import FLEET
+
+
+def host_for(name, socket_path, timeout=2.0, **breaker):
+    return DockerHost(name, f'unix://{socket_path}', timeout, **breaker)
+
+
+def statuses(reports):
+    return {report['name']: report['status'] for report in reports}
+
+
+def test_results_of_every_host_are_merged_and_tagged(fake_docker):
+    federation = HostFederation([
+        host_for('a', fake_docker('a').socket_path),
+        host_for('b', fake_docker('b', fleet=2).socket_path),
+    ])
+
+    containers, reports = federation.list_containers(PROJECT)
+    assert [(c['Name'], c['Host']) for c in containers] == sorted(
+        [(f'{PROJECT}-{name}-1', 'a') for name in service_names(FLEET)]
+        + [(f'{PROJECT}-{name}-1', 'b') for name in service_names(2)])
+    assert statuses(reports) == {'a': OK, 'b': OK}
+    assert {report['name']: report['containers'] for report in reports} == {'a': FLEET, 'b': 2}
+
+    services, _ = federation.services(PROJECT)
+    assert services == {'a': service_names(FLEET), 'b': service_names(2)}
+
+
+def test_slow_host_times_out_without_delaying_the_others(fake_docker):
+    federation = HostFederation([
+        host_for('fast', fake_docker('fast').socket_path),
+        host_for('slow', fake_docker('slow', latency=2.0, jitter=0.0).socket_path, timeout=0.2),
+    ])
+
+    started = time.monotonic()
+    containers, reports = federation.list_containers(PROJECT)
+    assert time.monotonic() - started < 1.0
+    assert {c['Host'] for c in containers} == {'fast'}
+    assert statuses(reports) == {'fast': OK, 'slow': TIMEOUT}
+
+
+def test_failing_host_is_reported_with_its_error(fake_docker, socket_dir):
+    federation = HostFederation([
+        host_for('up', fake_docker('up').socket_path),
+        host_for('broken', fake_docker('broken', failure_rate=1.0).socket_path),
+        host_for('down', os.path.join(socket_dir, 'down.sock')),
+    ])
+
+    containers, reports = federation.list_containers(PROJECT)
+    assert len(containers) == FLEET
+    assert statuses(reports) == {'up': OK, 'broken': ERROR, 'down': ERROR}
+    assert reports[1]['error'] == 'injected failure'
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_after_a_trial(fake_docker, socket_dir):
+    socket_path = os.path.join(socket_dir, 'flaky.sock')
+    host = host_for('flaky', socket_path, failure_threshold=2, reset_timeout=0.3)
+    federation = HostFederation([host])
+
+    for _ in range(2):
+        _, reports = federation.list_containers(PROJECT)
+        assert statuses(reports) == {'flaky': ERROR}
+    assert host.breaker.state == 'open'
+
+    # Refused without calling the host, even though it is reachable now
+    fake_docker('flaky')
+    containers, reports = federation.list_containers(PROJECT)
+    assert containers == []
+    assert statuses(reports) == {'flaky': CIRCUIT_OPEN}
+
+    time.sleep(0.3)
+    assert host.breaker.state == 'half_open'
+    containers, reports = federation.list_containers(PROJECT)
+    assert len(containers) == FLEET
+    assert statuses(reports) == {'flaky': OK}
+    assert host.breaker.state == 'closed'
+
+
+def test_failed_trial_reopens_the_circuit(socket_dir):
+    host = host_for('down', os.path.join(socket_dir, 'down.sock'), failure_threshold=1, reset_timeout=0.2)
+    federation = HostFederation([host])
+
+    federation.list_containers(PROJECT)
+    time.sleep(0.2)
+    _, reports = federation.list_containers(PROJECT)
+    assert statuses(reports) == {'down': ERROR}
+    _, reports = federation.list_containers(PROJECT)
+    assert statuses(reports) == {'down': CIRCUIT_OPEN}
+
+
+def test_parse_hosts_reads_names_and_per_host_timeouts():
+    local, nas, unnamed = parse_hosts(
+        'local=unix:///var/run/docker.sock,nas=tcp://10.0.0.5:2375?timeout=2,tcp://10.0.0.6', timeout=5.0)
+
+    assert (local.name, local.url, local.timeout) == ('local', 'unix:///var/run/docker.sock', 5.0)
+    assert (nas.name, nas.url, nas.timeout) == ('nas', 'tcp://10.0.0.5:2375', 2.0)
+    assert unnamed.name == '10.0.0.6'
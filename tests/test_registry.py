@@ -0,0 +1,223 @@
+"""RegistryClient and UpdateChecker against a local registry stub with a bearer-token challenge"""
+import base64
+import http.server
+import json
+import threading
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+from backend.compose import ComposeCache
+from backend.docker_api import DockerAPIError
+from backend.images import ImageReference
+from backend.registry import (ERROR, OUTDATED, PINNED, UP_TO_DATE, RegistryClient, RegistryError, UpdateChecker,
+                              UpdateScanner)
+
+DIGEST = 'sha256:' + 'c' * 64
+TOKEN = 'stub-token'
+
+
+class RegistryStub:
+    """Registry on 127.0.0.1 that answers anonymous manifest requests with a bearer challenge
+
+    Manifests are served for {repository: {tag: digest}}; every request is
+    recorded as (method, path, headers).
+    """
+
+    def __init__(self, manifests, challenge=True):
+        self.manifests = manifests
+        self.challenge = challenge
+        # The one token the stub accepts and hands out; changing it revokes the old one
+        self.valid_token = TOKEN
+        self.requests = []
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                stub.requests.append(('HEAD', self.path, dict(self.headers)))
+                stub.manifest(self)
+
+            def do_GET(self):
+                stub.requests.append(('GET', self.path, dict(self.headers)))
+                stub.token(self)
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = f'localhost:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, name='registry-stub', daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def manifest(self, handler):
+        if handler.headers.get('Authorization') != f'Bearer {self.valid_token}':
+            handler.send_response(401)
+            if self.challenge:
+                realm = f'http://{self.host}/token'
+                handler.send_header('WWW-Authenticate', f'Bearer realm="{realm}",service="stub"')
+            handler.end_headers()
+            return
+        # /v2/<repository>/manifests/<tag>
+        repository, _, tag = handler.path[len('/v2/'):].rpartition('/manifests/')
+        digest = self.manifests.get(repository, {}).get(tag)
+        handler.send_response(200 if digest else 404)
+        if digest:
+            handler.send_header('Docker-Content-Digest', digest)
+        handler.end_headers()
+
+    def token(self, handler):
+        url = urlparse(handler.path)
+        query = parse_qs(url.query)
+        if url.path != '/token' or query.get('service') != ['stub']:
+            handler.send_response(400)
+            handler.end_headers()
+            return
+        body = json.dumps({'token': self.valid_token, 'expires_in': 300}).encode()
+        handler.send_response(200)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def count(self, method):
+        return sum(1 for request in self.requests if request[0] == method)
+
+
+class LocalImages:
+    """The get_json call UpdateChecker makes on the Docker client, answering from {reference: RepoDigests}"""
+
+    def __init__(self, repo_digests):
+        self.repo_digests = repo_digests
+
+    def get_json(self, path, params=None):
+        reference = unquote(path[len('/images/'):-len('/json')])
+        return {'RepoDigests': self.repo_digests[reference]}
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    # No Docker CLI credentials unless a test writes some
+    monkeypatch.setenv('DOCKER_CONFIG', str(tmp_path))
+    stubs = []
+
+    def start(manifests, **options):
+        stub = RegistryStub(manifests, **options)
+        stubs.append(stub)
+        return stub
+
+    yield start
+    for stub in stubs:
+        stub.stop()
+
+
+def test_bearer_challenge_is_answered_and_the_token_reused(registry):
+    stub = registry({'team/app': {'1.0': DIGEST}})
+    client = RegistryClient(timeout=5)
+    image = ImageReference(f'{stub.host}/team/app:1.0')
+
+    assert client.manifest_digest(image) == DIGEST
+    assert client.manifest_digest(image) == DIGEST
+    # One anonymous HEAD, one token request, then authorized HEADs only
+    assert [method for method, _, _ in stub.requests] == ['HEAD', 'GET', 'HEAD', 'HEAD']
+    _, token_path, _ = stub.requests[1]
+    assert parse_qs(urlparse(token_path).query)['scope'] == ['repository:team/app:pull']
+    _, manifest_path, headers = stub.requests[2]
+    assert manifest_path == '/v2/team/app/manifests/1.0'
+    assert 'application/vnd.docker.distribution.manifest.list.v2+json' in headers['Accept']
+
+
+def test_refused_cached_token_is_renewed(registry):
+    stub = registry({'app': {'1.0': DIGEST}})
+    client = RegistryClient(timeout=5)
+    image = ImageReference(f'{stub.host}/app:1.0')
+
+    client.manifest_digest(image)
+    stub.valid_token = 'renewed-token'
+    assert client.manifest_digest(image) == DIGEST
+    assert [method for method, _, _ in stub.requests] == ['HEAD', 'GET', 'HEAD', 'HEAD', 'GET', 'HEAD']
+    _, _, headers = stub.requests[-1]
+    assert headers['Authorization'] == 'Bearer renewed-token'
+
+
+def test_token_request_carries_docker_cli_credentials(registry, tmp_path):
+    stub = registry({'app': {'latest': DIGEST}})
+    auth = base64.b64encode(b'user:secret').decode()
+    (tmp_path / 'config.json').write_text(json.dumps({'auths': {stub.host: {'auth': auth}}}))
+
+    assert RegistryClient(timeout=5).manifest_digest(ImageReference(f'{stub.host}/app')) == DIGEST
+    _, _, headers = stub.requests[1]
+    assert headers['Authorization'] == f'Basic {auth}'
+
+
+def test_unknown_tag_raises(registry):
+    stub = registry({'app': {'1.0': DIGEST}})
+
+    with pytest.raises(RegistryError, match='not found'):
+        RegistryClient(timeout=5).manifest_digest(ImageReference(f'{stub.host}/app:2.0'))
+
+
+def test_unauthorized_without_challenge_or_credentials_raises(registry):
+    stub = registry({'app': {'1.0': DIGEST}}, challenge=False)
+
+    with pytest.raises(RegistryError, match='authentication required'):
+        RegistryClient(timeout=5).manifest_digest(ImageReference(f'{stub.host}/app:1.0'))
+
+
+def test_update_checker_compares_digests_and_caches_the_registry(registry):
+    stub = registry({'app': {'1.0': DIGEST, '2.0': DIGEST}})
+    current = f'{stub.host}/app:1.0'
+    stale = f'{stub.host}/app:2.0'
+    checker = UpdateChecker(RegistryClient(timeout=5), LocalImages({
+        current: [f'{stub.host}/app@{DIGEST}'],
+        stale: [f'{stub.host}/app@sha256:' + 'd' * 64],
+    }))
+
+    results = checker.check_many([current, stale])
+    assert results[current]['status'] == UP_TO_DATE
+    assert results[stale]['status'] == OUTDATED
+    assert results[stale]['remote_digest'] == DIGEST
+    assert checker.check(f'{stub.host}/app@{DIGEST}')['status'] == PINNED
+
+    heads = stub.count('HEAD')
+    checker.check(current)
+    assert stub.count('HEAD') == heads
+    checker.check(current, refresh=True)
+    assert stub.count('HEAD') == heads + 1
+
+
+def test_unknown_local_image_is_reported_as_an_error(registry, tmp_path, monkeypatch):
+    stub = registry({'app': {'1.0': DIGEST}})
+    # Neither the Engine API nor a docker CLI can tell whether the image is present
+    monkeypatch.setenv('PATH', str(tmp_path))
+
+    class Unreachable:
+        def get_json(self, path, params=None):
+            raise DockerAPIError('Docker API connection failed')
+
+    result = UpdateChecker(RegistryClient(timeout=5), Unreachable()).check(f'{stub.host}/app:1.0')
+    assert result['status'] == ERROR
+    assert result['error'] == 'Docker API connection failed'
+
+
+def test_scanner_scans_in_the_background_and_refreshes_on_request(registry, tmp_path):
+    stub = registry({'app': {'1.0': DIGEST}})
+    image = f'{stub.host}/app:1.0'
+    compose_file = tmp_path / 'compose.yaml'
+    compose_file.write_text(f'services:\n  web:\n    image: {image}\n')
+    checker = UpdateChecker(RegistryClient(timeout=5), LocalImages({image: [f'{stub.host}/app@{DIGEST}']}))
+    scanner = UpdateScanner(checker, ComposeCache(str(compose_file)), interval=0, refresh_timeout=5)
+
+    results, scanned_at, scanning = scanner.report()
+    assert (results, scanned_at, scanning) == (None, None, True)
+
+    results, scanned_at, scanning = scanner.report(refresh=True)
+    assert [(result['service'], result['status']) for result in results] == [('web', UP_TO_DATE)]
+    assert scanned_at is not None and not scanning
+    heads = stub.count('HEAD')
+
+    # Answered from the last scan without asking the registry again
+    assert scanner.report()[0] == results
+    assert stub.count('HEAD') == heads
+    scanner.close()
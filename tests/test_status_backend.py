@@ -0,0 +1,95 @@
+"""DockerClient and StatusBackend against a fake Engine API socket and a fake docker-compose"""
+import os
+
+import pytest
+
+from backend.containers import StatusBackend, StatusError, ps_via_api, ps_via_cli
+from backend.docker_api import DockerAPIError, DockerClient
+from benchmarks.fakes import PROJECT, service_names
+
+from .conftest import FLEET
+
+
+def client_for(server):
+    return DockerClient(f'unix://{server.socket_path}', timeout=5)
+
+
+def test_list_containers_filters_by_project_and_service(fake_docker):
+    client = client_for(fake_docker())
+
+    containers = client.list_containers(PROJECT)
+    assert sorted(c['Labels']['com.docker.compose.service'] for c in containers) == service_names(FLEET)
+
+    [container] = client.list_containers(PROJECT, 'svc-0002')
+    assert container['Names'] == [f'/{PROJECT}-svc-0002-1']
+    assert client.list_containers(PROJECT, 'missing') == []
+
+
+def test_connection_is_kept_alive_between_calls(fake_docker):
+    client = client_for(fake_docker())
+
+    client.list_containers(PROJECT)
+    [connection] = client._idle
+    client.list_containers(PROJECT)
+    assert client._idle == [connection]
+
+
+def test_error_status_raises_with_the_daemon_message(fake_docker):
+    client = client_for(fake_docker())
+
+    with pytest.raises(DockerAPIError) as error:
+        client.get_json('/containers/unknown/json')
+    assert error.value.status_code == 404
+    assert str(error.value) == 'No such container'
+
+
+def test_unreachable_socket_raises(socket_dir):
+    client = DockerClient(f'unix://{os.path.join(socket_dir, "missing.sock")}', timeout=1)
+
+    with pytest.raises(DockerAPIError) as error:
+        client.list_containers(PROJECT)
+    assert error.value.status_code is None
+
+
+def test_api_and_cli_produce_the_same_payload(fake_docker, fake_compose, tmp_path):
+    fake_compose()
+    client = client_for(fake_docker())
+    compose_path = str(tmp_path / 'docker-compose.yml')
+
+    from_api = ps_via_api(client, PROJECT)
+    assert from_api == ps_via_cli(compose_path, PROJECT)
+    assert ps_via_api(client, PROJECT, 'svc-0001') == ps_via_cli(compose_path, PROJECT, 'svc-0001')
+    assert from_api[0] == {
+        'Name': f'{PROJECT}-svc-0001-1',
+        'Service': 'svc-0001',
+        'State': 'running',
+        'Status': 'Up 2 hours',
+        'Ports': [{'URL': '0.0.0.0', 'TargetPort': 80, 'PublishedPort': 20001, 'Protocol': 'tcp'}],
+    }
+
+
+def test_auto_mode_falls_back_to_the_cli_without_a_socket(fake_compose, socket_dir, tmp_path):
+    fake_compose()
+    client = DockerClient(f'unix://{os.path.join(socket_dir, "missing.sock")}', timeout=1)
+    backend = StatusBackend(client, PROJECT, 'auto')
+
+    containers = backend.list(str(tmp_path / 'docker-compose.yml'))
+    assert [c['Service'] for c in containers] == service_names(FLEET)
+
+
+def test_api_mode_does_not_fall_back(fake_compose, socket_dir, tmp_path):
+    fake_compose()
+    client = DockerClient(f'unix://{os.path.join(socket_dir, "missing.sock")}', timeout=1)
+    backend = StatusBackend(client, PROJECT, 'api')
+
+    with pytest.raises(StatusError):
+        backend.list(str(tmp_path / 'docker-compose.yml'))
+
+
+def test_cli_mode_reports_a_failing_docker_compose(fake_docker, fake_compose, tmp_path):
+    fake_compose(failure_rate=1.0)
+    backend = StatusBackend(client_for(fake_docker()), PROJECT, 'cli')
+
+    with pytest.raises(StatusError) as error:
+        backend.list(str(tmp_path / 'docker-compose.yml'))
+    assert 'injected failure for ps' in error.value.error